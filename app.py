@@ -1,18 +1,25 @@
 from flask import Flask, render_template
-from flask_migrate import Migrate
+from sqlalchemy import text
 from config import Config
 from models import db
 from sms_service import sms_service
+import metrics
+import db_pool
+import db_routing
+import http_cache
+import sql_profiler
+import traffic_capture
+import write_buffer
+import rate_limit
+import reply_coalescer
 from routes.sms_routes import sms_bp
 from routes.conductor_routes import conductor_bp
+from logging_config import configure_logging
 import logging
 import os
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (written out by a background queue listener)
+configure_logging(Config.LOG_LEVEL, Config.LOG_FORMAT, Config.LOG_LEVELS)
 logger = logging.getLogger(__name__)
 
 def create_app(config_class=Config):
@@ -24,9 +31,9 @@ def create_app(config_class=Config):
     
     # Log configuration (hide sensitive data)
     db_url = app.config['SQLALCHEMY_DATABASE_URI']
-    logger.info(f"📊 Database: {db_url[:20]}...{db_url[-20:] if len(db_url) > 40 else ''}")
-    logger.info(f"🔑 AT Username: {app.config['AT_USERNAME']}")
-    logger.info(f"🌍 Environment: {os.getenv('FLASK_ENV', 'development')}")
+    logger.info("📊 Database: %s...%s", db_url[:20], db_url[-20:] if len(db_url) > 40 else '')
+    logger.info("🔑 AT Username: %s", app.config['AT_USERNAME'])
+    logger.info("🌍 Environment: %s", os.getenv('FLASK_ENV', 'development'))
     
     # Add Content Security Policy for inline scripts
     @app.after_request
@@ -37,22 +44,53 @@ def create_app(config_class=Config):
     # Initialize extensions
     logger.info("📦 Initializing database...")
     db.init_app(app)
-    migrate = Migrate(app, db)
+    if os.getenv('FLASK_RUN_FROM_CLI') == 'true':
+        # Only the `flask db` commands need Flask-Migrate (and Alembic, which
+        # is slow to import), so web workers skip it
+        from flask_migrate import Migrate
+        Migrate(app, db)
     logger.info("✅ Database initialized")
     
-    # Initialize SMS service
-    try:
-        logger.info("📱 Initializing SMS service...")
-        with app.app_context():
-            sms_service.initialize(
-                app.config['AT_USERNAME'],
-                app.config['AT_API_KEY'],
-                app.config.get('AT_SENDER_ID')
-            )
-        logger.info("✅ SMS service initialized")
-    except Exception as e:
-        logger.error(f"❌ SMS service initialization failed: {e}")
-        logger.warning("⚠️  Continuing without SMS service...")
+    # Request, handler, provider and DB metrics at /metrics
+    metrics.init_app(app, db)
+    db_pool.init_app(app, db)
+    db_routing.init_app(app, db)
+    
+    # gzip/brotli responses, conditional GETs and fingerprinted static files
+    http_cache.init_app(app)
+    
+    # Opt-in per-request SQL profiler
+    sql_profiler.init_app(app, db)
+    if app.config.get('SQL_PROFILER_ENABLED'):
+        logger.info("🔍 SQL profiler enabled")
+    
+    # Per-number flood and duplicate protection for /sms/callback
+    rate_limit.init_app(app)
+    
+    # Opt-in batching of identical replies into multi-recipient sends
+    reply_coalescer.init_app(app, sms_service.send_logged)
+    if app.config.get('REPLY_COALESCE_ENABLED'):
+        logger.info("📦 Reply coalescing enabled: %sms window", app.config['REPLY_COALESCE_WINDOW_MS'])
+    
+    # Opt-in group commit of inbound log/response rows
+    write_buffer.init_app(app)
+    if app.config.get('WRITE_BUFFER_ENABLED'):
+        logger.info("🧺 Write buffer enabled: %s rows / %sms",
+                    app.config['WRITE_BUFFER_MAX_ROWS'], app.config['WRITE_BUFFER_MAX_DELAY_MS'])
+    
+    # Opt-in capture of inbound callbacks for replay_traffic.py
+    traffic_capture.init_app(app)
+    if app.config.get('TRAFFIC_CAPTURE_ENABLED'):
+        logger.info("📼 Capturing inbound callbacks to %s", app.config['TRAFFIC_CAPTURE_PATH'])
+    
+    # Store SMS credentials; the AfricasTalking SDK is loaded on first send
+    sms_service.initialize(
+        app.config['AT_USERNAME'],
+        app.config['AT_API_KEY'],
+        app.config.get('AT_SENDER_ID')
+    )
+    if not app.config['AT_API_KEY']:
+        logger.warning("⚠️  AT_API_KEY not set, sending SMS will fail")
     
     # Register blueprints
     logger.info("🔌 Registering blueprints...")
@@ -115,15 +153,29 @@ def create_app(config_class=Config):
         </html>
         '''
     
+    @app.route('/health/live')
+    def health_live():
+        """Liveness: the worker is up and serving requests"""
+        return {'status': 'alive'}
+    
+    @app.route('/health/ready')
+    def health_ready():
+        """Readiness: the worker can reach the database"""
+        try:
+            db.session.execute(text('SELECT 1'))
+        except Exception as e:
+            logger.error("Readiness check DB error: %s", e)
+            return {'status': 'unavailable', 'database': 'disconnected'}, 503
+        return {'status': 'ready', 'database': 'connected'}
+    
     @app.route('/health')
     def health():
         try:
             # Test database connection
-            from sqlalchemy import text
             db.session.execute(text('SELECT 1'))
             db_status = 'connected'
         except Exception as e:
-            logger.error(f"Health check DB error: {e}")
+            logger.error("Health check DB error: %s", e)
             db_status = 'disconnected'
         
         return {
@@ -137,12 +189,16 @@ def create_app(config_class=Config):
             'status': 'running',
             'service': 'Nazigi Stamford Bus SMS Service',
             'version': '1.0.0',
+            'sms_provider': 'sandbox' if sms_service.is_sandbox else 'live',
             'endpoints': {
                 'sms_callback': '/sms/callback',
                 'conductor_dashboard': '/conductor/dashboard',
                 'send_message': '/conductor/send-message',
+                'send_personalised': '/conductor/send-personalised',
+                'schedule_message': '/conductor/schedule',
                 'get_passengers': '/conductor/passengers',
-                'get_responses': '/conductor/responses'
+                'get_responses': '/conductor/responses',
+                'metrics': '/metrics'
             }
         }
     
@@ -0,0 +1,75 @@
+"""Run the benchmark suite
+
+Usage:
+    python -m benchmarks [--quick] [--output results.json]
+
+Writes one JSON document with every result, plus the git revision and
+Python version, so runs can be compared release over release. Set
+BENCH_DATABASE_URL to run against PostgreSQL instead of SQLite.
+"""
+
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+import app  # noqa: F401  (configures logging on import; silenced below)
+from logging_config import configure_logging
+from benchmarks import bench_broadcast, bench_callback, bench_dashboard, bench_startup
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Nazigi SMS benchmark suite')
+    parser.add_argument('--quick', action='store_true', help='Small sizes for a fast smoke run')
+    parser.add_argument('--output', help='Write results JSON to this file (default: stdout)')
+    args = parser.parse_args()
+
+    configure_logging('ERROR')
+    logging.getLogger('sqlalchemy').setLevel(logging.ERROR)
+
+    if args.quick:
+        callback_args = (200, 300)
+        broadcast_sizes = (1_000,)
+        dashboard_passengers = 1_000
+    else:
+        callback_args = (10_000, 5_000)
+        broadcast_sizes = bench_broadcast.DEFAULT_SIZES
+        dashboard_passengers = 10_000
+
+    results = []
+    results.append(bench_startup.run(3 if args.quick else 5))
+    print(json.dumps(results[-1]), file=sys.stderr)
+    results.append(bench_callback.run(*callback_args))
+    print(json.dumps(results[-1]), file=sys.stderr)
+    for size in broadcast_sizes:
+        results.append(bench_broadcast.run(size))
+        print(json.dumps(results[-1]), file=sys.stderr)
+    results.append(bench_dashboard.run(dashboard_passengers))
+    print(json.dumps(results[-1]), file=sys.stderr)
+
+    report = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Broadcast fan-out to 1k/10k/100k recipients
+
+Usage:
+    python -m benchmarks.bench_broadcast [recipients ...]
+"""
+
+import json
+import sys
+import time
+from sqlalchemy import event
+from benchmarks.common import make_app, seed_passengers
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+
+def run(recipients, provider_latency=0.0):
+    app, stub = make_app(provider_latency=provider_latency)
+
+    from models import db
+    from broadcast_service import broadcast_service
+
+    with app.app_context():
+        seed_passengers(recipients, responses_per_passenger=0)
+
+        queries = [0]
+
+        def count_query(*args):
+            queries[0] += 1
+
+        event.listen(db.engine, 'after_cursor_execute', count_query)
+        try:
+            start = time.perf_counter()
+            conductor_msg, _ = broadcast_service.send('Bus leaving Ngara in 5 minutes', include_stops=True)
+            elapsed = time.perf_counter() - start
+        finally:
+            event.remove(db.engine, 'after_cursor_execute', count_query)
+        status = conductor_msg.status
+
+    return {
+        'benchmark': 'broadcast',
+        'recipients': recipients,
+        'status': status,
+        'seconds': round(elapsed, 3),
+        'recipients_per_second': round(recipients / elapsed, 1),
+        'queries': queries[0],
+        'provider_calls': stub.calls,
+    }
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    for size in sizes:
+        print(json.dumps(run(size)))
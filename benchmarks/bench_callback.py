@@ -0,0 +1,52 @@
+"""Replay an inbound SMS trace against /sms/callback
+
+Usage:
+    python -m benchmarks.bench_callback [passengers] [messages]
+"""
+
+import json
+import sys
+import time
+from benchmarks.common import inbound_trace, make_app, seed_passengers, summarize
+
+
+def run(passengers=1000, messages=2000):
+    app, stub = make_app(SQL_PROFILER_ENABLED=True, SQL_PROFILER_SLOW_MS=10 ** 9)
+    with app.app_context():
+        phones = seed_passengers(passengers)
+
+    trace = inbound_trace(phones, messages)
+    client = app.test_client()
+    samples = []
+    query_counts = []
+    db_ms = []
+    errors = 0
+
+    started = time.perf_counter()
+    for payload in trace:
+        start = time.perf_counter()
+        response = client.post('/sms/callback', data={**payload, 'to': '20384'})
+        samples.append(time.perf_counter() - start)
+        query_counts.append(int(response.headers.get('X-DB-Query-Count', 0)))
+        db_ms.append(float(response.headers.get('X-DB-Time-Ms', 0)))
+        if response.status_code >= 500:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    return {
+        'benchmark': 'callback_replay',
+        'passengers': passengers,
+        'requests': len(trace),
+        'errors': errors,
+        'throughput_per_second': round(len(trace) / elapsed, 1),
+        **summarize(samples),
+        'queries_per_request': round(sum(query_counts) / len(query_counts), 2),
+        'max_queries_per_request': max(query_counts),
+        'db_ms_per_request': round(sum(db_ms) / len(db_ms), 3),
+        'provider_calls': stub.calls,
+    }
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    print(json.dumps(run(*args)))
@@ -0,0 +1,107 @@
+"""Callback throughput per Gunicorn mode (sync, gthread, gevent)
+
+Usage:
+    python -m benchmarks.bench_gunicorn [--requests N] [--concurrency N]
+        [--provider-latency SECONDS] [--modes sync,gthread,gevent]
+
+Starts Gunicorn with gunicorn.conf.py and the stub provider
+(benchmarks/stub_wsgi.py) for each mode. It replays the same inbound trace
+at a fixed concurrency and prints one JSON line per mode. Set
+BENCH_DATABASE_URL to run against PostgreSQL; SQLite serialises writers
+across workers, so absolute numbers there are pessimistic.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import app  # noqa: F401  (configures logging on import; silenced in main)
+from logging_config import configure_logging
+from benchmarks.common import inbound_trace, make_app, seed_passengers
+from replay_traffic import replay
+
+MODES = ('sync', 'gthread', 'gevent')
+
+
+def wait_until_ready(base_url, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(base_url + '/health/live', timeout=1):
+                return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not become ready")
+
+
+def run_mode(mode, records, env, port, concurrency):
+    env = {**env, 'GUNICORN_MODE': mode, 'PORT': str(port)}
+    base_url = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'benchmarks.stub_wsgi:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_ready(base_url, proc)
+        boot_seconds = time.perf_counter() - started
+        result = replay(records, base_url, speed=0, workers=concurrency)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    return {'benchmark': 'gunicorn', 'mode': mode, 'boot_seconds': round(boot_seconds, 2), **result}
+
+
+def run(requests=1000, concurrency=50, provider_latency=0.1, modes=MODES, port=5055):
+    database_url = os.getenv('BENCH_DATABASE_URL') or 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(prefix='nazigi-bench-'), 'bench.db'
+    )
+    app, _ = make_app(SQLALCHEMY_DATABASE_URI=database_url)
+    with app.app_context():
+        phones = seed_passengers(2000)
+
+    records = [
+        {'ts': 0, 'path': '/sms/callback', 'data': {**message, 'to': '20384'}}
+        for message in inbound_trace(phones, requests)
+    ][:requests]
+
+    env = {
+        **os.environ,
+        'BENCH_DATABASE_URL': database_url,
+        'BENCH_PROVIDER_LATENCY': str(provider_latency),
+        'LOG_LEVEL': 'WARNING',
+    }
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+    results = []
+    for mode in modes:
+        results.append({
+            'provider_latency_ms': provider_latency * 1000,
+            'concurrency': concurrency,
+            **run_mode(mode, records, env, port, concurrency)
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Gunicorn modes against the stub provider')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--provider-latency', type=float, default=0.1)
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args()
+
+    configure_logging('ERROR')
+    for result in run(args.requests, args.concurrency, args.provider_latency, args.modes.split(',')):
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Callback latency with logging on vs off
+
+Usage:
+    python -m benchmarks.bench_logging [requests_per_mode]
+
+Prints one JSON line per logging mode.
+"""
+
+import json
+import os
+import sys
+import time
+import app  # noqa: F401  (configures logging on import; reconfigured below)
+from logging_config import configure_logging, stop_logging
+from benchmarks.common import make_app, summarize
+
+MODES = [
+    ('off', 'CRITICAL', 'text'),
+    ('warning', 'WARNING', 'text'),
+    ('info-text', 'INFO', 'text'),
+    ('info-json', 'INFO', 'json'),
+    ('debug-text', 'DEBUG', 'text'),
+]
+
+
+def run_mode(client, requests, offset):
+    samples = []
+    for i in range(requests):
+        phone = f'+2547{offset + i:08d}'
+        start = time.perf_counter()
+        client.post('/sms/callback', data={'from': phone, 'text': 'test2', 'to': '20384'})
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    devnull = open(os.devnull, 'w')
+
+    configure_logging('CRITICAL', stream=devnull)
+    app, _ = make_app()
+    client = app.test_client()
+
+    # Warm up caches and the connection pool
+    run_mode(client, 50, 0)
+
+    for offset, (name, level, fmt) in enumerate(MODES, 1):
+        configure_logging(level, fmt, stream=devnull)
+        samples = run_mode(client, requests, offset * 1_000_000)
+        print(json.dumps({'benchmark': 'callback_logging', 'mode': name, **summarize(samples)}))
+
+    stop_logging()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Worker startup cost: import time and create_app() time
+
+Usage:
+    python -m benchmarks.bench_startup [--runs N] [--check]
+
+Each run is a fresh interpreter, like a new Gunicorn worker. With --check
+the script exits non-zero if the median import + create_app time goes
+over STARTUP_BUDGET_MS (default 1000), or if a module that should only load
+on demand (the AfricasTalking SDK, Alembic) was imported during startup.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', '1000'))
+
+# Loaded on first send / by the flask CLI only
+LAZY_MODULES = ('africastalking', 'alembic', 'flask_migrate')
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'lazy_loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_once():
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'bench_startup.db'))
+    env['LOG_LEVEL'] = 'ERROR'
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    output = subprocess.check_output([sys.executable, '-c', PROBE], env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(runs=5):
+    samples = [measure_once() for _ in range(runs)]
+    import_ms = statistics.median(s['import_ms'] for s in samples)
+    create_ms = statistics.median(s['create_app_ms'] for s in samples)
+    return {
+        'benchmark': 'startup',
+        'runs': runs,
+        'import_ms': round(import_ms, 1),
+        'create_app_ms': round(create_ms, 1),
+        'total_ms': round(import_ms + create_ms, 1),
+        'budget_ms': BUDGET_MS,
+        'lazy_loaded': sorted({m for s in samples for m in s['lazy_loaded']}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure worker startup time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--check', action='store_true', help='Fail if over budget or lazy modules loaded')
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    print(json.dumps(result))
+
+    if args.check:
+        if result['total_ms'] > BUDGET_MS:
+            print(f"❌ Startup took {result['total_ms']}ms, budget is {BUDGET_MS}ms", file=sys.stderr)
+            sys.exit(1)
+        if result['lazy_loaded']:
+            print(f"❌ Loaded during startup: {', '.join(result['lazy_loaded'])}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Shared helpers for benchmarks
+
+Benchmarks run against a throwaway database (SQLite by default, or
+BENCH_DATABASE_URL) with the AfricasTalking SDK replaced by a stub, so no
+SMS is ever sent and provider latency is controlled.
+"""
+
+import os
+import statistics
+import tempfile
+import time
+from config import Config
+
+
+class StubSMS:
+    """Stand-in for africastalking.SMS that records calls"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.recipients = 0
+
+    def send(self, message, recipients, sender_id=None):
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls += 1
+        self.recipients += len(recipients)
+        return {
+            'SMSMessageData': {
+                'Message': f'Sent to {len(recipients)}/{len(recipients)}',
+                'Recipients': [
+                    {'number': number, 'status': 'Success', 'statusCode': 101, 'cost': 'KES 0.8000'}
+                    for number in recipients
+                ]
+            }
+        }
+
+
+def bench_config(**overrides):
+    """Config class pointing at a fresh benchmark database"""
+    database_url = os.getenv('BENCH_DATABASE_URL') or 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(prefix='nazigi-bench-'), 'bench.db'
+    )
+
+    attrs = {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'AT_API_KEY': 'bench',
+    }
+    if database_url.startswith('sqlite'):
+        attrs['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+    attrs.update(overrides)
+    return type('BenchConfig', (Config,), attrs)
+
+
+def make_app(provider_latency=0.0, **overrides):
+    """Create an app with an empty schema and a stub provider"""
+    from app import create_app
+    from models import db
+    from sms_service import sms_service
+
+    app = create_app(bench_config(**overrides))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    stub = StubSMS(provider_latency)
+    sms_service.sms = stub
+    return app, stub
+
+
+def summarize(samples):
+    """Latency summary in milliseconds"""
+    ordered = sorted(samples)
+    count = len(ordered)
+    return {
+        'count': count,
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(ordered[int(count * 0.50)] * 1000, 3),
+        'p99_ms': round(ordered[min(int(count * 0.99), count - 1)] * 1000, 3),
+    }
+
+
+def seed_passengers(count, responses_per_passenger=1, opted_in_ratio=1.0, batch_size=5000):
+    """
+    Bulk-insert passengers and responses for the default tenant (must run in an app context)
+
+    Returns:
+        List of the seeded phone numbers
+    """
+    from datetime import datetime, timedelta
+    from models import db, Passenger, PassengerResponse
+    import tenancy
+
+    tenant_id = tenancy.current().id
+    stops = Config.BUS_STOPS
+    now = datetime.utcnow()
+    opted_in_cutoff = int(count * opted_in_ratio)
+    phones = [f'+2547{i:08d}' for i in range(count)]
+
+    for start in range(0, count, batch_size):
+        db.session.bulk_insert_mappings(Passenger, [
+            {'tenant_id': tenant_id, 'phone_number': phones[i], 'opted_in': i < opted_in_cutoff,
+             'created_at': now, 'updated_at': now}
+            for i in range(start, min(start + batch_size, count))
+        ])
+    db.session.commit()
+
+    if responses_per_passenger:
+        ids = [pid for (pid,) in db.session.query(Passenger.id).order_by(Passenger.id)]
+        rows = []
+        for n, pid in enumerate(ids):
+            for r in range(responses_per_passenger):
+                stop_number = (n + r) % len(stops) + 1
+                rows.append({
+                    'tenant_id': tenant_id,
+                    'passenger_id': pid,
+                    'response_text': str(stop_number),
+                    'selected_stop': stops[stop_number - 1],
+                    'responded_at': now - timedelta(hours=r)
+                })
+            if len(rows) >= batch_size:
+                db.session.bulk_insert_mappings(PassengerResponse, rows)
+                rows = []
+        if rows:
+            db.session.bulk_insert_mappings(PassengerResponse, rows)
+        db.session.commit()
+
+    return phones
+
+
+def inbound_trace(phones, count, seed=42):
+    """
+    Build a realistic inbound SMS trace
+
+    Mostly stop selections by number or name from existing riders, with
+    some opt-ins from new numbers, opt-outs and unrecognised text.
+    """
+    import random
+
+    rng = random.Random(seed)
+    stops = Config.BUS_STOPS
+    trace = []
+    next_new = len(phones)
+
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.55:
+            trace.append({'from': rng.choice(phones), 'text': str(rng.randint(1, len(stops)))})
+        elif roll < 0.75:
+            trace.append({'from': rng.choice(phones), 'text': rng.choice(stops).lower()})
+        elif roll < 0.85:
+            phone = f'+2547{next_new:08d}'
+            next_new += 1
+            trace.append({'from': phone, 'text': 'TEST2'})
+            trace.append({'from': phone, 'text': '1'})
+        elif roll < 0.90:
+            trace.append({'from': rng.choice(phones), 'text': str(rng.randint(11, 99))})
+        elif roll < 0.95:
+            trace.append({'from': rng.choice(phones), 'text': 'where is the bus'})
+        else:
+            trace.append({'from': rng.choice(phones), 'text': 'STOP'})
+
+    return trace
@@ -0,0 +1,15 @@
+"""WSGI entry point with the stub provider, for benchmarking under Gunicorn
+
+    BENCH_DATABASE_URL=... BENCH_PROVIDER_LATENCY=0.1 \\
+        gunicorn --config gunicorn.conf.py benchmarks.stub_wsgi:app
+
+The schema must already exist (bench_gunicorn.py creates and seeds it).
+"""
+
+import os
+from app import create_app
+from sms_service import sms_service
+from benchmarks.common import StubSMS, bench_config
+
+app = create_app(bench_config())
+sms_service.sms = StubSMS(float(os.getenv('BENCH_PROVIDER_LATENCY', '0.1')))
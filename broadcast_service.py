@@ -0,0 +1,396 @@
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update
+from models import db, Passenger, ConductorMessage, BroadcastChunk
+from sms_service import sms_service
+import phone_numbers
+from suppression import suppression_list
+import tenancy
+
+
+class BroadcastService:
+    """Service for sending conductor broadcasts to a tenant's opted-in passengers"""
+
+    def get_recipients(self):
+        """Phone numbers of all of the current tenant's opted-in passengers"""
+        rows = db.session.query(Passenger.phone_number).filter_by(
+            tenant_id=tenancy.current().id, opted_in=True
+        ).all()
+        return [phone for (phone,) in rows]
+
+    def format_message(self, message_text, include_stops=True):
+        """Build the final broadcast text with the current tenant's stop list"""
+        if include_stops:
+            return tenancy.render('broadcast', message=message_text)
+        return message_text
+
+    def send(self, message_text, include_stops=True, recipients=None, spread_seconds=0, heartbeat=None,
+             on_record=None):
+        """
+        Send a broadcast in chunks and record it as a conductor message
+        of the current tenant
+
+        The message and all of its chunks are committed before the first
+        provider call, and each chunk's status is committed as it goes, so
+        a broadcast interrupted part-way can be resumed with resume().
+
+        Args:
+            message_text: Conductor's message text
+            include_stops: Append the numbered stop list
+            recipients: Phone numbers to send to (defaults to all opted-in);
+                invalid, duplicate and suppressed numbers are dropped
+            spread_seconds: Spread the chunks evenly over this many seconds
+            heartbeat: Called in the transaction of every progress commit
+                (the scheduler renews its job lease with it)
+            on_record: Called with the new ConductorMessage in the
+                transaction that records it (the scheduler links its job)
+
+        Returns:
+            Tuple of (ConductorMessage, combined AfricasTalking response),
+            or (None, None) when there are no recipients
+        """
+        if recipients is None:
+            recipients = self.get_recipients()
+
+        batch = phone_numbers.normalize_many(recipients)
+        if batch.invalid or batch.duplicates:
+            current_app.logger.warning(
+                f"⚠️ Broadcast dropped {len(batch.invalid)} invalid and {batch.duplicates} duplicate recipient(s)"
+            )
+        recipients, suppressed = suppression_list.filter(batch.valid)
+        if suppressed:
+            current_app.logger.info(f"🚫 Broadcast skipped {len(suppressed)} suppressed recipient(s)")
+
+        if not recipients:
+            return None, None
+
+        chunks = [(chunk, None) for chunk in self._split(recipients)]
+        conductor_msg = self._record(message_text, self.format_message(message_text, include_stops), chunks,
+                                     on_record)
+
+        response = self._send_chunks(conductor_msg, ['pending'], spread_seconds, heartbeat=heartbeat)
+        return conductor_msg, response
+
+    def send_personalised(self, message_text, groups):
+        """
+        Send a personalised broadcast and record it as a conductor message
+        of the current tenant
+
+        Each group's recipients are chunked like any broadcast, and every
+        chunk carries its group's text. The message and its chunks are
+        committed before the first provider call, and a failed call only
+        fails its own chunk, which is recorded with its recipients and can
+        be retried with resume(retry_failed=True).
+
+        Args:
+            message_text: Template text, as entered by the conductor
+            groups: Dict of {text: [phone_number, ...]} from
+                sms_service.render_personalised()
+
+        Returns:
+            Tuple of (ConductorMessage, combined AfricasTalking response),
+            or (None, None) when there are no recipients
+        """
+        chunks = []
+        for text, recipients in groups.items():
+            recipients, _ = suppression_list.filter(recipients)
+            chunks.extend((chunk, text) for chunk in self._split(recipients))
+
+        if not chunks:
+            return None, None
+
+        conductor_msg = self._record(message_text, None, chunks)
+        response = self._send_chunks(conductor_msg, ['pending'])
+        return conductor_msg, response
+
+    def failed_recipients(self, conductor_msg):
+        """Recipients of a broadcast's failed chunks, with the error"""
+        return [
+            {'number': phone, 'error': chunk.error}
+            for chunk in BroadcastChunk.query.filter_by(message_id=conductor_msg.id, status='failed')
+            .order_by(BroadcastChunk.chunk_index)
+            for phone in chunk.recipients
+        ]
+
+    def _split(self, recipients):
+        chunk_size = current_app.config.get('BROADCAST_CHUNK_SIZE', 1000)
+        return [recipients[i:i + chunk_size] for i in range(0, len(recipients), chunk_size)]
+
+    def _record(self, message_text, body, chunks, on_record=None):
+        """Commit a 'sending' conductor message and its pending (recipients, body) chunks"""
+        conductor_msg = ConductorMessage(
+            tenant_id=tenancy.current().id,
+            message_text=message_text,
+            recipients_count=sum(len(recipients) for recipients, _ in chunks),
+            status='sending',
+            body=body,
+            chunks_total=len(chunks),
+            chunks_done=0,
+            last_progress_at=datetime.utcnow()
+        )
+        db.session.add(conductor_msg)
+        db.session.flush()
+
+        db.session.bulk_insert_mappings(BroadcastChunk, [{
+            'message_id': conductor_msg.id,
+            'chunk_index': idx,
+            'recipients': recipients,
+            'recipients_count': len(recipients),
+            'body': chunk_body,
+            'status': 'pending',
+            'attempts': 0
+        } for idx, (recipients, chunk_body) in enumerate(chunks)])
+        if on_record:
+            on_record(conductor_msg)
+        db.session.commit()
+        return conductor_msg
+
+    def resume(self, message_id, retry_failed=False, retry_in_flight=False):
+        """
+        Continue an interrupted broadcast from its first unsent chunk
+
+        Chunks marked 'sending' were handed to the provider when the worker
+        died, so they may or may not have been delivered. They are left
+        alone unless retry_in_flight is set, to avoid double sends.
+
+        Returns:
+            Tuple of (ConductorMessage, combined AfricasTalking response),
+            or (None, None) if the broadcast does not exist
+        """
+        conductor_msg = db.session.get(ConductorMessage, message_id)
+        if not conductor_msg:
+            return None, None
+
+        statuses = ['pending']
+        if retry_failed:
+            statuses.append('failed')
+        if retry_in_flight:
+            statuses.append('sending')
+
+        conductor_msg.status = 'sending'
+        conductor_msg.last_progress_at = datetime.utcnow()
+        db.session.commit()
+
+        # Resumed by the scheduler too, so log and send as the broadcast's tenant
+        with tenancy.use(conductor_msg.tenant_id):
+            response = self._send_chunks(conductor_msg, statuses, settle_in_flight=not retry_in_flight)
+        return conductor_msg, response
+
+    def is_stale(self, conductor_msg):
+        """Whether a 'sending' broadcast has stopped making progress"""
+        if conductor_msg.status != 'sending':
+            return False
+        stale_after = timedelta(seconds=current_app.config.get('BROADCAST_STALE_SECONDS', 180))
+        return (conductor_msg.last_progress_at or conductor_msg.sent_at) < datetime.utcnow() - stale_after
+
+    def claim_stale(self, limit=5):
+        """
+        Claim interrupted broadcasts for resuming
+
+        Uses SKIP LOCKED and bumps last_progress_at, so only one worker
+        picks up each broadcast.
+        """
+        stale_after = timedelta(seconds=current_app.config.get('BROADCAST_STALE_SECONDS', 180))
+        now = datetime.utcnow()
+
+        messages = ConductorMessage.query.filter(
+            ConductorMessage.status == 'sending',
+            ConductorMessage.last_progress_at < now - stale_after,
+            ConductorMessage.tenant_id.in_(tenancy.tenant_directory.active_ids())
+        ).limit(limit).with_for_update(skip_locked=True).all()
+
+        for conductor_msg in messages:
+            conductor_msg.last_progress_at = now
+
+        db.session.commit()
+        return messages
+
+    def claim(self, message_id):
+        """
+        Claim one broadcast for resuming by hand
+
+        Locks it the way claim_stale does and bumps last_progress_at, so a
+        scheduler worker (or another request) can't resume it too.
+
+        Returns:
+            The ConductorMessage, or None if another worker holds it or it
+            is still making progress
+        """
+        conductor_msg = ConductorMessage.query.filter_by(id=message_id).with_for_update(skip_locked=True).first()
+        if conductor_msg is None or (conductor_msg.status == 'sending' and not self.is_stale(conductor_msg)):
+            db.session.rollback()
+            return None
+
+        conductor_msg.status = 'sending'
+        conductor_msg.last_progress_at = datetime.utcnow()
+        db.session.commit()
+        return conductor_msg
+
+    def _send_chunks(self, conductor_msg, statuses, spread_seconds=0, settle_in_flight=False, heartbeat=None):
+        """Send every chunk in the given statuses, committing progress per chunk"""
+        chunks = BroadcastChunk.query.filter(
+            BroadcastChunk.message_id == conductor_msg.id,
+            BroadcastChunk.status.in_(statuses)
+        ).order_by(BroadcastChunk.chunk_index).all()
+
+        # Load smoothing: pace chunks evenly across the window
+        delay = spread_seconds / (len(chunks) - 1) if spread_seconds and len(chunks) > 1 else 0
+
+        responses = []
+        for idx, chunk in enumerate(chunks):
+            if idx and delay:
+                self._wait(conductor_msg, delay, heartbeat)
+
+            # Mark in flight first: if the worker dies during the provider
+            # call we know this chunk's outcome is unknown. Conditional on
+            # the status and attempts we loaded, so a chunk another worker
+            # has claimed since (e.g. through resume) is never sent twice.
+            claimed = db.session.execute(
+                update(BroadcastChunk).where(
+                    BroadcastChunk.id == chunk.id,
+                    BroadcastChunk.status.in_(statuses),
+                    BroadcastChunk.attempts == chunk.attempts
+                ).values(status='sending', attempts=BroadcastChunk.attempts + 1)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+            if not claimed:
+                current_app.logger.warning(
+                    f"⚠️ Broadcast {conductor_msg.id} chunk {chunk.chunk_index} was claimed elsewhere, skipping"
+                )
+                continue
+
+            try:
+                responses.append(sms_service.send_bulk_sms(chunk.recipients, chunk.body or conductor_msg.body))
+                chunk.status = 'sent'
+                chunk.sent_at = datetime.utcnow()
+                chunk.error = None
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(
+                    f"❌ Broadcast {conductor_msg.id} chunk {chunk.chunk_index} failed: {str(e)}"
+                )
+                chunk.status = 'failed'
+                chunk.error = str(e)
+
+            conductor_msg.chunks_done = BroadcastChunk.query.filter_by(
+                message_id=conductor_msg.id, status='sent'
+            ).count()
+            conductor_msg.last_progress_at = datetime.utcnow()
+            if heartbeat:
+                heartbeat()
+            db.session.commit()
+
+        self._finish(conductor_msg, settle_in_flight)
+
+        if len(responses) == 1:
+            return responses[0]
+
+        all_recipients = []
+        for response in responses:
+            all_recipients.extend(response.get('SMSMessageData', {}).get('Recipients', []))
+
+        return {
+            'SMSMessageData': {
+                'Message': f'Sent to {len(all_recipients)}/{conductor_msg.recipients_count} '
+                           f'in {len(responses)} chunks',
+                'Recipients': all_recipients
+            }
+        }
+
+    def _wait(self, conductor_msg, seconds, heartbeat=None):
+        """
+        Sleep between spread chunks, bumping last_progress_at as it goes
+
+        Without the heartbeat a gap longer than BROADCAST_STALE_SECONDS
+        would look like a dead worker and the broadcast would be resumed
+        elsewhere while this worker is still sending it.
+        """
+        interval = max(current_app.config.get('BROADCAST_STALE_SECONDS', 180) / 3, 1)
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, interval))
+            conductor_msg.last_progress_at = datetime.utcnow()
+            if heartbeat:
+                heartbeat()
+            db.session.commit()
+
+    def _finish(self, conductor_msg, settle_in_flight=False):
+        """
+        Set the final broadcast status from its chunk statuses
+
+        With settle_in_flight, chunks left 'sending' by a dead worker count
+        as unconfirmed and the broadcast is closed as 'partial'; they can
+        still be retried later with resume(retry_in_flight=True).
+        """
+        counts = dict(db.session.query(
+            BroadcastChunk.status, db.func.count(BroadcastChunk.id)
+        ).filter_by(message_id=conductor_msg.id).group_by(BroadcastChunk.status).all())
+
+        if counts.get('pending') or (counts.get('sending') and not settle_in_flight):
+            return
+
+        if not counts.get('failed') and not counts.get('sending'):
+            conductor_msg.status = 'sent'
+        elif counts.get('sent'):
+            conductor_msg.status = 'partial'
+        else:
+            conductor_msg.status = 'failed'
+
+        conductor_msg.completed_at = datetime.utcnow()
+        db.session.commit()
+
+    def progress(self, conductor_msg):
+        """
+        Report delivery progress of a broadcast
+
+        Returns:
+            Dict with chunk and recipient counts, throughput and ETA
+        """
+        rows = db.session.query(
+            BroadcastChunk.status,
+            db.func.count(BroadcastChunk.id),
+            db.func.coalesce(db.func.sum(BroadcastChunk.recipients_count), 0)
+        ).filter_by(message_id=conductor_msg.id).group_by(BroadcastChunk.status).all()
+
+        chunks = {status: 0 for status in ('pending', 'sending', 'sent', 'failed')}
+        recipients = dict(chunks)
+        for status, chunk_count, recipient_count in rows:
+            chunks[status] = chunk_count
+            recipients[status] = int(recipient_count)
+
+        end = conductor_msg.completed_at or conductor_msg.last_progress_at or conductor_msg.sent_at
+        elapsed = max((end - conductor_msg.sent_at).total_seconds(), 0)
+        throughput = recipients['sent'] / elapsed if elapsed else None
+        remaining = recipients['pending'] + recipients['sending']
+
+        if not remaining:
+            eta_seconds = 0
+        elif throughput:
+            eta_seconds = round(remaining / throughput, 1)
+        else:
+            eta_seconds = None
+
+        return {
+            'message_id': conductor_msg.id,
+            'status': conductor_msg.status,
+            'stale': self.is_stale(conductor_msg),
+            'cursor': conductor_msg.chunks_done,
+            'chunks_total': conductor_msg.chunks_total,
+            'chunks': chunks,
+            'recipients_total': conductor_msg.recipients_count,
+            'recipients': recipients,
+            'started_at': conductor_msg.sent_at.isoformat(),
+            'last_progress_at': conductor_msg.last_progress_at.isoformat() if conductor_msg.last_progress_at else None,
+            'completed_at': conductor_msg.completed_at.isoformat() if conductor_msg.completed_at else None,
+            'elapsed_seconds': round(elapsed, 1),
+            'throughput_per_second': round(throughput, 1) if throughput else None,
+            'eta_seconds': eta_seconds
+        }
+
+# Global broadcast service instance
+broadcast_service = BroadcastService()
@@ -0,0 +1,228 @@
+"""Conductor authentication
+
+Conductors log in once (POST /conductor/login with Basic auth or JSON
+credentials) and get a signed session token, valid for
+CONDUCTOR_SESSION_SECONDS, to send as "Authorization: Bearer <token>".
+Passwords are stored as werkzeug (scrypt) hashes, which take a tenth of a
+second or more to check on purpose. That cost is paid at login, not on
+every API call. Failed password checks are counted per username and per
+client address (see rate_limit.py); past the limit verify_credentials
+raises LoginThrottled instead of checking another password.
+
+Verified tokens are cached per worker for CONDUCTOR_AUTH_CACHE_SECONDS,
+so a call costs one HMAC and a dict lookup. When the entry expires the
+token is checked again against the database. So disabling a conductor or
+logging out (which bumps their session_version) takes effect within that
+time on every worker. Basic auth still works for scripts and is cached the
+same way, keyed by an HMAC of the credentials rather than the credentials
+themselves.
+
+Until the first Conductor account is created (manage_conductors.py), the
+CONDUCTOR_USERNAME / CONDUCTOR_PASSWORD from the config are accepted, so
+existing deployments keep working.
+
+A conductor tied to a tenant (Conductor.tenant_id) only ever acts for that
+tenant; the others pick one per request (see tenancy.py).
+"""
+
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from datetime import datetime
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.security import check_password_hash, generate_password_hash
+from models import db, Conductor
+import rate_limit
+
+TOKEN_SALT = 'conductor-session'
+
+Principal = namedtuple('Principal', ['id', 'username', 'session_version', 'tenant_id'])
+
+
+class LoginThrottled(Exception):
+    """Raised when too many logins failed for a username or address"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many failed logins, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AuthCache:
+    """Small LRU of verified credentials/tokens with per-entry expiry"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            principal, expires = entry
+            if expires <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return principal
+
+    def set(self, key, principal, expires):
+        with self._lock:
+            self._entries[key] = (principal, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = AuthCache()
+
+
+@lru_cache(maxsize=1)
+def _dummy_hash():
+    # Checked when the username doesn't exist, so unknown and known
+    # usernames take the same time to reject
+    return generate_password_hash('not-a-password')
+
+
+def hash_password(password):
+    """Hash a password for Conductor.password_hash"""
+    return generate_password_hash(password)
+
+
+def _cache_key(kind, value):
+    secret = current_app.config['SECRET_KEY'].encode()
+    return kind + hmac.new(secret, value.encode(), hashlib.sha256).digest()
+
+
+def _cache_seconds():
+    return current_app.config.get('CONDUCTOR_AUTH_CACHE_SECONDS', 60)
+
+
+def _has_accounts():
+    return db.session.query(Conductor.id).first() is not None
+
+
+def _check_credentials(username, password):
+    """Verify credentials against the database (one password hash check)"""
+    conductor = Conductor.query.filter_by(username=username).first()
+    if conductor is None:
+        check_password_hash(_dummy_hash(), password)
+        if _has_accounts():
+            return None
+        # No accounts yet: fall back to the configured login
+        expected_user = current_app.config['CONDUCTOR_USERNAME'].encode()
+        expected_password = current_app.config['CONDUCTOR_PASSWORD'].encode()
+        if (hmac.compare_digest(username.encode(), expected_user)
+                and hmac.compare_digest(password.encode(), expected_password)):
+            return Principal(None, username, 0, None)
+        return None
+
+    if not conductor.active or not check_password_hash(conductor.password_hash, password):
+        return None
+    return Principal(conductor.id, conductor.username, conductor.session_version, conductor.tenant_id)
+
+
+def _still_valid(principal):
+    """Whether a token's conductor is still active, not logged out and with the same tenant"""
+    if principal.id is None:
+        return not _has_accounts()
+    conductor = db.session.get(Conductor, principal.id)
+    return (conductor is not None and conductor.active
+            and conductor.session_version == principal.session_version
+            and conductor.tenant_id == principal.tenant_id)
+
+
+def verify_credentials(username, password, address=None):
+    """
+    Principal for a username and password, or None
+
+    Credentials already verified (cached) are accepted even while the
+    username is throttled, so a logged-in conductor isn't locked out by
+    someone guessing their password.
+
+    Raises:
+        LoginThrottled: too many failed logins for username or address
+    """
+    if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
+        return None
+
+    now = time.monotonic()
+    key = _cache_key(b'basic:', f'{username}\0{password}')
+    principal = _cache.get(key, now)
+    if principal is not None:
+        return principal
+
+    limiter = rate_limit.get_limiter()
+    if limiter is not None and not limiter.allow_login(username, address):
+        raise LoginThrottled(limiter.login_window)
+
+    principal = _check_credentials(username, password)
+    if principal is not None:
+        _cache.set(key, principal, now + _cache_seconds())
+    elif limiter is not None:
+        limiter.login_failed(username, address)
+    return principal
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=TOKEN_SALT)
+
+
+def issue_token(principal):
+    """Signed session token for a principal"""
+    if principal.id is not None:
+        Conductor.query.filter_by(id=principal.id).update(
+            {'last_login_at': datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+    return _serializer().dumps(list(principal))
+
+
+def verify_token(token):
+    """Principal for a session token, or None if it is invalid, expired or revoked"""
+    if not token:
+        return None
+
+    now = time.monotonic()
+    key = _cache_key(b'token:', token)
+    principal = _cache.get(key, now)
+    if principal is not None:
+        return principal
+
+    max_age = current_app.config.get('CONDUCTOR_SESSION_SECONDS', 28800)
+    try:
+        # itsdangerous compares signatures in constant time
+        payload, issued = _serializer().loads(token, max_age=max_age, return_timestamp=True)
+        principal = Principal(*payload)
+    except (BadSignature, TypeError, ValueError):
+        return None
+
+    if not _still_valid(principal):
+        return None
+
+    # Never cache a token past its own expiry
+    remaining = max_age - (time.time() - issued.timestamp())
+    _cache.set(key, principal, now + min(_cache_seconds(), remaining))
+    return principal
+
+
+def revoke_sessions(conductor_id):
+    """
+    Invalidate every token issued to a conductor (not committed)
+
+    Takes effect at once in this worker and within
+    CONDUCTOR_AUTH_CACHE_SECONDS in the others.
+    """
+    Conductor.query.filter_by(id=conductor_id).update(
+        {'session_version': Conductor.session_version + 1}, synchronize_session=False
+    )
+    _cache.clear()
@@ -1,5 +1,6 @@
 import os
 from dotenv import load_dotenv
+from db_pool import engine_options
 
 load_dotenv()
 
@@ -18,12 +19,60 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = database_url
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_pre_ping': True,  # Verify connections before using
-        'pool_recycle': 300,     # Recycle connections after 5 minutes
-        'pool_size': 10,         # Number of connections to maintain
-        'max_overflow': 20,      # Max connections above pool_size
-    }
+    # Pool sized from worker concurrency; DB_POOL_SIZE, DB_POOL_OVERFLOW,
+    # DB_MAX_CONNECTIONS and DB_PGBOUNCER override it (see db_pool.py)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(database_url)
+    DB_PING_IDLE_SECONDS = int(os.getenv('DB_PING_IDLE_SECONDS', '30'))  # Ping connections idle longer than this
+    
+    # Optional read replica for conductor dashboards (see db_routing.py)
+    replica_url = os.getenv('REPLICA_DATABASE_URL')
+    if replica_url and replica_url.startswith('postgres://'):
+        replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+    SQLALCHEMY_BINDS = {'replica': {'url': replica_url, **engine_options(replica_url)}} if replica_url else {}
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '5'))  # Staler than this = read primary
+    REPLICA_CHECK_SECONDS = int(os.getenv('REPLICA_CHECK_SECONDS', '5'))
+    REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', '30'))     # Recheck interval while it is down
+    
+    # Per-number limits on inbound SMS (see rate_limit.py)
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_MESSAGES = int(os.getenv('RATE_LIMIT_MESSAGES', '10'))             # Texts per number per window
+    RATE_LIMIT_WINDOW_SECONDS = int(os.getenv('RATE_LIMIT_WINDOW_SECONDS', '60'))
+    RATE_LIMIT_DUPLICATE_SECONDS = int(os.getenv('RATE_LIMIT_DUPLICATE_SECONDS', '5'))  # Same text again = duplicate
+    RATE_LIMIT_ERROR_REPLY_SECONDS = int(os.getenv('RATE_LIMIT_ERROR_REPLY_SECONDS', '60'))  # Same error reply once per window
+    RATE_LIMIT_LOGIN_FAILURES = int(os.getenv('RATE_LIMIT_LOGIN_FAILURES', '5'))        # Failed logins per username...
+    RATE_LIMIT_LOGIN_IP_FAILURES = int(os.getenv('RATE_LIMIT_LOGIN_IP_FAILURES', '20'))  # ...or per address...
+    RATE_LIMIT_LOGIN_WINDOW_SECONDS = int(os.getenv('RATE_LIMIT_LOGIN_WINDOW_SECONDS', '900'))  # ...per window
+    RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL')  # Share limits across workers (needs redis)
+    
+    # Do-not-contact list checked before every send (see suppression.py)
+    SUPPRESSION_BLOOM_CAPACITY = int(os.getenv('SUPPRESSION_BLOOM_CAPACITY', '1000000'))  # Grows when exceeded
+    SUPPRESSION_BLOOM_ERROR_RATE = float(os.getenv('SUPPRESSION_BLOOM_ERROR_RATE', '0.001'))
+    SUPPRESSION_REFRESH_SECONDS = int(os.getenv('SUPPRESSION_REFRESH_SECONDS', '10'))  # Pick up other workers' additions
+    
+    # Optional micro-batching of identical replies (see reply_coalescer.py)
+    REPLY_COALESCE_ENABLED = os.getenv('REPLY_COALESCE_ENABLED', 'false').lower() == 'true'
+    REPLY_COALESCE_WINDOW_MS = float(os.getenv('REPLY_COALESCE_WINDOW_MS', '200'))  # Longest a reply is held
+    REPLY_COALESCE_MAX_RECIPIENTS = int(os.getenv('REPLY_COALESCE_MAX_RECIPIENTS', '1000'))  # Per provider call
+    
+    # Optional group-commit buffer for inbound log/response rows (see write_buffer.py)
+    WRITE_BUFFER_ENABLED = os.getenv('WRITE_BUFFER_ENABLED', 'false').lower() == 'true'
+    WRITE_BUFFER_MAX_ROWS = int(os.getenv('WRITE_BUFFER_MAX_ROWS', '500'))       # Flush once this many rows are queued
+    WRITE_BUFFER_MAX_DELAY_MS = float(os.getenv('WRITE_BUFFER_MAX_DELAY_MS', '5'))  # ...or this long after the first
+    WRITE_BUFFER_TIMEOUT = float(os.getenv('WRITE_BUFFER_TIMEOUT', '5'))         # Longest a request waits for its flush
+    
+    # Tenants (saccos/routes) sharing this deployment (see tenancy.py)
+    TENANT_DEFAULT_SLUG = os.getenv('TENANT_DEFAULT_SLUG', 'default')           # Used for unknown shortcodes
+    TENANT_DEFAULT_NAME = os.getenv('TENANT_DEFAULT_NAME', 'Nazigi Stamford')   # Only read when it is first created
+    TENANT_DEFAULT_KEYWORD = os.getenv('TENANT_DEFAULT_KEYWORD', 'test2')       # ...from these and AT_SHORTCODE
+    TENANT_REFRESH_SECONDS = int(os.getenv('TENANT_REFRESH_SECONDS', '60'))     # Pick up tenant changes
+    TENANT_MAX_RUNNING_BROADCASTS = int(os.getenv('TENANT_MAX_RUNNING_BROADCASTS', '2'))  # Per tenant in the scheduler, 0 = no limit
+    
+    # Response compression and caching (see http_cache.py)
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))           # Smaller bodies are sent as they are
+    COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', '6'))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', '5'))    # Used when brotli is installed
+    STATIC_MAX_AGE_SECONDS = int(os.getenv('STATIC_MAX_AGE_SECONDS', str(365 * 24 * 3600)))  # Fingerprinted static files
     
     # AfricasTalking
     AT_USERNAME = os.getenv('AT_USERNAME', 'Kwepo')
@@ -34,6 +83,42 @@ class Config:
     # Conductor credentials
     CONDUCTOR_USERNAME = os.getenv('CONDUCTOR_USERNAME', 'admin')
     CONDUCTOR_PASSWORD = os.getenv('CONDUCTOR_PASSWORD', 'admin123')
+    CONDUCTOR_SESSION_SECONDS = int(os.getenv('CONDUCTOR_SESSION_SECONDS', '28800'))   # Login token lifetime (a shift)
+    CONDUCTOR_AUTH_CACHE_SECONDS = int(os.getenv('CONDUCTOR_AUTH_CACHE_SECONDS', '60'))  # Re-check revocation this often
+    
+    # Prometheus /metrics (see metrics.py)
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # Bearer token scrapers must send; unset = local scrapes only
+    METRICS_DB_REFRESH_SECONDS = int(os.getenv('METRICS_DB_REFRESH_SECONDS', '15'))  # Queue depth queries at most this often
+    
+    # Logging (see logging_config.py)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' or 'json'
+    LOG_LEVELS = os.getenv('LOG_LEVELS', '')      # e.g. "sms_service=WARNING,routes.sms_routes=INFO"
+    
+    # SQL profiler (adds X-DB-* headers and /debug/sql-profile when enabled)
+    SQL_PROFILER_ENABLED = os.getenv('SQL_PROFILER_ENABLED', 'false').lower() == 'true'
+    SQL_PROFILER_SLOW_MS = int(os.getenv('SQL_PROFILER_SLOW_MS', '500'))
+    SQL_PROFILER_BUFFER_SIZE = int(os.getenv('SQL_PROFILER_BUFFER_SIZE', '100'))
+    SQL_PROFILER_TOP_N = int(os.getenv('SQL_PROFILER_TOP_N', '5'))
+    
+    # Inbound traffic capture for replay (see traffic_capture.py / replay_traffic.py)
+    TRAFFIC_CAPTURE_ENABLED = os.getenv('TRAFFIC_CAPTURE_ENABLED', 'false').lower() == 'true'
+    TRAFFIC_CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH', 'captures/sms_callbacks.jsonl')
+    TRAFFIC_CAPTURE_MAX_BYTES = int(os.getenv('TRAFFIC_CAPTURE_MAX_BYTES', str(50 * 1024 * 1024)))
+    TRAFFIC_CAPTURE_BACKUPS = int(os.getenv('TRAFFIC_CAPTURE_BACKUPS', '10'))
+    
+    # Outbound message templates
+    DEFAULT_LANGUAGE = os.getenv('DEFAULT_LANGUAGE', 'en')
+    
+    # Broadcasts
+    BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', '1000'))       # Recipients per provider call
+    BROADCAST_SPREAD_SECONDS = int(os.getenv('BROADCAST_SPREAD_SECONDS', '0'))  # Default window for scheduled sends
+    BROADCAST_STALE_SECONDS = int(os.getenv('BROADCAST_STALE_SECONDS', '180'))  # No progress for this long = interrupted
+    
+    # Scheduler worker
+    SCHEDULER_POLL_SECONDS = int(os.getenv('SCHEDULER_POLL_SECONDS', '5'))
+    SCHEDULER_BATCH_SIZE = int(os.getenv('SCHEDULER_BATCH_SIZE', '5'))
+    SCHEDULER_LEASE_SECONDS = int(os.getenv('SCHEDULER_LEASE_SECONDS', '600'))  # Running job with no heartbeat = dead worker
     
     # Bus stops
     BUS_STOPS = [
@@ -0,0 +1,166 @@
+"""Database connection pool settings
+
+Pool size follows the concurrency of the process instead of a fixed
+10 + 20 per worker. A process serves at most one request per thread, or
+per greenlet under gevent, so that is how many connections it can use at
+once (see gunicorn.conf.py):
+
+    sync     1
+    gthread  GUNICORN_THREADS (default 4)
+    gevent   GUNICORN_WORKER_CONNECTIONS (default 50)
+
+plus DB_POOL_OVERFLOW (default 2) for background work. DB_MAX_CONNECTIONS
+caps the total across all GUNICORN_WORKERS, so the whole deployment stays
+under the server's max_connections.
+
+DB_PGBOUNCER=true is for running behind pgbouncer in transaction pooling
+mode. pgbouncer does the pooling, so SQLAlchemy opens and closes a
+connection per checkout (NullPool), and prepared statements are turned off
+for drivers that use them (psycopg 3). psycopg2 never prepares statements
+server-side.
+
+Instead of pinging on every checkout (pool_pre_ping), a connection is only
+pinged if it has been idle for more than DB_PING_IDLE_SECONDS. TCP
+keepalives and the LIFO pool let the server and network drop unused
+connections early. A disconnect in the middle of a request invalidates the
+pool, so only that request fails.
+"""
+
+import math
+import os
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.pool import NullPool, QueuePool
+from metrics import DB_POOL_INVALIDATIONS, DB_POOL_IN_USE, DB_POOL_TIMEOUTS, DB_POOL_WAIT
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def _env_int(env, name, default):
+    value = env.get(name)
+    return int(value) if value else default
+
+
+def worker_concurrency(env=os.environ):
+    """Requests a single worker process can serve at once"""
+    mode = env.get('GUNICORN_MODE', 'gthread').lower()
+    if mode == 'gevent':
+        return _env_int(env, 'GUNICORN_WORKER_CONNECTIONS', 50)
+    if mode == 'sync':
+        return 1
+    return _env_int(env, 'GUNICORN_THREADS', 4)
+
+
+def available_cpus():
+    """CPUs this process may use: its affinity mask, limited by a cgroup v2 CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available outside Linux
+        cpus = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def worker_count(env=os.environ):
+    """Gunicorn worker processes (gunicorn.conf.py uses this too)"""
+    cpus = available_cpus()
+    default = cpus if env.get('GUNICORN_MODE', '').lower() == 'gevent' else cpus * 2 + 1
+    default = min(default, _env_int(env, 'GUNICORN_MAX_WORKERS', 12))
+    return _env_int(env, 'GUNICORN_WORKERS', default)
+
+
+def engine_options(database_url, env=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for this process"""
+    if database_url.startswith('sqlite'):
+        return {}
+
+    options = {}
+    connect_args = {}
+
+    if database_url.startswith('postgresql'):
+        connect_args.update({
+            'keepalives': 1,
+            'keepalives_idle': 30,
+            'keepalives_interval': 10,
+            'keepalives_count': 3,
+            'connect_timeout': _env_int(env, 'DB_CONNECT_TIMEOUT', 5),
+        })
+
+    if env.get('DB_PGBOUNCER', 'false').lower() == 'true':
+        options['poolclass'] = NullPool
+        if database_url.startswith('postgresql+psycopg:'):
+            connect_args['prepare_threshold'] = None
+    else:
+        pool_size = _env_int(env, 'DB_POOL_SIZE', worker_concurrency(env))
+        max_overflow = _env_int(env, 'DB_POOL_OVERFLOW', 2)
+
+        max_connections = _env_int(env, 'DB_MAX_CONNECTIONS', 0)
+        if max_connections:
+            per_worker = max(1, max_connections // worker_count(env))
+            pool_size = min(pool_size, per_worker)
+            max_overflow = min(max_overflow, per_worker - pool_size)
+
+        options.update({
+            'poolclass': TimedQueuePool,
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': _env_int(env, 'DB_POOL_TIMEOUT', 10),
+            'pool_recycle': _env_int(env, 'DB_POOL_RECYCLE', 1800),
+            'pool_use_lifo': True,
+        })
+
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def init_app(app, db):
+    """Register idle-connection pings and pool usage metrics"""
+    ping_after = app.config.get('DB_PING_IDLE_SECONDS', 30)
+
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    for engine in engines:
+        _register_pool_events(engine, ping_after)
+
+
+def _register_pool_events(engine, ping_after):
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get('checked_in_at')
+        if checked_in_at is not None and time.monotonic() - checked_in_at > ping_after:
+            try:
+                engine.dialect.do_ping(dbapi_connection)
+            except Exception as e:
+                # The pool discards this connection and retries with a fresh one
+                raise exc.DisconnectionError() from e
+        DB_POOL_IN_USE.inc()
+
+    def on_checkin(dbapi_connection, connection_record):
+        connection_record.info['checked_in_at'] = time.monotonic()
+        DB_POOL_IN_USE.dec()
+
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        DB_POOL_INVALIDATIONS.inc()
+
+    event.listen(engine, 'checkout', on_checkout)
+    event.listen(engine, 'checkin', on_checkin)
+    event.listen(engine, 'invalidate', on_invalidate)
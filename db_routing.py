@@ -0,0 +1,133 @@
+"""Read-replica routing
+
+Set REPLICA_DATABASE_URL to send read-only conductor queries to a replica
+instead of the primary that serves /sms/callback. Views opt in with
+@read_replica; everything else, and any flush, stays on the primary.
+
+A request is only routed to the replica if that replica answered its last
+health check and its replay lag is within REPLICA_MAX_LAG_SECONDS, so
+dashboards are at most that far behind. The check runs at most every
+REPLICA_CHECK_SECONDS per worker, and every REPLICA_RETRY_SECONDS once the
+replica is down. If a query fails on the replica mid-request, the view is
+run again on the primary.
+"""
+
+import logging
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc, text
+from metrics import DB_READ_ROUTE, REPLICA_LAG
+
+REPLICA_BIND = 'replica'
+
+# 0 when the standby has replayed everything it received, otherwise the age
+# of the last replayed transaction. NULL (not a standby) counts as 0.
+LAG_QUERY = text("""
+    SELECT COALESCE(CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END, 0)
+""")
+
+logger = logging.getLogger(__name__)
+
+# Per-worker replica health
+_status = {'checked_at': None, 'healthy': False, 'lag': None}
+
+
+class RoutingSession(Session):
+    """Session that reads from the replica while a @read_replica view runs"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('db_read_bind'):
+            engine = self._db.engines.get(g.db_read_bind)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def mark_unhealthy():
+    _status.update(checked_at=time.monotonic(), healthy=False, lag=None)
+
+
+def replica_usable(engine, max_lag):
+    """Whether the replica is up and no more than max_lag seconds behind"""
+    config = current_app.config
+    interval = config['REPLICA_CHECK_SECONDS'] if _status['healthy'] else config['REPLICA_RETRY_SECONDS']
+    now = time.monotonic()
+
+    if _status['checked_at'] is None or now - _status['checked_at'] >= interval:
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == 'postgresql':
+                    lag = float(conn.execute(LAG_QUERY).scalar())
+                else:
+                    conn.execute(text('SELECT 1'))
+                    lag = 0.0
+            _status.update(checked_at=now, healthy=True, lag=lag)
+            REPLICA_LAG.set(lag)
+        except Exception as e:
+            logger.warning("Replica unavailable, reading from primary: %s", e)
+            mark_unhealthy()
+
+    return _status['healthy'] and _status['lag'] <= max_lag
+
+
+def read_replica(f=None, max_lag=None):
+    """
+    Run a read-only view against the replica when it is healthy and fresh
+
+    Args:
+        max_lag: Staleness bound in seconds (default REPLICA_MAX_LAG_SECONDS)
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            db = current_app.extensions['sqlalchemy']
+            engine = db.engines.get(REPLICA_BIND)
+            bound = max_lag if max_lag is not None else current_app.config['REPLICA_MAX_LAG_SECONDS']
+
+            if engine is None or not replica_usable(engine, bound):
+                if engine is not None:
+                    DB_READ_ROUTE.labels(target='primary').inc()
+                return f(*args, **kwargs)
+
+            g.db_read_bind = REPLICA_BIND
+            g.replica_failed = False
+            try:
+                response = f(*args, **kwargs)
+            except exc.DBAPIError:
+                if not g.get('replica_failed'):
+                    raise
+            finally:
+                g.db_read_bind = None
+
+            if g.pop('replica_failed', False):
+                mark_unhealthy()
+                db.session.rollback()
+                DB_READ_ROUTE.labels(target='fallback').inc()
+                return f(*args, **kwargs)
+
+            DB_READ_ROUTE.labels(target='replica').inc()
+            return response
+        return decorated
+
+    return decorator(f) if f is not None else decorator
+
+
+def _on_replica_error(context):
+    if has_request_context():
+        g.replica_failed = True
+
+
+def init_app(app, db):
+    """Watch the replica engine for errors so views can fall back"""
+    with app.app_context():
+        engine = db.engines.get(REPLICA_BIND)
+    if engine is None:
+        return
+
+    event.listen(engine, 'handle_error', _on_replica_error)
+    logger.info("📚 Read replica configured for conductor views")
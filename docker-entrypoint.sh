@@ -14,13 +14,11 @@ echo "PostgreSQL is ready!"
 echo "Running database migrations..."
 python init_db.py
 
+# Prometheus multiprocess metrics (shared by all Gunicorn workers)
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # Start Gunicorn
 echo "Starting Gunicorn..."
-exec gunicorn --bind 0.0.0.0:${PORT:-5000} \
-    --workers ${GUNICORN_WORKERS:-4} \
-    --threads ${GUNICORN_THREADS:-2} \
-    --timeout ${GUNICORN_TIMEOUT:-120} \
-    --access-logfile - \
-    --error-logfile - \
-    --log-level ${LOG_LEVEL:-info} \
-    wsgi:app
+exec gunicorn --config gunicorn.conf.py wsgi:app
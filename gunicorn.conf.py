@@ -0,0 +1,99 @@
+"""
+Gunicorn runtime profile
+
+Picked up automatically from the working directory. Everything can be
+overridden with environment variables:
+
+    GUNICORN_MODE          gthread (default), sync or gevent
+    GUNICORN_WORKERS       Worker processes (default: 2 x CPU + 1, gevent: CPU)
+    GUNICORN_MAX_WORKERS   Cap on that default (default 12)
+    GUNICORN_THREADS       Threads per gthread worker (default 4)
+    GUNICORN_WORKER_CONNECTIONS  Concurrent requests per gevent worker (default 50)
+    GUNICORN_PRELOAD       Load the app once in the master (default true)
+    GUNICORN_MAX_REQUESTS  Recycle workers after this many requests (default 2000, 0 = never)
+    GUNICORN_MAX_REQUESTS_JITTER  Random spread so workers don't recycle together (default 200)
+    GUNICORN_TIMEOUT       Worker timeout in seconds (default 120)
+
+Request time is almost all spent waiting on AfricasTalking and Postgres,
+so concurrency per worker matters more than worker count. gthread is the
+safe default. gevent gives the most concurrency, but needs
+`pip install -r requirements-gevent.txt`: gevent makes the provider's
+HTTP calls cooperative, and psycogreen does the same for psycopg2.
+Without psycogreen every query blocks the whole worker; without gevent
+the gthread mode is used instead.
+
+CPU counts the CPUs the container may actually use (affinity mask and
+cgroup quota), not the host's, so a 2-CPU container on a 64-core host
+doesn't start 129 workers.
+"""
+
+import os
+
+mode = os.getenv('GUNICORN_MODE', 'gthread').lower()
+
+if mode == 'gevent':
+    try:
+        from gevent import monkey
+    except ImportError:
+        print("⚠️  GUNICORN_MODE=gevent but gevent is not installed (pip install gevent psycogreen): using gthread")
+        mode = 'gthread'
+        # db_pool sizes the pool from this in the app too
+        os.environ['GUNICORN_MODE'] = mode
+
+if mode == 'gevent':
+    # Patch before the app (and its sockets, ssl, threads) is imported by preload
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        print("⚠️  psycogreen not installed: database calls will block gevent workers")
+
+from db_pool import worker_count  # imported after the gevent patch, like the app
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+if mode == 'gevent':
+    worker_class = 'gevent'
+    workers = worker_count()
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '50'))
+elif mode == 'sync':
+    worker_class = 'sync'
+    workers = worker_count()
+else:
+    worker_class = 'gthread'
+    workers = worker_count()
+    threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+capture_output = True
+
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master"""
+    if not server.cfg.preload_app:
+        return
+
+    from models import db
+
+    app = server.app.wsgi()
+    with app.app_context():
+        # close=False: leave the master's sockets alone, just forget them
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    """Let Prometheus drop live gauges of the dead worker"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,20 +1,23 @@
 #!/usr/bin/env python3
 """
 Health check script for Docker container
+
+Probes the running server instead of building the app, so each check
+costs one HTTP request rather than a full application startup.
+
+    python healthcheck.py          # readiness: worker up and database reachable
+    python healthcheck.py --live   # liveness: worker up
 """
-import sys
 import os
+import sys
+import urllib.request
+
+path = '/health/live' if '--live' in sys.argv else '/health/ready'
+url = f"http://127.0.0.1:{os.getenv('PORT', '5000')}{path}"
 
 try:
-    # Check if app can be imported
-    from app import create_app
-    
-    app = create_app()
-    with app.app_context():
-        # Try to access database
-        from models import db
-        db.engine.execute('SELECT 1')
-    
+    with urllib.request.urlopen(url, timeout=float(os.getenv('HEALTHCHECK_TIMEOUT', '3'))) as response:
+        response.read()
     print("Health check passed")
     sys.exit(0)
 except Exception as e:
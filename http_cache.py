@@ -0,0 +1,244 @@
+"""HTTP compression and caching for the conductor API and dashboard
+
+Conductors use the dashboard over mobile data, so every response is kept
+as small as possible and repeat loads skip whatever hasn't changed:
+
+    compression    text, JSON, CSS and JS responses of COMPRESS_MIN_BYTES
+                   or more are sent brotli (if installed) or gzip encoded,
+                   whichever the client accepts. Smaller bodies fit in a
+                   packet anyway and are sent as they are.
+    validators     every GET on the conductor blueprint gets an ETag and
+                   is answered 304 Not Modified when the client's copy is
+                   still current (add_validators). Views that would do a
+                   lot of work use conditional(), which checks a cheap
+                   version query before running the view at all.
+    static files   static_url() adds a content fingerprint (?v=...) to
+                   asset URLs. Fingerprinted requests are cached for
+                   STATIC_MAX_AGE_SECONDS and never revalidated, because
+                   new content gets a new URL.
+
+Conductor API responses are marked private and no-cache: browsers keep
+them, but ask (with If-None-Match) before each reuse. Compressed responses
+carry a weak ETag, as the encoded bytes differ from the ones it was
+computed for.
+
+Brotli needs `pip install brotli`. Without it gzip is used.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, request, url_for
+from werkzeug.http import is_resource_modified, quote_etag
+from metrics import HTTP_COMPRESSION_BYTES, HTTP_NOT_MODIFIED
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+}
+
+# Compressed static files, so each is only compressed once per worker
+STATIC_CACHE_SIZE = 64
+
+
+class Compressor:
+    """Compresses response bodies in the encoding the client prefers"""
+
+    def __init__(self, min_bytes=1024, gzip_level=6, brotli_quality=5, brotli=None):
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.brotli = brotli
+        self._static = OrderedDict()  # (filename, etag, encoding) -> body
+        self._lock = threading.Lock()
+
+    def choose_encoding(self, accept_encodings):
+        """Best encoding the client accepts, or None"""
+        if self.brotli is not None and accept_encodings.quality('br'):
+            return 'br'
+        if accept_encodings.quality('gzip'):
+            return 'gzip'
+        return None
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return self.brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def compress_static(self, filename, etag, data, encoding):
+        key = (filename, etag, encoding)
+        with self._lock:
+            body = self._static.get(key)
+            if body is not None:
+                self._static.move_to_end(key)
+                return body
+        body = self.compress(data, encoding)
+        with self._lock:
+            self._static[key] = body
+            while len(self._static) > STATIC_CACHE_SIZE:
+                self._static.popitem(last=False)
+        return body
+
+    def process(self, response):
+        """Compress a finished response in place, if that is worth it"""
+        if (response.status_code < 200 or response.status_code in (204, 206)
+                or response.status_code >= 300
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or response.cache_control.no_transform):
+            return response
+
+        static_file = request.endpoint == 'static'
+        if response.direct_passthrough:
+            # Only static files are read into memory; other streams are sent as they are
+            if not static_file:
+                return response
+            response.direct_passthrough = False
+        elif response.is_streamed:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_bytes:
+            return response
+
+        # The body depends on Accept-Encoding from here on, whatever this client sent
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        etag, weak = response.get_etag()
+        if static_file and etag:
+            body = self.compress_static(request.view_args.get('filename'), etag, data, encoding)
+        else:
+            body = self.compress(data, encoding)
+        if len(body) >= len(data):
+            return response
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        HTTP_COMPRESSION_BYTES.labels(encoding=encoding, stage='original').inc(len(data))
+        HTTP_COMPRESSION_BYTES.labels(encoding=encoding, stage='compressed').inc(len(body))
+        return response
+
+
+_fingerprints = {}  # static filename -> (mtime, digest)
+
+
+def fingerprint(filename):
+    """Short content hash of a file in the static folder"""
+    path = os.path.join(current_app.static_folder, filename)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _fingerprints.get(filename)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    _fingerprints[filename] = (mtime, digest)
+    return digest
+
+
+def static_url(filename):
+    """URL of a static file that changes whenever its content does (for templates)"""
+    return url_for('static', filename=filename, v=fingerprint(filename))
+
+
+def _cache_static(response):
+    """Cache fingerprinted static files for good; others are revalidated (Flask's default)"""
+    if response.status_code not in (200, 304):
+        return
+    version = request.args.get('v')
+    if version and version == fingerprint(request.view_args['filename']):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config.get('STATIC_MAX_AGE_SECONDS', 31536000)
+        response.cache_control.immutable = True
+
+
+def add_validators(response):
+    """
+    after_request for API blueprints: ETag every GET response and answer
+    If-None-Match with 304, so an unchanged body isn't sent again
+    """
+    if request.method not in ('GET', 'HEAD') or response.status_code not in (200, 304):
+        return response
+
+    if not response.headers.get('Cache-Control'):
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+
+    if response.status_code == 200 and not response.is_streamed and response.get_etag()[0] is None:
+        response.add_etag()
+        response.make_conditional(request)
+        if response.status_code == 304:
+            HTTP_NOT_MODIFIED.labels(endpoint=request.endpoint).inc()
+    return response
+
+
+def conditional(version):
+    """
+    Decorator for GET views whose output has a cheap version query
+
+    version() returns (key, last_modified), where key is anything that
+    changes whenever the view's output would (row counts, max ids or
+    timestamps) and last_modified is a datetime or None. When the
+    client's copy matches, 304 is returned without running the view.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key, last_modified = version()
+            tenant = g.get('tenant')
+            seed = repr((request.endpoint, request.query_string, tenant.id if tenant else None, key))
+            etag = hashlib.sha1(seed.encode()).hexdigest()
+
+            if not is_resource_modified(request.environ, etag=quote_etag(etag), last_modified=last_modified):
+                HTTP_NOT_MODIFIED.labels(endpoint=request.endpoint).inc()
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+        return decorated
+    return decorator
+
+
+def init_app(app):
+    """Register fingerprinted static URLs, static caching and (unless COMPRESS_ENABLED is false) compression"""
+    app.jinja_env.globals['static_url'] = static_url
+
+    compressor = None
+    if app.config.get('COMPRESS_ENABLED', True):
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+            logger.debug("brotli not installed: compressing with gzip only")
+        compressor = Compressor(
+            min_bytes=app.config.get('COMPRESS_MIN_BYTES', 1024),
+            gzip_level=app.config.get('COMPRESS_GZIP_LEVEL', 6),
+            brotli_quality=app.config.get('COMPRESS_BROTLI_QUALITY', 5),
+            brotli=brotli
+        )
+        app.extensions['compressor'] = compressor
+
+    @app.after_request
+    def cache_and_compress(response):
+        if request.endpoint == 'static':
+            _cache_static(response)
+        if compressor is not None:
+            response = compressor.process(response)
+        return response
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Bulk import passengers from a CSV of phone numbers
+
+    python import_passengers.py riders.csv [--tenant SLUG] [--opted-in] [--batch-size 50000]
+
+The phone number is taken from a phone_number/phone/msisdn/mobile/number
+column if the file has a header, otherwise from the first column. Numbers
+are normalised to E.164; invalid ones and duplicates are skipped and
+existing passengers are left unchanged. Without --tenant the passengers
+join the default tenant. See passenger_import.py.
+"""
+
+import argparse
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from passenger_import import BATCH_SIZE, import_csv
+from tenancy import tenant_directory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('csv', help="CSV file, or - for stdin")
+    parser.add_argument('--tenant', help="Tenant slug (default: the default tenant)")
+    parser.add_argument('--opted-in', action='store_true', help="Opt new passengers in")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    def progress(stats):
+        s = stats.as_dict()
+        print(f"  {s['rows']:>10,} rows  {s['created']:>10,} new  {s['existing']:>8,} existing  "
+              f"{s['invalid']:>6,} invalid  {s['rows_per_second']:>10,.0f} rows/s", flush=True)
+
+    app = create_app()
+    with app.app_context():
+        tenant = tenant_directory.by_slug(args.tenant) if args.tenant else tenant_directory.default()
+        if tenant is None:
+            sys.exit(f"❌ No tenant named {args.tenant}")
+
+        print(f"📥 Importing passengers for {tenant.slug} from {args.csv}")
+        if args.csv == '-':
+            stats = import_csv(tenant.id, sys.stdin, args.opted_in, args.batch_size, progress)
+        else:
+            with open(args.csv, newline='', encoding='utf-8-sig') as f:
+                stats = import_csv(tenant.id, f, args.opted_in, args.batch_size, progress)
+
+    s = stats.as_dict()
+    print(f"✅ Done: {s['created']:,} created, {s['existing']:,} already registered, "
+          f"{s['invalid']:,} invalid, {s['duplicates']:,} duplicates "
+          f"in {s['seconds']}s ({s['rows_per_second']:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
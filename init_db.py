@@ -1,10 +1,28 @@
 """Initialize database tables
 
-Run this script to create all database tables
+Run this script to create all database tables. Tables created by an
+earlier release are brought up to date with tenant_tables.py upgrade
+(PostgreSQL), and the script exits non-zero if that is not possible, so
+the startup scripts never start Gunicorn against an outdated schema.
 """
 
+import sys
+from sqlalchemy import inspect
 from app import create_app
 from models import db
+from tenancy import tenant_directory
+import tenant_tables
+
+def missing_columns():
+    """Model columns missing from existing tables (create_all() never alters tables)"""
+    inspector = inspect(db.engine)
+    existing = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name in existing:
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            missing += [f'{table.name}.{column.name}' for column in table.columns if column.name not in columns]
+    return missing
 
 def init_db():
     """Initialize database tables"""
@@ -15,12 +33,33 @@ def init_db():
         db.create_all()
         print("Database tables created successfully!")
         
+        missing = missing_columns()
+        if missing:
+            print(f"⚠️  Tables from an earlier release found (missing {', '.join(missing)})")
+            if db.engine.dialect.name != 'postgresql':
+                sys.exit("❌ Only PostgreSQL databases can be upgraded; recreate this one")
+            tenant_tables.run_upgrade()
+            missing = missing_columns()
+            if missing:
+                sys.exit(f"❌ Upgrade left columns missing: {', '.join(missing)}")
+            print("✅ Tables upgraded")
+        
+        default = tenant_directory.default()
+        print(f"Default tenant: {default.slug} ({default.keyword.upper()} to {default.shortcode})")
+        
         # Print table information
         print("\nCreated tables:")
+        print("- tenants")
         print("- passengers")
         print("- conductor_messages")
+        print("- broadcast_chunks")
         print("- passenger_responses")
         print("- sms_logs")
+        print("- segments")
+        print("- scheduled_broadcasts")
+        print("- passenger_transitions")
+        print("- suppressed_numbers")
+        print("- conductors")
 
 if __name__ == '__main__':
     init_db()
@@ -0,0 +1,128 @@
+"""Logging setup
+
+All log records go through a QueueHandler, and a QueueListener thread does
+the formatting and writes them out. Request threads only pay for an
+enqueue. Log calls on the hot path use %-style arguments, so nothing is
+formatted for levels that are disabled.
+
+Settings (see Config):
+    LOG_LEVEL   Root level, e.g. INFO
+    LOG_FORMAT  'json' for one JSON object per line, 'text' otherwise
+    LOG_LEVELS  Per-component levels, e.g. "sms_service=WARNING,sqlalchemy.engine=INFO"
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed with extra=
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects"""
+
+    def format(self, record):
+        data = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread
+
+    The stock prepare() renders the message before enqueueing so records
+    can be pickled. The queue here never leaves the process, so the record
+    is passed through as is.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def parse_levels(spec):
+    """Parse "name=LEVEL,name=LEVEL" into a dict"""
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level='INFO', fmt='text', levels=None, stream=None):
+    """
+    Route all logging through a background queue listener
+
+    Safe to call more than once; the previous listener is stopped first.
+    """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(LazyQueueHandler(log_queue))
+    root.setLevel(level.upper())
+
+    for name, component_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(component_level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Flush and stop the queue listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_after_fork():
+    """
+    Give a forked worker its own queue and listener thread
+
+    Threads don't survive fork(). Under gevent the parent's listener
+    greenlet does, but it is not registered as a thread in the child and
+    breaks shutdown, so it is left idle on the old queue instead.
+    """
+    global _listener
+    if _listener is None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, LazyQueueHandler):
+            handler.queue = log_queue
+
+    _listener = QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Manage conductor accounts
+
+    python manage_conductors.py add <username>        Create (prompts for password)
+    python manage_conductors.py add <username> --tenant <slug>   ...limited to one tenant
+    python manage_conductors.py passwd <username>     Change password, log out sessions
+    python manage_conductors.py disable <username>    Block login and revoke sessions
+    python manage_conductors.py enable <username>
+    python manage_conductors.py list
+
+Once the first account exists, CONDUCTOR_USERNAME / CONDUCTOR_PASSWORD from
+the environment are no longer accepted. Conductors added without --tenant
+may act for every tenant. See conductor_auth.py and tenancy.py.
+"""
+
+import argparse
+import getpass
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from models import db, Conductor
+import conductor_auth
+from tenancy import tenant_directory
+
+
+def prompt_password():
+    password = os.getenv('CONDUCTOR_NEW_PASSWORD') or getpass.getpass('Password: ')
+    if len(password) < 8:
+        sys.exit("❌ Password must be at least 8 characters")
+    if not os.getenv('CONDUCTOR_NEW_PASSWORD') and getpass.getpass('Repeat password: ') != password:
+        sys.exit("❌ Passwords don't match")
+    return password
+
+
+def get_conductor(username):
+    conductor = Conductor.query.filter_by(username=username).first()
+    if conductor is None:
+        sys.exit(f"❌ No conductor named {username}")
+    return conductor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('action', choices=['add', 'passwd', 'disable', 'enable', 'list'])
+    parser.add_argument('username', nargs='?')
+    parser.add_argument('--tenant', help="Tenant slug the conductor is limited to (add only)")
+    args = parser.parse_args()
+    if args.action != 'list' and not args.username:
+        parser.error('username is required')
+
+    app = create_app()
+    with app.app_context():
+        if args.action == 'list':
+            for conductor in Conductor.query.order_by(Conductor.username):
+                status = "✅ active" if conductor.active else "⛔ disabled"
+                tenant = tenant_directory.get(conductor.tenant_id) if conductor.tenant_id else None
+                print(f"{conductor.username:<20} {status:<12} tenant: {tenant.slug if tenant else 'all':<12} "
+                      f"last login: {conductor.last_login_at or 'never'}")
+            return
+
+        if args.action == 'add':
+            if Conductor.query.filter_by(username=args.username).first():
+                sys.exit(f"❌ Conductor {args.username} already exists")
+            tenant_id = None
+            if args.tenant:
+                tenant = tenant_directory.by_slug(args.tenant)
+                if tenant is None:
+                    sys.exit(f"❌ No tenant named {args.tenant}")
+                tenant_id = tenant.id
+            db.session.add(Conductor(username=args.username, tenant_id=tenant_id,
+                                     password_hash=conductor_auth.hash_password(prompt_password())))
+            print(f"✅ Created conductor {args.username}")
+
+        elif args.action == 'passwd':
+            conductor = get_conductor(args.username)
+            conductor.password_hash = conductor_auth.hash_password(prompt_password())
+            conductor_auth.revoke_sessions(conductor.id)
+            print(f"✅ Password changed for {args.username}; existing sessions revoked")
+
+        elif args.action == 'disable':
+            conductor = get_conductor(args.username)
+            conductor.active = False
+            conductor_auth.revoke_sessions(conductor.id)
+            print(f"⛔ Disabled {args.username}")
+
+        elif args.action == 'enable':
+            get_conductor(args.username).active = True
+            print(f"✅ Enabled {args.username}")
+
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
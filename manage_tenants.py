@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Manage tenants (saccos/routes sharing this deployment)
+
+    python manage_tenants.py add <slug> --name "Super Metro" --shortcode 20384 --keyword metro
+                                        [--stops "CBD,Ngara,Roysambu"] [--sender-id METRO]
+    python manage_tenants.py update <slug> [--name ...] [--shortcode ...] [--keyword ...]
+                                           [--stops ...] [--sender-id ...]
+    python manage_tenants.py disable <slug>   Stop routing SMS and running jobs for it
+    python manage_tenants.py enable <slug>
+    python manage_tenants.py list
+
+Tenants may share a shortcode if their keywords differ. Without --stops a
+tenant uses BUS_STOPS, without --sender-id AT_SENDER_ID. Workers pick up
+changes within TENANT_REFRESH_SECONDS. See tenancy.py.
+"""
+
+import argparse
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from models import db, Tenant
+from tenancy import tenant_directory
+
+
+def get_tenant(slug):
+    tenant = Tenant.query.filter_by(slug=slug).first()
+    if tenant is None:
+        sys.exit(f"❌ No tenant named {slug}")
+    return tenant
+
+
+def apply_options(tenant, args):
+    if args.name:
+        tenant.name = args.name
+    if args.shortcode:
+        tenant.shortcode = args.shortcode.strip()
+    if args.keyword:
+        tenant.keyword = args.keyword.strip().lower()
+    if args.stops is not None:
+        tenant.stops = [stop.strip() for stop in args.stops.split(',') if stop.strip()] or None
+    if args.sender_id is not None:
+        tenant.sender_id = args.sender_id or None
+
+    clash = Tenant.query.filter(
+        Tenant.shortcode == tenant.shortcode,
+        Tenant.keyword == tenant.keyword,
+        Tenant.slug != tenant.slug
+    ).first()
+    if clash:
+        sys.exit(f"❌ {clash.slug} already uses {tenant.keyword.upper()} on {tenant.shortcode}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('action', choices=['add', 'update', 'disable', 'enable', 'list'])
+    parser.add_argument('slug', nargs='?')
+    parser.add_argument('--name')
+    parser.add_argument('--shortcode')
+    parser.add_argument('--keyword', help="Opt-in keyword, e.g. test2")
+    parser.add_argument('--stops', help="Comma-separated stop names (empty = BUS_STOPS)")
+    parser.add_argument('--sender-id', help="AfricasTalking sender ID (empty = AT_SENDER_ID)")
+    args = parser.parse_args()
+    if args.action != 'list' and not args.slug:
+        parser.error('slug is required')
+
+    app = create_app()
+    with app.app_context():
+        # Creates the default tenant on a fresh database
+        tenant_directory.refresh(force=True)
+
+        if args.action == 'list':
+            for tenant in Tenant.query.order_by(Tenant.id):
+                status = "✅ active" if tenant.active else "⛔ disabled"
+                stops = len(tenant.stops) if tenant.stops else 'default'
+                print(f"{tenant.id:>4} {tenant.slug:<16} {status:<12} {tenant.keyword.upper():<10} "
+                      f"to {tenant.shortcode:<8} stops: {stops:<8} {tenant.name}")
+            return
+
+        if args.action == 'add':
+            if Tenant.query.filter_by(slug=args.slug).first():
+                sys.exit(f"❌ Tenant {args.slug} already exists")
+            if not (args.name and args.shortcode and args.keyword):
+                parser.error('add needs --name, --shortcode and --keyword')
+            tenant = Tenant(slug=args.slug)
+            apply_options(tenant, args)
+            db.session.add(tenant)
+            print(f"✅ Created tenant {args.slug}: {tenant.keyword.upper()} to {tenant.shortcode}")
+
+        elif args.action == 'update':
+            apply_options(get_tenant(args.slug), args)
+            print(f"✅ Updated tenant {args.slug}")
+
+        elif args.action == 'disable':
+            if args.slug == app.config['TENANT_DEFAULT_SLUG']:
+                sys.exit("❌ The default tenant can't be disabled")
+            get_tenant(args.slug).active = False
+            print(f"⛔ Disabled {args.slug}")
+
+        elif args.action == 'enable':
+            get_tenant(args.slug).active = True
+            print(f"✅ Enabled {args.slug}")
+
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
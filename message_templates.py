@@ -0,0 +1,176 @@
+from string import Formatter
+
+
+class MessageTemplate:
+    """A message template compiled once for fast repeated rendering"""
+
+    def __init__(self, name, text, static_fields=None, lang='en'):
+        """
+        Compile a template
+
+        Fields found in static_fields (e.g. the stop menu or the shortcode)
+        are rendered into the template here, so only per-recipient fields
+        are left for render().
+
+        Args:
+            name: Template name used for lookups
+            text: str.format style template text
+            static_fields: Values that never change after startup
+            lang: Language code of this variant
+        """
+        self.name = name
+        self.lang = lang
+        static_fields = static_fields or {}
+
+        chunks = []
+        fields = []
+        for literal, field, spec, conversion in Formatter().parse(text):
+            chunks.append(literal.replace('{', '{{').replace('}', '}}'))
+            if field is None:
+                continue
+            if field in static_fields:
+                value = static_fields[field]
+                if conversion:
+                    value = {'r': repr, 's': str, 'a': ascii}[conversion](value)
+                rendered = format(value, spec or '')
+                chunks.append(rendered.replace('{', '{{').replace('}', '}}'))
+            else:
+                chunks.append('{' + field + ('!' + conversion if conversion else '') +
+                              (':' + spec if spec else '') + '}')
+                fields.append(field)
+
+        self.fields = tuple(dict.fromkeys(fields))
+        compiled = ''.join(chunks)
+
+        if self.fields:
+            self._static = None
+            self._format_map = compiled.format_map
+        else:
+            # Fully static: render once now and hand out the same string
+            self._static = compiled.format_map({})
+            self._format_map = None
+
+    @property
+    def is_static(self):
+        return self._static is not None
+
+    def render(self, **fields):
+        """Render the template with per-recipient fields"""
+        if self._static is not None:
+            return self._static
+        return self._format_map(fields)
+
+    def render_many(self, rows):
+        """
+        Render the template for many recipients
+
+        Args:
+            rows: Iterable of field dicts, one per recipient
+
+        Yields:
+            Rendered message text for each row
+        """
+        if self._static is not None:
+            static = self._static
+            for _ in rows:
+                yield static
+            return
+
+        format_map = self._format_map
+        for row in rows:
+            yield format_map(row)
+
+    def __repr__(self):
+        return f'<MessageTemplate {self.name} ({self.lang})>'
+
+
+# Default English texts for all outbound messages
+DEFAULT_TEMPLATES = {
+    'stop_menu': "Please reply with the number of your preferred stop:\n\n{stop_lines}",
+    'opt_in_prompt': ("Welcome to {service_name}! \n\n"
+                      "Would you like to opt?\n\n"
+                      "Reply:\n"
+                      "1 to Opt In\n"
+                      "2 to Opt Out"),
+    'opt_in_confirmed': ("Thank you for opting in! \n\n"
+                         "You will now receive updates from {service_name} Bus conductors.\n\n"
+                         "To opt out anytime, send STOP to {shortcode}."),
+    'opted_out': ("You have been opted out from {service_name} Bus Service.\n\n"
+                  "To opt in again, send {keyword} to {shortcode}."),
+    'not_registered': "You are not registered in our service.",
+    'opt_in_first': "Please opt in first by sending {keyword} to {shortcode}.",
+    'stop_confirmed': ("Confirmed! You will be picked up at {stop}.\n\n"
+                       "Thank you for using {service_name} Bus Service!"),
+    'stop_name_confirmed': ("✅ Confirmed! You will be picked up at {stop}.\n\n"
+                            "Thank you for using {service_name} Bus Service!"),
+    'invalid_stop': "Invalid stop number. Please select a number between 1 and {stop_count}.",
+    'stop_not_understood': "Sorry, I didn't understand that stop.\n\n{stop_menu}",
+    'broadcast': ("{message}\n\nAvailable stops:\n{stop_lines}"
+                  "\nReply with the number or name of your preferred stop."),
+}
+
+
+class TemplateRegistry:
+    """Registry of compiled message templates with per-language variants"""
+
+    def __init__(self):
+        self.default_lang = 'en'
+        self.static_fields = {}
+        self._sources = {}
+        self._compiled = {}
+
+    def initialize(self, stops, shortcode, default_lang='en', overrides=None,
+                   keyword='TEST2', service_name='Nazigi Stamford'):
+        """
+        Compile all templates for the configured stops and shortcode
+
+        Args:
+            stops: List of bus stop names
+            shortcode: Shortcode passengers text to
+            default_lang: Language used when a variant is missing
+            overrides: Optional {(name, lang): text} of extra or replaced texts
+            keyword: Opt-in keyword, as shown to passengers
+            service_name: Operator name used in the texts
+        """
+        self.default_lang = default_lang
+        self.static_fields = {
+            'stop_lines': ''.join(f"{idx}. {stop}\n" for idx, stop in enumerate(stops, 1)),
+            'stop_count': len(stops),
+            'shortcode': shortcode,
+            'keyword': keyword,
+            'service_name': service_name,
+        }
+        # The stop menu is itself reused inside other templates
+        self.static_fields['stop_menu'] = MessageTemplate(
+            'stop_menu', DEFAULT_TEMPLATES['stop_menu'], self.static_fields
+        ).render()
+
+        self._sources = {(name, 'en'): text for name, text in DEFAULT_TEMPLATES.items()}
+        if overrides:
+            self._sources.update(overrides)
+        self._compiled = {
+            key: MessageTemplate(key[0], text, self.static_fields, key[1])
+            for key, text in self._sources.items()
+        }
+
+    def register(self, name, text, lang=None):
+        """Add or replace a single template variant"""
+        lang = lang or self.default_lang
+        self._sources[(name, lang)] = text
+        self._compiled[(name, lang)] = MessageTemplate(name, text, self.static_fields, lang)
+
+    def names(self):
+        """Names of all registered templates"""
+        return {name for name, _ in self._compiled}
+
+    def get(self, name, lang=None):
+        """Get a compiled template, falling back to the default language"""
+        for key in ((name, lang), (name, self.default_lang), (name, 'en')):
+            template = self._compiled.get(key)
+            if template is not None:
+                return template
+        raise KeyError(f"Unknown message template: {name}")
+
+    def render(self, name, lang=None, **fields):
+        """Render a template by name"""
+        return self.get(name, lang).render(**fields)
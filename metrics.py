@@ -0,0 +1,239 @@
+"""Prometheus metrics
+
+Exposed at /metrics. When PROMETHEUS_MULTIPROC_DIR is set (see
+docker-entrypoint.sh) every Gunicorn worker writes its samples to that
+directory and /metrics aggregates all workers, so scrapes are correct no
+matter which worker answers them.
+
+Scrapes must send "Authorization: Bearer <METRICS_TOKEN>". Without a
+METRICS_TOKEN only local scrapes (127.0.0.1 / ::1) are answered. Gauges
+read from the database (queue depths) are refreshed at most every
+METRICS_DB_REFRESH_SECONDS per worker, so frequent or repeated scrapes
+don't add queries.
+"""
+
+import hmac
+import logging
+import os
+import threading
+import time
+from functools import wraps
+from flask import Response, abort, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency',
+    ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS
+)
+HANDLER_LATENCY = Histogram(
+    'sms_handler_duration_seconds', 'Inbound SMS handler latency',
+    ['handler'], buckets=LATENCY_BUCKETS
+)
+PROVIDER_LATENCY = Histogram(
+    'sms_provider_request_duration_seconds', 'AfricasTalking API call latency',
+    ['outcome'], buckets=LATENCY_BUCKETS
+)
+SMS_SENT = Counter(
+    'sms_sent_total', 'Outbound SMS recipients by provider status',
+    ['status']
+)
+DB_QUERIES = Histogram(
+    'db_queries_per_request', 'Database queries issued per request',
+    ['endpoint'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+DB_TIME = Histogram(
+    'db_time_per_request_seconds', 'Time spent in database queries per request',
+    ['endpoint'], buckets=LATENCY_BUCKETS
+)
+DB_POOL_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time to get a connection from the pool (including connecting)',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+DB_POOL_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts_total', 'Checkouts that gave up waiting for a connection'
+)
+DB_POOL_IN_USE = Gauge(
+    'db_pool_connections_in_use', 'Connections checked out of the pool',
+    multiprocess_mode='livesum'
+)
+DB_POOL_INVALIDATIONS = Counter(
+    'db_pool_invalidations_total', 'Connections discarded after a disconnect or failed ping'
+)
+DB_READ_ROUTE = Counter(
+    'db_read_route_total', 'Read-only views by the database they were served from',
+    ['target']
+)
+REPLICA_LAG = Gauge(
+    'db_replica_lag_seconds', 'Replica replay lag at the last health check',
+    multiprocess_mode='mostrecent'
+)
+INBOUND_DROPPED = Counter(
+    'sms_inbound_dropped_total', 'Inbound SMS dropped by the per-number rate limiter',
+    ['reason']
+)
+ERROR_REPLIES_SKIPPED = Counter(
+    'sms_error_replies_skipped_total', 'Error replies not sent because the number got one recently'
+)
+SMS_SUPPRESSED = Counter(
+    'sms_suppressed_total', 'Outbound recipients skipped by the suppression list',
+    ['reason']
+)
+SUPPRESSION_FALSE_POSITIVES = Counter(
+    'suppression_bloom_false_positives_total', 'Suppression filter hits not confirmed by the database'
+)
+REPLY_BATCH_RECIPIENTS = Histogram(
+    'sms_reply_batch_recipients', 'Recipients per coalesced reply provider call',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+REPLIES_COALESCED = Counter(
+    'sms_replies_coalesced_total', 'Replies sent as part of another reply\'s provider call'
+)
+WRITE_BUFFER_BATCH_ROWS = Histogram(
+    'write_buffer_batch_rows', 'Rows written per write buffer flush',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+WRITE_BUFFER_FLUSH_SECONDS = Histogram(
+    'write_buffer_flush_seconds', 'Time to insert and commit one write buffer batch',
+    buckets=LATENCY_BUCKETS
+)
+HTTP_NOT_MODIFIED = Counter(
+    'http_not_modified_total', 'Conditional GETs answered 304 Not Modified',
+    ['endpoint']
+)
+HTTP_COMPRESSION_BYTES = Counter(
+    'http_compression_bytes_total', 'Bytes of compressed response bodies, before and after compression',
+    ['encoding', 'stage']
+)
+QUEUE_DEPTH = Gauge(
+    'queue_depth', 'Items waiting to be processed',
+    ['queue'], multiprocess_mode='mostrecent'
+)
+
+
+def timed(histogram, **labels):
+    """Decorator that observes a function's duration in a histogram"""
+    def decorator(f):
+        child = histogram.labels(**labels) if labels else histogram
+
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return decorated
+    return decorator
+
+
+def instrument_handler(f):
+    """Decorator for inbound SMS handlers"""
+    return timed(HANDLER_LATENCY, handler=f.__name__)(f)
+
+
+def record_send_statuses(recipients_data):
+    """Count outbound recipients by AfricasTalking status"""
+    counts = {}
+    for recipient_info in recipients_data:
+        status = recipient_info.get('status', 'Unknown')
+        counts[status] = counts.get(status, 0) + 1
+    for status, count in counts.items():
+        SMS_SENT.labels(status=status).inc(count)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start', None)
+    if start is not None and has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + time.perf_counter() - start
+
+
+_db_gauges = {'refreshed_at': None}
+_db_gauges_lock = threading.Lock()
+
+
+def collect_queue_depths(max_age):
+    """Refresh queue gauges from the database, unless done in the last max_age seconds"""
+    from models import db, BroadcastChunk, ScheduledBroadcast
+
+    now = time.monotonic()
+    with _db_gauges_lock:
+        refreshed_at = _db_gauges['refreshed_at']
+        if refreshed_at is not None and now - refreshed_at < max_age:
+            return
+        # Claimed before querying, so concurrent scrapes don't all query
+        _db_gauges['refreshed_at'] = now
+
+    QUEUE_DEPTH.labels(queue='broadcast_chunks').set(
+        BroadcastChunk.query.filter(BroadcastChunk.status.in_(['pending', 'sending'])).count()
+    )
+    QUEUE_DEPTH.labels(queue='scheduled_broadcasts').set(
+        ScheduledBroadcast.query.filter_by(status='pending').count()
+    )
+
+
+def init_app(app, db):
+    """Register request timing, DB query hooks and the /metrics endpoint"""
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        start = g.pop('request_start', None)
+        if start is not None and request.endpoint != 'metrics':
+            endpoint = request.endpoint or 'unknown'
+            REQUEST_LATENCY.labels(
+                endpoint=endpoint, method=request.method, status=response.status_code
+            ).observe(time.perf_counter() - start)
+            DB_QUERIES.labels(endpoint=endpoint).observe(g.get('db_queries', 0))
+            DB_TIME.labels(endpoint=endpoint).observe(g.get('db_time', 0.0))
+        return response
+
+    token = app.config.get('METRICS_TOKEN')
+    if not token:
+        logger.warning("⚠️  METRICS_TOKEN not set: /metrics only answers local scrapes")
+
+    def authorized():
+        if not token:
+            return request.remote_addr in LOCAL_ADDRESSES
+        auth = request.authorization
+        return (auth is not None and auth.type == 'bearer' and auth.token is not None
+                and hmac.compare_digest(auth.token.encode(), token.encode()))
+
+    @app.route('/metrics')
+    def metrics():
+        if not authorized():
+            abort(401 if token else 404)
+        try:
+            collect_queue_depths(app.config.get('METRICS_DB_REFRESH_SECONDS', 15))
+        except Exception as e:
+            app.logger.warning(f"Could not collect queue depths: {e}")
+
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -1,14 +1,40 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+class Tenant(db.Model):
+    """Operators (saccos/routes) sharing this deployment (see tenancy.py)"""
+    __tablename__ = 'tenants'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(50), unique=True, nullable=False)
+    name = db.Column(db.String(100), nullable=False)  # Used in message texts, e.g. "Nazigi Stamford"
+    shortcode = db.Column(db.String(20), nullable=False)
+    keyword = db.Column(db.String(30), nullable=False)  # Opt-in keyword, lowercase
+    stops = db.Column(db.JSON, nullable=True)  # None = BUS_STOPS
+    sender_id = db.Column(db.String(20), nullable=True)  # None = AT_SENDER_ID
+    active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Tenants may share a shortcode as long as their keywords differ
+    __table_args__ = (
+        db.UniqueConstraint('shortcode', 'keyword', name='uq_tenants_shortcode_keyword'),
+    )
+    
+    def __repr__(self):
+        return f'<Tenant {self.slug} ({self.keyword.upper()} to {self.shortcode})>'
 
-db = SQLAlchemy()
 
 class Passenger(db.Model):
     """Model for passengers who opt-in to receive SMS"""
     __tablename__ = 'passengers'
     
     id = db.Column(db.Integer, primary_key=True)
-    phone_number = db.Column(db.String(20), unique=True, nullable=False, index=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
+    phone_number = db.Column(db.String(20), nullable=False)
     opted_in = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -16,6 +42,12 @@ class Passenger(db.Model):
     # Relationship to responses
     responses = db.relationship('PassengerResponse', backref='passenger', lazy=True, cascade='all, delete-orphan')
     
+    # A number registers separately with each tenant; indexes lead with the tenant
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'phone_number', name='uq_passengers_tenant_phone'),
+        db.Index('ix_passengers_tenant_opted_in', 'tenant_id', 'opted_in'),
+    )
+    
     def __repr__(self):
         return f'<Passenger {self.phone_number} - {"Opted In" if self.opted_in else "Opted Out"}>'
 
@@ -25,28 +57,75 @@ class ConductorMessage(db.Model):
     __tablename__ = 'conductor_messages'
     
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
     message_text = db.Column(db.Text, nullable=False)
     sent_at = db.Column(db.DateTime, default=datetime.utcnow)
     recipients_count = db.Column(db.Integer, default=0)
     
+    # Delivery progress, tracked per chunk so an interrupted broadcast can resume
+    status = db.Column(db.String(20), default='sent', nullable=False)  # sending, sent, partial, failed
+    body = db.Column(db.Text, nullable=True)  # Final text as sent, including the stop list
+    chunks_total = db.Column(db.Integer, default=0, nullable=False)
+    chunks_done = db.Column(db.Integer, default=0, nullable=False)
+    last_progress_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
     # Relationship to responses
     responses = db.relationship('PassengerResponse', backref='conductor_message', lazy=True)
+    chunks = db.relationship('BroadcastChunk', backref='conductor_message', lazy=True,
+                             cascade='all, delete-orphan', order_by='BroadcastChunk.chunk_index')
+    
+    __table_args__ = (
+        db.Index('ix_conductor_messages_tenant_sent', 'tenant_id', 'sent_at'),
+    )
     
     def __repr__(self):
         return f'<ConductorMessage {self.id} sent at {self.sent_at}>'
 
 
+class BroadcastChunk(db.Model):
+    """Model for one provider call's worth of recipients in a broadcast"""
+    __tablename__ = 'broadcast_chunks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('conductor_messages.id'), nullable=False)
+    chunk_index = db.Column(db.Integer, nullable=False)
+    recipients = db.Column(db.JSON, nullable=False)
+    recipients_count = db.Column(db.Integer, nullable=False)
+    body = db.Column(db.Text, nullable=True)  # Personalised text of this chunk; None = the message body
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.UniqueConstraint('message_id', 'chunk_index', name='uq_broadcast_chunks_message_chunk'),
+        db.Index('ix_broadcast_chunks_message_status', 'message_id', 'status'),
+    )
+    
+    def __repr__(self):
+        return f'<BroadcastChunk {self.message_id}/{self.chunk_index} {self.status}>'
+
+
 class PassengerResponse(db.Model):
     """Model for tracking passenger responses to conductor messages"""
     __tablename__ = 'passenger_responses'
     
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
     passenger_id = db.Column(db.Integer, db.ForeignKey('passengers.id'), nullable=False)
     message_id = db.Column(db.Integer, db.ForeignKey('conductor_messages.id'), nullable=True)
     response_text = db.Column(db.Text, nullable=False)
     selected_stop = db.Column(db.String(100), nullable=True)
     responded_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Indexes used by audience segments (see segments.py)
+    __table_args__ = (
+        db.Index('ix_passenger_responses_tenant_stop_time', 'tenant_id', 'selected_stop', 'responded_at', 'passenger_id'),
+        db.Index('ix_passenger_responses_message', 'message_id', 'passenger_id'),
+        db.Index('ix_passenger_responses_tenant_time', 'tenant_id', 'responded_at', 'passenger_id'),
+    )
+    
     def __repr__(self):
         return f'<PassengerResponse from {self.passenger_id} - {self.selected_stop}>'
 
@@ -56,11 +135,120 @@ class SMSLog(db.Model):
     __tablename__ = 'sms_logs'
     
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
     phone_number = db.Column(db.String(20), nullable=False)
     message = db.Column(db.Text, nullable=False)
     direction = db.Column(db.String(10), nullable=False)  # 'incoming' or 'outgoing'
     status = db.Column(db.String(50), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_sms_logs_tenant_time', 'tenant_id', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<SMSLog {self.direction} - {self.phone_number}>'
+
+
+class Segment(db.Model):
+    """Model for saved audience segments used to target broadcasts"""
+    __tablename__ = 'segments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    definition = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'name', name='uq_segments_tenant_name'),
+    )
+    
+    def __repr__(self):
+        return f'<Segment {self.name}>'
+
+
+class ScheduledBroadcast(db.Model):
+    """Model for broadcasts scheduled by conductors to run later or on repeat"""
+    __tablename__ = 'scheduled_broadcasts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
+    message_text = db.Column(db.Text, nullable=False)
+    include_stops = db.Column(db.Boolean, default=True, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False)
+    recurrence = db.Column(db.String(50), nullable=True)  # None, 'hourly', 'daily', 'weekdays', 'weekly', 'every:<minutes>'
+    spread_seconds = db.Column(db.Integer, default=0, nullable=False)
+    segment_id = db.Column(db.Integer, db.ForeignKey('segments.id'), nullable=True)  # None = all opted-in
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, done, cancelled, failed
+    conductor_message_id = db.Column(db.Integer, db.ForeignKey('conductor_messages.id'), nullable=True)  # Broadcast of the latest run
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    run_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_scheduled_broadcasts_due', 'status', 'run_at'),
+    )
+    
+    def __repr__(self):
+        return f'<ScheduledBroadcast {self.id} {self.status} at {self.run_at}>'
+
+
+class PassengerTransition(db.Model):
+    """History of passenger opt-in state changes (see passenger_state.py)"""
+    __tablename__ = 'passenger_transitions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    passenger_id = db.Column(db.Integer, db.ForeignKey('passengers.id'), nullable=False)
+    event = db.Column(db.String(20), nullable=False)  # join, confirm, opt_out, import
+    opted_in_before = db.Column(db.Boolean, nullable=True)  # None = passenger did not exist yet
+    opted_in_after = db.Column(db.Boolean, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_passenger_transitions_passenger_time', 'passenger_id', 'created_at'),
+    )
+    
+    def __repr__(self):
+        return f'<PassengerTransition {self.passenger_id} {self.event}: {self.opted_in_before} -> {self.opted_in_after}>'
+
+
+class SuppressedNumber(db.Model):
+    """Numbers that must not be messaged (see suppression.py)"""
+    __tablename__ = 'suppressed_numbers'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=True)  # Set for opt-outs; NULL = every tenant
+    phone_number = db.Column(db.String(20), nullable=False)
+    reason = db.Column(db.String(30), nullable=False)  # opt_out, invalid_number, carrier_blocked, manual
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # One entry per number and tenant, and one for every tenant
+    __table_args__ = (
+        db.Index('uq_suppressed_numbers_phone_tenant', 'phone_number', 'tenant_id', unique=True),
+        db.Index('uq_suppressed_numbers_phone_global', 'phone_number', unique=True,
+                 postgresql_where=db.text('tenant_id IS NULL'), sqlite_where=db.text('tenant_id IS NULL')),
+    )
+    
+    def __repr__(self):
+        return f'<SuppressedNumber {self.phone_number} ({self.reason})>'
+
+
+class Conductor(db.Model):
+    """Conductor accounts for the dashboard and API (see conductor_auth.py)"""
+    __tablename__ = 'conductors'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=True)  # None = may act for any tenant
+    username = db.Column(db.String(80), unique=True, nullable=False, index=True)
+    password_hash = db.Column(db.String(255), nullable=False)
+    active = db.Column(db.Boolean, default=True, nullable=False)
+    session_version = db.Column(db.Integer, default=0, nullable=False)  # Bumped to revoke issued tokens
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_login_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<Conductor {self.username}{"" if self.active else " (disabled)"}>'
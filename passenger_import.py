@@ -0,0 +1,225 @@
+"""Bulk passenger import
+
+Loads a rider list (CSV, one phone number per row) into one tenant's
+passengers in batches. Each batch is normalised and deduped with
+phone_numbers.normalize_many(), then merged and committed on its own, so
+memory stays flat however big the file is and a failed import can simply
+be re-run.
+
+On PostgreSQL a batch is COPYed into a temporary staging table and merged
+with a single statement: new numbers are inserted (ON CONFLICT DO NOTHING,
+so existing passengers, including ones who opted out, are left as they
+are) and an 'import' row is written to passenger_transitions for each.
+Other databases (SQLite in development) run the same steps one by one.
+
+Used by POST /conductor/passengers/import and import_passengers.py.
+"""
+
+import csv
+import io
+import logging
+import time
+from datetime import datetime
+from sqlalchemy import insert, select, text
+from models import db, Passenger, PassengerTransition
+import phone_numbers
+
+logger = logging.getLogger(__name__)
+
+IMPORT = 'import'
+
+BATCH_SIZE = 50000
+
+PHONE_COLUMNS = ('phone_number', 'phone', 'msisdn', 'mobile', 'number')
+
+STAGING_TABLE = 'passenger_import_staging'
+
+_MERGE = text(f"""
+    WITH added AS (
+        INSERT INTO passengers (tenant_id, phone_number, opted_in, created_at, updated_at)
+        SELECT DISTINCT :tenant_id, phone_number, :opted_in, :now, :now FROM {STAGING_TABLE}
+        ON CONFLICT (tenant_id, phone_number) DO NOTHING
+        RETURNING id, opted_in
+    ), history AS (
+        INSERT INTO passenger_transitions (passenger_id, event, opted_in_before, opted_in_after, created_at)
+        SELECT id, '{IMPORT}', NULL, opted_in, :now FROM added
+    )
+    SELECT count(*) FROM added
+""")
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+_LOOKUP_CHUNK = 10000
+
+
+class ImportStats:
+    """Running totals for an import"""
+
+    def __init__(self):
+        self.rows = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.created = 0
+        self.existing = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        seconds = self.seconds
+        return {
+            'rows': self.rows,
+            'invalid': self.invalid,
+            'duplicates': self.duplicates,
+            'created': self.created,
+            'existing': self.existing,
+            'batches': self.batches,
+            'seconds': round(seconds, 2),
+            'rows_per_second': round(self.rows / seconds, 1) if seconds else 0.0
+        }
+
+
+def _phone_column(header):
+    """Index of the phone column if the first row is a header, else None"""
+    names = [name.strip().lower() for name in header]
+    for column in PHONE_COLUMNS:
+        if column in names:
+            return names.index(column)
+    return None
+
+
+def read_phones(stream):
+    """Yield the phone number of each CSV row, skipping a header row"""
+    reader = csv.reader(stream)
+    first = next(reader, None)
+    if first is None:
+        return
+
+    column = _phone_column(first)
+    if column is None:
+        column = 0
+        if first:
+            yield first[0]
+
+    for row in reader:
+        if len(row) > column:
+            yield row[column]
+        elif row:
+            yield ''
+
+
+def _copy_to_staging(connection, phones):
+    cursor = connection.connection.cursor()
+    data = '\n'.join(phones) + '\n'
+    statement = f"COPY {STAGING_TABLE} (phone_number) FROM STDIN"
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(statement, io.StringIO(data))  # psycopg2
+        else:
+            with cursor.copy(statement) as copy:  # psycopg 3
+                copy.write(data)
+    finally:
+        cursor.close()
+
+
+def _merge_copy(tenant_id, phones, opted_in, now):
+    """PostgreSQL: COPY into staging and merge into passengers in one statement"""
+    connection = db.session.connection()
+    # Created inside the batch's transaction, so it also works through pgbouncer
+    connection.exec_driver_sql(
+        f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} "
+        f"(phone_number varchar(20) NOT NULL) ON COMMIT DELETE ROWS"
+    )
+    _copy_to_staging(connection, phones)
+    return connection.execute(_MERGE, {'tenant_id': tenant_id, 'opted_in': opted_in, 'now': now}).scalar()
+
+
+def _merge_stepwise(tenant_id, phones, opted_in, now):
+    existing = set()
+    for i in range(0, len(phones), _LOOKUP_CHUNK):
+        existing.update(db.session.scalars(
+            select(Passenger.phone_number).where(
+                Passenger.tenant_id == tenant_id,
+                Passenger.phone_number.in_(phones[i:i + _LOOKUP_CHUNK])
+            )
+        ))
+
+    new = [phone for phone in phones if phone not in existing]
+    if not new:
+        return 0
+
+    ids = db.session.scalars(
+        insert(Passenger).returning(Passenger.id, sort_by_parameter_order=True),
+        [{'tenant_id': tenant_id, 'phone_number': phone, 'opted_in': opted_in, 'created_at': now, 'updated_at': now}
+         for phone in new]
+    ).all()
+    db.session.execute(insert(PassengerTransition), [
+        {'passenger_id': passenger_id, 'event': IMPORT, 'opted_in_before': None,
+         'opted_in_after': opted_in, 'created_at': now}
+        for passenger_id in ids
+    ])
+    return len(ids)
+
+
+def _import_batch(tenant_id, raw, opted_in, stats):
+    batch = phone_numbers.normalize_many(raw)
+    stats.rows += len(raw)
+    stats.invalid += len(batch.invalid)
+    stats.duplicates += batch.duplicates
+
+    if batch.valid:
+        now = datetime.utcnow()
+        dialect = db.session.get_bind(mapper=Passenger).dialect.name
+        try:
+            if dialect == 'postgresql':
+                created = _merge_copy(tenant_id, batch.valid, opted_in, now)
+            else:
+                created = _merge_stepwise(tenant_id, batch.valid, opted_in, now)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        stats.created += created
+        stats.existing += len(batch.valid) - created
+
+    stats.batches += 1
+
+
+def import_passengers(tenant_id, phones, opted_in=False, batch_size=BATCH_SIZE, progress=None):
+    """
+    Import phone numbers as a tenant's passengers, committing every batch_size rows
+
+    Args:
+        tenant_id: Tenant the passengers register with
+        phones: Iterable of raw phone numbers (see read_phones)
+        opted_in: Opt-in state for new passengers; existing ones are unchanged
+        batch_size: Rows per batch/transaction
+        progress: Optional callable, given ImportStats after every batch
+
+    Returns:
+        ImportStats
+    """
+    stats = ImportStats()
+    raw = []
+    for phone in phones:
+        raw.append(phone)
+        if len(raw) >= batch_size:
+            _import_batch(tenant_id, raw, opted_in, stats)
+            raw = []
+            if progress:
+                progress(stats)
+
+    if raw:
+        _import_batch(tenant_id, raw, opted_in, stats)
+        if progress:
+            progress(stats)
+
+    logger.info("📥 Passenger import: %s", stats.as_dict())
+    return stats
+
+
+def import_csv(tenant_id, stream, opted_in=False, batch_size=BATCH_SIZE, progress=None):
+    """Import a tenant's passengers from a text CSV stream (see import_passengers)"""
+    return import_passengers(tenant_id, read_phones(stream), opted_in, batch_size, progress)
@@ -0,0 +1,131 @@
+"""Passenger opt-in state machine
+
+    event     passenger            result
+    join      not registered       registered, not opted in (TEST2)
+              registered           unchanged
+    confirm   any                  opted in, registering if needed
+    opt_out   registered           not opted in
+              not registered       nothing (no row is created)
+
+Passengers are per tenant (see tenancy.py): the same number can be
+opted in with one tenant and out with another.
+
+Every transition is recorded in passenger_transitions (bulk imports add
+'import' rows, see passenger_import.py). On PostgreSQL the
+passenger upsert (INSERT ... ON CONFLICT DO UPDATE ... RETURNING) and the
+history row are one statement, using data-modifying CTEs. So concurrent
+messages from a new number can't race into a unique violation, and each
+transition is one round-trip. Other databases (SQLite in development) run
+the same steps one by one in the current transaction.
+
+apply() does not commit; the caller does.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import insert, literal, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Passenger, PassengerTransition
+
+JOIN = 'join'
+CONFIRM = 'confirm'
+OPT_OUT = 'opt_out'
+
+EVENTS = (JOIN, CONFIRM, OPT_OUT)
+
+HISTORY_COLUMNS = ['passenger_id', 'event', 'opted_in_before', 'opted_in_after', 'created_at']
+
+_dialect_insert = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+class Transition(namedtuple('Transition', ['passenger_id', 'event', 'opted_in_before', 'opted_in_after'])):
+    """Result of applying an event to a passenger"""
+    __slots__ = ()
+
+    @property
+    def created(self):
+        """True if the passenger was registered by this transition"""
+        return self.opted_in_before is None
+
+
+def _change_statement(dialect, tenant_id, phone_number, event, now):
+    """Upsert or update for the event, returning (id, opted_in)"""
+    if event == OPT_OUT:
+        stmt = update(Passenger).where(
+            Passenger.tenant_id == tenant_id,
+            Passenger.phone_number == phone_number
+        ).values(opted_in=False, updated_at=now)
+    else:
+        set_ = {'updated_at': now}
+        if event == CONFIRM:
+            set_['opted_in'] = True
+        stmt = _dialect_insert[dialect](Passenger).values(
+            tenant_id=tenant_id, phone_number=phone_number, opted_in=(event == CONFIRM),
+            created_at=now, updated_at=now
+        ).on_conflict_do_update(index_elements=[Passenger.tenant_id, Passenger.phone_number], set_=set_)
+    return stmt.returning(Passenger.id, Passenger.opted_in)
+
+
+def _apply_single_statement(tenant_id, phone_number, event, now):
+    """PostgreSQL: read previous state, change it and record history in one statement"""
+    prev = select(Passenger.id, Passenger.opted_in).where(
+        Passenger.tenant_id == tenant_id,
+        Passenger.phone_number == phone_number
+    ).cte('prev')
+    changed = _change_statement('postgresql', tenant_id, phone_number, event, now).cte('changed')
+
+    if event == OPT_OUT:
+        source = changed.join(prev, prev.c.id == changed.c.id)
+    else:
+        source = changed.outerjoin(prev, true())
+
+    stmt = insert(PassengerTransition).from_select(
+        HISTORY_COLUMNS,
+        select(changed.c.id, literal(event), prev.c.opted_in, changed.c.opted_in, literal(now)).select_from(source)
+    ).returning(
+        PassengerTransition.passenger_id,
+        PassengerTransition.opted_in_before,
+        PassengerTransition.opted_in_after
+    )
+
+    row = db.session.execute(stmt).first()
+    if row is None:
+        return None
+    return Transition(row.passenger_id, event, row.opted_in_before, row.opted_in_after)
+
+
+def _apply_stepwise(dialect, tenant_id, phone_number, event, now):
+    before = db.session.execute(
+        select(Passenger.opted_in).where(Passenger.tenant_id == tenant_id, Passenger.phone_number == phone_number)
+    ).scalar()
+
+    row = db.session.execute(_change_statement(dialect, tenant_id, phone_number, event, now)).first()
+    if row is None:
+        return None
+
+    db.session.execute(insert(PassengerTransition).values(
+        passenger_id=row.id, event=event, opted_in_before=before, opted_in_after=row.opted_in, created_at=now
+    ))
+    return Transition(row.id, event, before, row.opted_in)
+
+
+def apply(tenant_id, phone_number, event):
+    """
+    Apply an event to the tenant's passenger with this number
+
+    Returns:
+        Transition, or None if the event didn't apply (opt_out from an
+        unregistered number)
+    """
+    if event not in EVENTS:
+        raise ValueError(f"Unknown passenger event: {event}")
+
+    now = datetime.utcnow()
+    dialect = db.session.get_bind(mapper=Passenger).dialect.name
+
+    if dialect == 'postgresql':
+        return _apply_single_statement(tenant_id, phone_number, event, now)
+    return _apply_stepwise(dialect, tenant_id, phone_number, event, now)
@@ -0,0 +1,106 @@
+"""E.164 phone number normalisation
+
+Accepted formats (spaces, dashes, dots, slashes and brackets are ignored):
+
+    +254 712 345 678, 254712345678, 00254712345678   Kenya, with country code
+    0712 345678, (020) 1234567                       Kenya, national format
+    712345678, 110345678                             Kenya mobile, no trunk 0
+    +44 7911 123456, 0044 7911 123456                Other countries
+
+Kenyan numbers must have a 9 digit national number; other countries 7-15
+digits in total, as E.164 allows. Anything else (letters, too short or too
+long, a bare number that isn't a Kenyan mobile) is rejected rather than
+guessed at.
+
+normalize() is memoised for the inbound callback path, where the same few
+senders reply again and again. normalize_many() handles broadcast and
+import lists: it cleans the whole list in one str.translate pass over a
+joined buffer, validates with a single compiled pattern mapped in C, and
+dedupes while keeping the first occurrence order.
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+KENYA_CODE = '254'
+
+CACHE_SIZE = 65536
+
+# Formatting characters people and spreadsheets put in numbers
+_STRIP = str.maketrans('', '', ' \t\r\u00a0-.()/')
+
+_PATTERN = re.compile(r'''
+    (?:\+|00)?254(?P<ke>[1-9]\d{8})             # Kenya with country code
+  | 0(?P<national>[1-9]\d{8})                   # Kenya national format
+  | (?P<mobile>[17]\d{8})                       # Kenya mobile without trunk 0
+  | (?:\+|00)(?!254)(?P<intl>[1-9]\d{6,14})     # Other countries
+''', re.VERBOSE)
+
+
+class InvalidPhoneNumber(ValueError):
+    """Raised for input that is not a valid phone number"""
+
+
+BatchResult = namedtuple('BatchResult', ['valid', 'invalid', 'duplicates'])
+
+
+def _to_e164(match):
+    ke, national, mobile, intl = match.groups()
+    if intl:
+        return '+' + intl
+    return '+' + KENYA_CODE + (ke or national or mobile)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize(phone):
+    """
+    Normalise a phone number to E.164 (+254712345678)
+
+    Raises:
+        InvalidPhoneNumber: if phone is not a valid number
+    """
+    match = _PATTERN.fullmatch(str(phone).translate(_STRIP))
+    if match is None:
+        raise InvalidPhoneNumber(f"Invalid phone number: {phone!r}")
+    return _to_e164(match)
+
+
+def is_valid(phone):
+    """Whether phone can be normalised"""
+    try:
+        normalize(phone)
+    except InvalidPhoneNumber:
+        return False
+    return True
+
+
+def normalize_many(phones):
+    """
+    Normalise, validate and dedupe a list of phone numbers
+
+    Returns:
+        BatchResult of valid E.164 numbers (unique, in first-seen order),
+        the invalid inputs as given, and the number of duplicates dropped
+    """
+    phones = [str(phone) for phone in phones]
+    if not phones:
+        return BatchResult([], [], 0)
+
+    buffer = '\n'.join(phones)
+    if buffer.count('\n') == len(phones) - 1:
+        cleaned = buffer.translate(_STRIP).split('\n')
+    else:
+        # An input contains a newline itself; clean one by one
+        cleaned = [phone.replace('\n', '').translate(_STRIP) for phone in phones]
+
+    valid = []
+    invalid = []
+    for phone, match in zip(phones, map(_PATTERN.fullmatch, cleaned)):
+        if match is None:
+            invalid.append(phone)
+        else:
+            valid.append(_to_e164(match))
+
+    unique = list(dict.fromkeys(valid))
+    return BatchResult(unique, invalid, len(valid) - len(unique))
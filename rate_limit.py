@@ -0,0 +1,269 @@
+"""Per-number rate limiting for inbound SMS, and failed conductor logins
+
+Sits in front of the /sms/callback handlers so one phone sending a flood
+of texts can't turn each of them into queries, log rows and paid replies:
+
+    flood        more than RATE_LIMIT_MESSAGES texts within
+                 RATE_LIMIT_WINDOW_SECONDS (sliding window): the extra
+                 texts are dropped before touching the database
+    duplicate    the same text from the same number again within
+                 RATE_LIMIT_DUPLICATE_SECONDS, or a provider retry of a
+                 message id already seen: coalesced into the first one
+    error reply  each of the "invalid stop" / "didn't understand" /
+                 "opt in first" replies is sent at most once per number
+                 every RATE_LIMIT_ERROR_REPLY_SECONDS (a different error
+                 still gets its reply)
+
+Opt-outs (STOP and the other opt-out words, see sms_routes.py) are never
+limited or dropped, only their confirmation is sent at most once per
+RATE_LIMIT_ERROR_REPLY_SECONDS, like an error reply.
+
+Dropped callbacks still get a 200, so AfricasTalking doesn't retry them.
+A message whose handling fails (500) has its duplicate markers cleared,
+so the provider's retry of it is handled.
+
+Conductor logins are unauthenticated and each check costs a full scrypt,
+so failed ones are counted too: after RATE_LIMIT_LOGIN_FAILURES failures
+for a username, or RATE_LIMIT_LOGIN_IP_FAILURES from one address, within
+RATE_LIMIT_LOGIN_WINDOW_SECONDS, further password checks for it are
+refused with 429 (see conductor_auth.verify_credentials).
+
+Counters live in the worker (an LRU of RATE_LIMIT_MAX_KEYS numbers), so
+with several workers the effective limit is per worker. Set
+RATE_LIMIT_REDIS_URL (and `pip install redis`) to share them across
+workers and machines.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMITED = 'rate_limited'
+DUPLICATE = 'duplicate'
+
+
+class MemoryBackend:
+    """In-process counters, bounded to the most recently seen max_keys"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._counters = OrderedDict()  # key -> [bucket, current, previous]
+        self._markers = OrderedDict()   # key -> expiry
+        self._lock = threading.Lock()
+
+    def _evict(self, entries):
+        while len(entries) > self.max_keys:
+            entries.popitem(last=False)
+
+    def hit(self, key, window, now):
+        """Count a hit; returns (current, previous) bucket counts"""
+        bucket = int(now // window)
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None:
+                entry = self._counters[key] = [bucket, 0, 0]
+            else:
+                self._counters.move_to_end(key)
+            if entry[0] != bucket:
+                entry[2] = entry[1] if entry[0] == bucket - 1 else 0
+                entry[0], entry[1] = bucket, 0
+            entry[1] += 1
+            self._evict(self._counters)
+            return entry[1], entry[2]
+
+    def peek(self, key, window, now):
+        """(current, previous) bucket counts without counting a hit"""
+        bucket = int(now // window)
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None or entry[0] < bucket - 1:
+                return 0, 0
+            if entry[0] == bucket - 1:
+                return 0, entry[1]
+            return entry[1], entry[2]
+
+    def add_once(self, key, ttl, now):
+        """Set a marker for ttl seconds; False if it was already set"""
+        with self._lock:
+            expiry = self._markers.get(key)
+            if expiry is not None and expiry > now:
+                return False
+            self._markers[key] = now + ttl
+            self._markers.move_to_end(key)
+            self._evict(self._markers)
+            return True
+
+    def discard(self, *keys):
+        """Clear markers set by add_once"""
+        with self._lock:
+            for key in keys:
+                self._markers.pop(key, None)
+
+
+class RedisBackend:
+    """Counters shared by all workers through Redis"""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def hit(self, key, window, now):
+        bucket = int(now // window)
+        current_key = f'rl:{key}:{bucket}'
+        pipe = self.client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, math.ceil(window * 2))
+        pipe.get(f'rl:{key}:{bucket - 1}')
+        current, _, previous = pipe.execute()
+        return int(current), int(previous or 0)
+
+    def peek(self, key, window, now):
+        bucket = int(now // window)
+        current, previous = self.client.mget(f'rl:{key}:{bucket}', f'rl:{key}:{bucket - 1}')
+        return int(current or 0), int(previous or 0)
+
+    def add_once(self, key, ttl, now):
+        return bool(self.client.set(f'rl:once:{key}', 1, nx=True, ex=max(math.ceil(ttl), 1)))
+
+    def discard(self, *keys):
+        self.client.delete(*(f'rl:once:{key}' for key in keys))
+
+
+class RateLimiter:
+    """Sliding-window limits per phone number"""
+
+    def __init__(self, backend, limit=10, window=60, duplicate_window=5, error_reply_window=60,
+                 login_failures=5, login_ip_failures=20, login_window=900):
+        self.backend = backend
+        self.limit = limit
+        self.window = window
+        self.duplicate_window = duplicate_window
+        self.error_reply_window = error_reply_window
+        self.login_failures = login_failures
+        self.login_ip_failures = login_ip_failures
+        self.login_window = login_window
+
+    def _count(self, key, now, window=None, hit=True):
+        # Sliding window approximated from the current and previous fixed buckets
+        window = window or self.window
+        current, previous = (self.backend.hit if hit else self.backend.peek)(key, window, now)
+        elapsed = (now % window) / window
+        return current + previous * (1 - elapsed)
+
+    def check_inbound(self, phone_number, text, message_id=None, shortcode=None):
+        """
+        Decide whether an inbound message should be handled
+
+        The same text to a different shortcode (tenant) is not a duplicate.
+
+        Returns:
+            None to handle it, or the reason it should be dropped
+            (RATE_LIMITED or DUPLICATE)
+        """
+        now = time.time()
+        try:
+            if message_id and not self.backend.add_once(f'id:{message_id}', self.window, now):
+                return DUPLICATE
+            if self.duplicate_window and not self.backend.add_once(
+                self._text_key(phone_number, text, shortcode), self.duplicate_window, now
+            ):
+                return DUPLICATE
+
+            count = self._count(f'in:{phone_number}', now)
+        except Exception as e:
+            # Fail open: a broken shared backend must not stop all inbound SMS
+            logger.error("❌ Rate limiter unavailable, not limiting: %s", e)
+            return None
+
+        if count > self.limit:
+            if count < self.limit + 2:
+                logger.warning("🚦 %s exceeded %d messages per %ss, dropping", phone_number, self.limit, self.window)
+            return RATE_LIMITED
+        return None
+
+    def _text_key(self, phone_number, text, shortcode):
+        return f'text:{phone_number}:{shortcode or ""}:{text.strip().lower()}'
+
+    def forget_inbound(self, phone_number, text, message_id=None, shortcode=None):
+        """
+        Undo check_inbound's duplicate markers for a message that could not
+        be handled, so the provider's retry of it is handled instead of
+        being dropped as a duplicate
+        """
+        keys = [self._text_key(phone_number, text, shortcode)]
+        if message_id:
+            keys.append(f'id:{message_id}')
+        try:
+            self.backend.discard(*keys)
+        except Exception as e:
+            logger.error("❌ Rate limiter unavailable, retry may be dropped: %s", e)
+
+    def _login_limits(self, username, address):
+        return ((f'login:user:{username.lower()}', self.login_failures),
+                (f'login:ip:{address}', self.login_ip_failures))
+
+    def allow_login(self, username, address):
+        """Whether a password may be checked for username from address now"""
+        now = time.time()
+        try:
+            return all(self._count(key, now, self.login_window, hit=False) < limit
+                       for key, limit in self._login_limits(username, address))
+        except Exception as e:
+            logger.error("❌ Rate limiter unavailable, not limiting: %s", e)
+            return True
+
+    def login_failed(self, username, address):
+        """Count a failed login against the username and the address"""
+        now = time.time()
+        try:
+            for key, limit in self._login_limits(username, address):
+                if self._count(key, now, self.login_window) == limit:
+                    logger.warning("🚦 %s: %d failed logins in %ss, refusing more",
+                                   key.split(':', 1)[1], limit, self.login_window)
+        except Exception as e:
+            logger.error("❌ Rate limiter unavailable, not limiting: %s", e)
+
+    def allow_error_reply(self, phone_number, template):
+        """Whether this number may get the error reply template again now"""
+        try:
+            return self.backend.add_once(f'err:{phone_number}:{template}', self.error_reply_window, time.time())
+        except Exception as e:
+            logger.error("❌ Rate limiter unavailable, not limiting: %s", e)
+            return True
+
+
+def get_limiter():
+    """The current app's rate limiter, or None if it is disabled"""
+    return current_app.extensions.get('rate_limiter')
+
+
+def init_app(app):
+    """Create the rate limiter unless RATE_LIMIT_ENABLED is false"""
+    if not app.config.get('RATE_LIMIT_ENABLED'):
+        return
+
+    backend = None
+    redis_url = app.config.get('RATE_LIMIT_REDIS_URL')
+    if redis_url:
+        try:
+            backend = RedisBackend(redis_url)
+        except ImportError:
+            logger.warning("⚠️  redis not installed: rate limits are per worker")
+    if backend is None:
+        backend = MemoryBackend(app.config.get('RATE_LIMIT_MAX_KEYS', 100000))
+
+    app.extensions['rate_limiter'] = RateLimiter(
+        backend,
+        limit=app.config.get('RATE_LIMIT_MESSAGES', 10),
+        window=app.config.get('RATE_LIMIT_WINDOW_SECONDS', 60),
+        duplicate_window=app.config.get('RATE_LIMIT_DUPLICATE_SECONDS', 5),
+        error_reply_window=app.config.get('RATE_LIMIT_ERROR_REPLY_SECONDS', 60),
+        login_failures=app.config.get('RATE_LIMIT_LOGIN_FAILURES', 5),
+        login_ip_failures=app.config.get('RATE_LIMIT_LOGIN_IP_FAILURES', 20),
+        login_window=app.config.get('RATE_LIMIT_LOGIN_WINDOW_SECONDS', 900)
+    )
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Replay captured /sms/callback traffic against a running instance
+
+Usage:
+    python replay_traffic.py captures/sms_callbacks.*.jsonl* \\
+        --url http://localhost:5000 --speed 5
+
+Each worker writes its own capture file (see traffic_capture.py); give
+them all and the records are merged by timestamp.
+
+--speed 1 keeps the original timing, 5 replays five times faster and 0
+sends as fast as the workers allow. The target must run with the
+AfricasTalking sandbox (AT_USERNAME=sandbox): replay checks its /api and
+refuses to start otherwise, since every reply it triggers would be a
+real send.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def load_capture(paths):
+    """Read capture records from JSONL files, sorted by timestamp"""
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    records.sort(key=lambda record: record['ts'])
+    return records
+
+
+def provider_mode(base_url, timeout=10):
+    """The target's SMS provider mode ('sandbox' or 'live') from its /api, or None"""
+    try:
+        with urllib.request.urlopen(base_url.rstrip('/') + '/api', timeout=timeout) as response:
+            return json.load(response).get('sms_provider')
+    except Exception:
+        return None
+
+
+def post(url, data, timeout):
+    body = urllib.parse.urlencode(data).encode()
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body), timeout=timeout) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = None
+    return status, time.perf_counter() - start
+
+
+def replay(records, base_url, speed=1.0, workers=32, timeout=30):
+    """Re-drive captured requests, preserving their relative timing / speed"""
+    results = []
+    lock = threading.Lock()
+
+    def send(record):
+        status, latency = post(base_url.rstrip('/') + record.get('path', '/sms/callback'),
+                               record['data'], timeout)
+        with lock:
+            results.append((status, latency))
+
+    first_ts = records[0]['ts']
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for record in records:
+            if speed:
+                due = (record['ts'] - first_ts) / speed
+                delay = due - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(send, record)
+
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for _, latency in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    return {
+        'requests': len(results),
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(len(results) / elapsed, 1) if elapsed else None,
+        'original_seconds': round(records[-1]['ts'] - first_ts, 2),
+        'statuses': statuses,
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+        'p99_ms': round(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured SMS callback traffic')
+    parser.add_argument('files', nargs='+', help='Capture JSONL files (rotated files may be given together)')
+    parser.add_argument('--url', default='http://localhost:5000', help='Base URL of the instance to drive')
+    parser.add_argument('--speed', type=float, default=1.0, help='Speed multiplier (0 = as fast as possible)')
+    parser.add_argument('--workers', type=int, default=32, help='Concurrent requests in flight')
+    parser.add_argument('--limit', type=int, help='Only replay the first N records')
+    args = parser.parse_args()
+
+    mode = provider_mode(args.url)
+    if mode != 'sandbox':
+        print(f"❌ {args.url} sends through the {mode or 'unknown'} SMS provider; "
+              f"replay only runs against an AT_USERNAME=sandbox instance", file=sys.stderr)
+        sys.exit(1)
+
+    records = load_capture(args.files)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("No records to replay")
+        sys.exit(1)
+
+    print(f"🔁 Replaying {len(records)} callbacks against {args.url} at {args.speed or 'max'}x", file=sys.stderr)
+    print(json.dumps(replay(records, args.url, args.speed, args.workers)))
+
+
+if __name__ == '__main__':
+    main()
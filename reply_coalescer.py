@@ -0,0 +1,144 @@
+"""Micro-batched coalescing of identical outbound replies
+
+Opt-in with REPLY_COALESCE_ENABLED=true. Replies to inbound messages (sent
+after their unit of work commits, see unit_of_work.py) are handed to a
+per-worker flusher thread instead of going straight to AfricasTalking.
+The flusher holds them for REPLY_COALESCE_WINDOW_MS after the first one
+arrives, groups them by identical text (and sender ID, which differs per
+tenant) and sends each group as one
+multi-recipient call (up to REPLY_COALESCE_MAX_RECIPIENTS per call).
+
+Right after a broadcast hundreds of riders get the same "Thank you for
+opting in" or "Confirmed! ... Ngara" within seconds, so this turns
+hundreds of provider requests into a handful. A reply is never held for
+more than the window plus one flush.
+
+The request does not wait for its reply to be sent. Its outgoing log rows
+are already committed as 'sent' and are marked failed if the group's call
+fails. Replies still queued when a worker exits are flushed at exit.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from flask import current_app
+from metrics import REPLY_BATCH_RECIPIENTS, REPLIES_COALESCED
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class ReplyCoalescer:
+    """Per-worker reply queue flushed by a background thread"""
+
+    def __init__(self, app, send, window=0.2, max_recipients=1000):
+        """
+        Args:
+            app: Flask app, for the flusher's app context
+            send: Callable(recipients, message, log_ids, sender_id) that
+                sends one group and records failures (SMSService.send_logged)
+            window: Seconds to hold the first reply of a batch
+            max_recipients: Most recipients per provider call
+        """
+        self.app = app
+        self.send = send
+        self.window = window
+        self.max_recipients = max_recipients
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, recipients, message, log_ids, sender_id=None):
+        """Queue a reply; it is sent within the window"""
+        self._ensure_started()
+        self._queue.put((recipients, message, log_ids, sender_id))
+
+    def _ensure_started(self):
+        # Started on first use, so it runs in the worker and not the preloading master
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='reply-coalescer', daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        """Send what is queued and stop the flusher thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(30)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            stopping = False
+
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    reply = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if reply is _STOP:
+                    stopping = True
+                    break
+                batch.append(reply)
+
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch):
+        # (sender ID, message) -> {recipient: [log ids]}, keeping arrival order
+        groups = {}
+        for recipients, message, log_ids, sender_id in batch:
+            group = groups.setdefault((sender_id, message), {})
+            for recipient, log_id in zip(recipients, log_ids):
+                group.setdefault(recipient, []).append(log_id)
+
+        calls = 0
+        with self.app.app_context():
+            for (sender_id, message), group in groups.items():
+                recipients = list(group)
+                for i in range(0, len(recipients), self.max_recipients):
+                    chunk = recipients[i:i + self.max_recipients]
+                    log_ids = [log_id for recipient in chunk for log_id in group[recipient]]
+                    try:
+                        self.send(chunk, message, log_ids, sender_id)
+                    except Exception as e:
+                        logger.error("❌ Coalesced reply to %d recipient(s) failed: %s", len(chunk), e, exc_info=True)
+                    REPLY_BATCH_RECIPIENTS.observe(len(chunk))
+                    calls += 1
+
+        if len(batch) > calls:
+            REPLIES_COALESCED.inc(len(batch) - calls)
+            logger.debug("📦 Coalesced %d replies into %d provider call(s)", len(batch), calls)
+
+
+def get_coalescer():
+    """The current app's reply coalescer, or None if it is disabled"""
+    return current_app.extensions.get('reply_coalescer')
+
+
+def init_app(app, send):
+    """Create the reply coalescer if REPLY_COALESCE_ENABLED is set"""
+    if not app.config.get('REPLY_COALESCE_ENABLED'):
+        return
+
+    coalescer = ReplyCoalescer(
+        app,
+        send,
+        window=app.config.get('REPLY_COALESCE_WINDOW_MS', 200) / 1000,
+        max_recipients=app.config.get('REPLY_COALESCE_MAX_RECIPIENTS', 1000)
+    )
+    app.extensions['reply_coalescer'] = coalescer
+    atexit.register(coalescer.stop)
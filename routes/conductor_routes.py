@@ -1,14 +1,24 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, g
 from functools import wraps
-from models import db, Passenger, ConductorMessage, PassengerResponse
+from datetime import datetime, timezone
+from models import db, Passenger, ConductorMessage, PassengerResponse, ScheduledBroadcast, Segment, SuppressedNumber
 from sms_service import sms_service
+from broadcast_service import broadcast_service
+from scheduler import parse_recurrence
+from segments import SegmentError, resolve_definition, segment_recipients, segment_count
+from db_routing import read_replica
+from passenger_import import import_csv
+from suppression import suppression_list, MANUAL, OPT_OUT, REASONS
+import phone_numbers
+import conductor_auth
+import http_cache
+import tenancy
+import io
 
 conductor_bp = Blueprint('conductor', __name__)
 
-def check_auth(username, password):
-    """Verify conductor credentials"""
-    return (username == current_app.config['CONDUCTOR_USERNAME'] and 
-            password == current_app.config['CONDUCTOR_PASSWORD'])
+# Every GET gets an ETag and answers If-None-Match with 304 (see http_cache.py)
+conductor_bp.after_request(http_cache.add_validators)
 
 def authenticate():
     """Send 401 response for failed authentication"""
@@ -17,22 +27,138 @@ def authenticate():
     response.headers['WWW-Authenticate'] = 'Basic realm="Nazigi Stamford Bus - Conductor Login"'
     return response
 
+def login_throttled(e):
+    """Send 429 response when too many logins failed (see rate_limit.py)"""
+    from flask import make_response
+    response = make_response(jsonify({'error': str(e)}), 429)
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def current_principal():
+    """Conductor for the request's Bearer token or Basic credentials, or None"""
+    auth = request.authorization
+    if not auth:
+        return None
+    if auth.type == 'bearer':
+        return conductor_auth.verify_token(auth.token)
+    return conductor_auth.verify_credentials(auth.username, auth.password, request.remote_addr)
+
+def conductor_tenant(principal):
+    """
+    Tenant a conductor request acts for, or None if it may not
+    
+    Conductors tied to a tenant always act for it. Others choose one with
+    the X-Tenant header or ?tenant= (a tenant slug), or get the default.
+    """
+    requested = request.headers.get('X-Tenant') or request.args.get('tenant')
+    if principal.tenant_id is not None:
+        tenant = tenancy.tenant_directory.get(principal.tenant_id)
+        if tenant is None or (requested and requested != tenant.slug):
+            return None
+        return tenant
+    if requested:
+        return tenancy.tenant_directory.by_slug(requested)
+    return tenancy.tenant_directory.default()
+
 def requires_auth(f):
-    """Decorator for routes that require authentication"""
+    """Decorator for routes that require authentication; sets g.conductor and g.tenant"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth = request.authorization
-        if not auth or not check_auth(auth.username, auth.password):
+        try:
+            principal = current_principal()
+        except conductor_auth.LoginThrottled as e:
+            return login_throttled(e)
+        if principal is None:
             return authenticate()
+        tenant = conductor_tenant(principal)
+        if tenant is None:
+            return jsonify({'error': 'Unknown tenant, or not allowed for this conductor'}), 403
+        if not tenant.active:
+            return jsonify({'error': f'Tenant {tenant.slug} is disabled'}), 403
+        g.conductor = principal
+        g.tenant = tenant
         return f(*args, **kwargs)
     return decorated
 
+def get_target_recipients(data):
+    """Resolve the broadcast audience from request JSON (None means all opted-in)"""
+    if data.get('segment_id') is None and data.get('segment') is None:
+        return None
+    return segment_recipients(g.tenant.id, resolve_definition(g.tenant.id, data.get('segment_id'), data.get('segment')))
+
+def get_tenant_message(message_id):
+    """One of the current tenant's conductor messages, or None"""
+    return ConductorMessage.query.filter_by(id=message_id, tenant_id=g.tenant.id).first()
+
+def passengers_version():
+    """Version of the tenant's passenger list for conditional GETs (updated_at changes on every transition)"""
+    count, last_updated = db.session.query(
+        db.func.count(Passenger.id), db.func.max(Passenger.updated_at)
+    ).filter(Passenger.tenant_id == g.tenant.id).one()
+    return (count, last_updated), last_updated
+
+def responses_version():
+    """Version of the responses listed by get_responses (responses are only ever added)"""
+    query = db.session.query(
+        db.func.count(PassengerResponse.id), db.func.max(PassengerResponse.id), db.func.max(PassengerResponse.responded_at)
+    ).filter(PassengerResponse.tenant_id == g.tenant.id)
+    message_id = request.args.get('message_id', type=int)
+    if message_id:
+        query = query.filter(PassengerResponse.message_id == message_id)
+    count, last_id, last_responded = query.one()
+    return (count, last_id), last_responded
+
+@conductor_bp.route('/conductor/login', methods=['POST'])
+def login():
+    """
+    Exchange credentials for a session token
+    Accepts Basic auth or JSON: {"username": "...", "password": "..."}
+    Send the token as "Authorization: Bearer <token>" on later calls.
+    """
+    auth = request.authorization
+    if auth and auth.type == 'basic':
+        username, password = auth.username, auth.password
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            data = {}
+        username, password = data.get('username'), data.get('password')
+        if not isinstance(username, str) or not isinstance(password, str):
+            return jsonify({'error': 'username and password must be strings'}), 400
+
+    try:
+        principal = conductor_auth.verify_credentials(username, password, request.remote_addr)
+    except conductor_auth.LoginThrottled as e:
+        return login_throttled(e)
+    if principal is None:
+        return jsonify({'error': 'Invalid credentials'}), 401
+
+    tenant = tenancy.tenant_directory.get(principal.tenant_id) if principal.tenant_id is not None else None
+
+    return jsonify({
+        'token': conductor_auth.issue_token(principal),
+        'token_type': 'Bearer',
+        'expires_in': current_app.config['CONDUCTOR_SESSION_SECONDS'],
+        'username': principal.username,
+        'tenant': tenant.slug if tenant else None
+    })
+
+@conductor_bp.route('/conductor/logout', methods=['POST'])
+@requires_auth
+def logout():
+    """Revoke every session token of the logged-in conductor"""
+    if g.conductor.id is not None:
+        conductor_auth.revoke_sessions(g.conductor.id)
+        db.session.commit()
+    return jsonify({'status': 'success'})
+
 @conductor_bp.route('/conductor/send-message', methods=['POST'])
 @requires_auth
 def send_message():
     """
-    Send bulk message to all opted-in passengers
+    Send bulk message to all of the tenant's opted-in passengers
     Expects JSON: {"message": "Your message text"}
+    Optional "segment_id" or inline "segment" narrows the audience.
     """
     try:
         data = request.get_json()
@@ -42,41 +168,23 @@ def send_message():
         
         message_text = data['message']
         
-        # Get all opted-in passengers
-        opted_in_passengers = Passenger.query.filter_by(opted_in=True).all()
+        # Send to the target segment (or all opted-in passengers) with the stop list appended
+        recipients = get_target_recipients(data)
+        conductor_msg, response = broadcast_service.send(message_text, include_stops=True, recipients=recipients)
         
-        if not opted_in_passengers:
+        if not conductor_msg:
             return jsonify({'error': 'No opted-in passengers found'}), 404
         
-        # Prepare recipients list
-        recipients = [p.phone_number for p in opted_in_passengers]
-        
-        # Format message with stops
-        stops = current_app.config['BUS_STOPS']
-        full_message = f"{message_text}\n\nAvailable stops:\n"
-        for idx, stop in enumerate(stops, 1):
-            full_message += f"{idx}. {stop}\n"
-        full_message += "\nReply with the number or name of your preferred stop."
-        
-        # Send bulk SMS
-        response = sms_service.send_bulk_sms(recipients, full_message)
-        
-        # Save conductor message
-        conductor_msg = ConductorMessage(
-            message_text=message_text,
-            recipients_count=len(recipients)
-        )
-        db.session.add(conductor_msg)
-        db.session.commit()
-        
         return jsonify({
             'status': 'success',
             'message': 'Bulk SMS sent successfully',
-            'recipients_count': len(recipients),
+            'recipients_count': conductor_msg.recipients_count,
             'message_id': conductor_msg.id,
             'at_response': response
         })
         
+    except SegmentError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Error sending conductor message: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -87,6 +195,7 @@ def send_custom_message():
     """
     Send custom message without stop options
     Expects JSON: {"message": "Your message text"}
+    Optional "segment_id" or inline "segment" narrows the audience.
     """
     try:
         data = request.get_json()
@@ -96,43 +205,315 @@ def send_custom_message():
         
         message_text = data['message']
         
-        # Get all opted-in passengers
-        opted_in_passengers = Passenger.query.filter_by(opted_in=True).all()
+        # Send to the target segment (or all opted-in passengers) without stop options
+        recipients = get_target_recipients(data)
+        conductor_msg, response = broadcast_service.send(message_text, include_stops=False, recipients=recipients)
         
-        if not opted_in_passengers:
+        if not conductor_msg:
             return jsonify({'error': 'No opted-in passengers found'}), 404
         
-        # Prepare recipients list
-        recipients = [p.phone_number for p in opted_in_passengers]
-        
-        # Send bulk SMS
-        response = sms_service.send_bulk_sms(recipients, message_text)
-        
-        # Save conductor message
-        conductor_msg = ConductorMessage(
-            message_text=message_text,
-            recipients_count=len(recipients)
-        )
-        db.session.add(conductor_msg)
-        db.session.commit()
-        
         return jsonify({
             'status': 'success',
             'message': 'Custom message sent successfully',
-            'recipients_count': len(recipients),
+            'recipients_count': conductor_msg.recipients_count,
             'message_id': conductor_msg.id
         })
         
+    except SegmentError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Error sending custom message: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@conductor_bp.route('/conductor/send-personalised', methods=['POST'])
+@requires_auth
+def send_personalised_message():
+    """
+    Send a personalised message to opted-in passengers
+    Expects JSON: {"message": "Hi, pickup at {stop}", "recipients": {...}}
+
+    "recipients" is optional and maps phone numbers to template fields;
+    numbers that aren't opted-in passengers of this tenant are skipped.
+    Without it every opted-in passenger gets {phone_number} and {stop}
+    (their most recently selected stop).
+
+    Sent like a broadcast (see BroadcastService.send_personalised). If
+    some provider calls fail the response lists failed_recipients, with
+    status "partial" (200) or "failed" (502).
+    """
+    try:
+        data = request.get_json()
+
+        if not data or 'message' not in data:
+            return jsonify({'error': 'Message text is required'}), 400
+
+        message_text = data['message']
+        recipient_fields = data.get('recipients')
+
+        if recipient_fields is None:
+            latest = db.session.query(
+                PassengerResponse.passenger_id,
+                db.func.max(PassengerResponse.id).label('response_id')
+            ).filter(
+                PassengerResponse.tenant_id == g.tenant.id
+            ).group_by(PassengerResponse.passenger_id).subquery()
+
+            rows = db.session.query(Passenger.phone_number, PassengerResponse.selected_stop).outerjoin(
+                latest, latest.c.passenger_id == Passenger.id
+            ).outerjoin(
+                PassengerResponse, PassengerResponse.id == latest.c.response_id
+            ).filter(Passenger.tenant_id == g.tenant.id, Passenger.opted_in == True).all()
+
+            recipient_fields = {
+                phone: {'phone_number': phone, 'stop': stop or 'your usual stop'}
+                for phone, stop in rows
+            }
+        elif not isinstance(recipient_fields, dict):
+            return jsonify({'error': 'recipients must map phone numbers to template fields'}), 400
+        else:
+            # Only this tenant's opted-in passengers, however the numbers were written
+            requested = {}
+            for phone, fields in recipient_fields.items():
+                try:
+                    requested.setdefault(phone_numbers.normalize(phone), fields)
+                except phone_numbers.InvalidPhoneNumber:
+                    continue
+            allowed = {phone for (phone,) in db.session.query(Passenger.phone_number).filter(
+                Passenger.tenant_id == g.tenant.id,
+                Passenger.opted_in == True,
+                Passenger.phone_number.in_(list(requested))
+            )} if requested else set()
+            recipient_fields = {phone: fields for phone, fields in requested.items() if phone in allowed}
+
+        if not recipient_fields:
+            return jsonify({'error': 'No opted-in passengers found'}), 404
+
+        try:
+            groups = sms_service.render_personalised(message_text, recipient_fields)
+        except KeyError as e:
+            return jsonify({'error': f'Missing template field: {e}'}), 400
+        except (ValueError, IndexError, AttributeError) as e:
+            # Stray { or }, positional {} fields and bad {field.attr} / {field[i]} lookups
+            return jsonify({'error': f'Invalid message template: {e}'}), 400
+
+        conductor_msg, response = broadcast_service.send_personalised(message_text, groups)
+
+        if not conductor_msg:
+            return jsonify({'error': 'No opted-in passengers found'}), 404
+
+        result = {
+            'status': 'success' if conductor_msg.status == 'sent' else conductor_msg.status,
+            'message': 'Personalised message sent successfully',
+            'recipients_count': conductor_msg.recipients_count,
+            'message_id': conductor_msg.id,
+            'at_response': response
+        }
+        if conductor_msg.status == 'sent':
+            return jsonify(result)
+
+        # Failed chunks can be retried with /conductor/messages/<id>/resume
+        result['failed_recipients'] = broadcast_service.failed_recipients(conductor_msg)
+        if conductor_msg.status == 'partial':
+            result['message'] = 'Personalised message partly sent'
+            return jsonify(result)
+        result['error'] = 'Personalised message could not be sent'
+        return jsonify(result), 502
+
+    except Exception as e:
+        current_app.logger.error(f"Error sending personalised message: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def serialize_scheduled(job):
+    """Convert a scheduled broadcast to JSON-friendly dict"""
+    return {
+        'id': job.id,
+        'message_text': job.message_text,
+        'include_stops': job.include_stops,
+        'run_at': job.run_at.isoformat(),
+        'recurrence': job.recurrence,
+        'spread_seconds': job.spread_seconds,
+        'segment_id': job.segment_id,
+        'status': job.status,
+        'conductor_message_id': job.conductor_message_id,
+        'run_count': job.run_count,
+        'last_run_at': job.last_run_at.isoformat() if job.last_run_at else None,
+        'last_error': job.last_error
+    }
+
+@conductor_bp.route('/conductor/schedule', methods=['POST'])
+@requires_auth
+def schedule_message():
+    """
+    Schedule a broadcast for later, optionally on repeat
+    Expects JSON: {"message": "...", "run_at": "2025-11-20T06:30:00",
+                   "recurrence": "weekdays", "include_stops": true,
+                   "spread_seconds": 300, "segment_id": 3}
+    run_at without an offset is taken as UTC.
+    """
+    try:
+        data = request.get_json()
+
+        if not data or 'message' not in data or 'run_at' not in data:
+            return jsonify({'error': 'Message text and run_at are required'}), 400
+
+        try:
+            run_at = datetime.fromisoformat(data['run_at'])
+            if run_at.tzinfo:
+                run_at = run_at.astimezone(timezone.utc).replace(tzinfo=None)
+            recurrence = parse_recurrence(data.get('recurrence'))
+            spread_seconds = int(data.get('spread_seconds', current_app.config['BROADCAST_SPREAD_SECONDS']))
+            segment_id = data.get('segment_id')
+            if segment_id is not None:
+                resolve_definition(g.tenant.id, segment_id=segment_id)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+
+        job = ScheduledBroadcast(
+            tenant_id=g.tenant.id,
+            message_text=data['message'],
+            include_stops=bool(data.get('include_stops', True)),
+            run_at=run_at,
+            recurrence=recurrence,
+            spread_seconds=max(spread_seconds, 0),
+            segment_id=segment_id
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        return jsonify({'status': 'success', 'scheduled': serialize_scheduled(job)}), 201
+
+    except Exception as e:
+        current_app.logger.error(f"Error scheduling message: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@conductor_bp.route('/conductor/scheduled', methods=['GET'])
+@requires_auth
+def get_scheduled():
+    """Get pending and recent scheduled broadcasts"""
+    try:
+        jobs = ScheduledBroadcast.query.filter_by(tenant_id=g.tenant.id).order_by(
+            ScheduledBroadcast.run_at.desc()
+        ).limit(100).all()
+
+        return jsonify({
+            'total_scheduled': len(jobs),
+            'scheduled': [serialize_scheduled(job) for job in jobs]
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"Error getting scheduled messages: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@conductor_bp.route('/conductor/scheduled/<int:job_id>', methods=['DELETE'])
+@requires_auth
+def cancel_scheduled(job_id):
+    """Cancel a scheduled broadcast that has not started yet"""
+    try:
+        # Conditional update so a job a worker has already claimed is left alone
+        updated = ScheduledBroadcast.query.filter_by(
+            id=job_id, tenant_id=g.tenant.id, status='pending'
+        ).update({'status': 'cancelled'})
+        db.session.commit()
+
+        if not updated:
+            job = db.session.get(ScheduledBroadcast, job_id)
+            if not job or job.tenant_id != g.tenant.id:
+                return jsonify({'error': 'Scheduled message not found'}), 404
+            return jsonify({'error': f'Cannot cancel a {job.status} broadcast'}), 409
+
+        return jsonify({'status': 'success', 'message': 'Scheduled message cancelled'})
+
+    except Exception as e:
+        current_app.logger.error(f"Error cancelling scheduled message: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@conductor_bp.route('/conductor/segments', methods=['GET'])
+@requires_auth
+def get_segments():
+    """Get saved segments with their current audience size"""
+    try:
+        segments = Segment.query.filter_by(tenant_id=g.tenant.id).order_by(Segment.name).all()
+
+        return jsonify({
+            'total_segments': len(segments),
+            'segments': [{
+                'id': segment.id,
+                'name': segment.name,
+                'definition': segment.definition,
+                'recipients_count': segment_count(g.tenant.id, segment.definition),
+                'created_at': segment.created_at.isoformat()
+            } for segment in segments]
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"Error getting segments: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@conductor_bp.route('/conductor/segments', methods=['POST'])
+@requires_auth
+def create_segment():
+    """
+    Save a named segment
+    Expects JSON: {"name": "Ngara riders", "definition": {"stop": "Ngara", "days": 7}}
+    """
+    try:
+        data = request.get_json()
+
+        if not data or not data.get('name') or 'definition' not in data:
+            return jsonify({'error': 'Name and definition are required'}), 400
+
+        if Segment.query.filter_by(tenant_id=g.tenant.id, name=data['name']).first():
+            return jsonify({'error': 'A segment with this name already exists'}), 409
+
+        # Validates the definition and previews the audience in one query
+        count = segment_count(g.tenant.id, data['definition'])
+
+        segment = Segment(tenant_id=g.tenant.id, name=data['name'], definition=data['definition'])
+        db.session.add(segment)
+        db.session.commit()
+
+        return jsonify({
+            'status': 'success',
+            'id': segment.id,
+            'recipients_count': count
+        }), 201
+
+    except SegmentError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error creating segment: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@conductor_bp.route('/conductor/segments/preview', methods=['POST'])
+@requires_auth
+@read_replica
+def preview_segment():
+    """
+    Count recipients for a segment before sending
+    Expects JSON: {"segment_id": 3} or {"segment": {...}}
+    """
+    try:
+        data = request.get_json() or {}
+        definition = resolve_definition(g.tenant.id, data.get('segment_id'), data.get('segment'))
+        if definition is None:
+            return jsonify({'error': 'segment_id or segment is required'}), 400
+
+        return jsonify({'recipients_count': segment_count(g.tenant.id, definition)})
+
+    except SegmentError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error previewing segment: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @conductor_bp.route('/conductor/passengers', methods=['GET'])
 @requires_auth
+@read_replica
+@http_cache.conditional(passengers_version)
 def get_passengers():
-    """Get list of all passengers with their opt-in status"""
+    """Get list of the tenant's passengers with their opt-in status"""
     try:
-        passengers = Passenger.query.all()
+        passengers = Passenger.query.filter_by(tenant_id=g.tenant.id).all()
         
         passengers_list = [{
             'id': p.id,
@@ -155,8 +536,117 @@ def get_passengers():
         current_app.logger.error(f"Error getting passengers: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@conductor_bp.route('/conductor/passengers/import', methods=['POST'])
+@requires_auth
+def import_passengers():
+    """
+    Bulk import passengers from a CSV of phone numbers
+    Accepts a multipart upload ("file") or a raw text/csv body.
+    Query: ?opted_in=true to opt new passengers in (existing ones are unchanged)
+
+    For very large files use import_passengers.py instead.
+    """
+    try:
+        upload = request.files.get('file')
+        stream = upload.stream if upload else request.stream
+        opted_in = request.args.get('opted_in', 'false').lower() == 'true'
+
+        def progress(stats):
+            current_app.logger.info(f"📥 Import progress: {stats.as_dict()}")
+
+        stats = import_csv(g.tenant.id, io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''),
+                           opted_in=opted_in, progress=progress)
+
+        return jsonify({'status': 'success', **stats.as_dict()})
+
+    except UnicodeDecodeError:
+        return jsonify({'error': 'File must be UTF-8 CSV'}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error importing passengers: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@conductor_bp.route('/conductor/suppressions', methods=['GET'])
+@requires_auth
+def get_suppressions():
+    """List the most recent suppressed numbers for this tenant (?reason= to filter)"""
+    try:
+        query = SuppressedNumber.query.filter(db.or_(
+            SuppressedNumber.tenant_id.is_(None), SuppressedNumber.tenant_id == g.tenant.id
+        ))
+        reason = request.args.get('reason')
+        if reason:
+            query = query.filter_by(reason=reason)
+
+        entries = query.order_by(SuppressedNumber.id.desc()).limit(100).all()
+
+        return jsonify({
+            'total': query.count(),
+            'suppressions': [{
+                'phone_number': entry.phone_number,
+                'reason': entry.reason,
+                'all_tenants': entry.tenant_id is None,
+                'created_at': entry.created_at.isoformat()
+            } for entry in entries]
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"Error getting suppressions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@conductor_bp.route('/conductor/suppressions', methods=['POST'])
+@requires_auth
+def add_suppression():
+    """
+    Add a number to the do-not-contact list
+    Expects JSON: {"phone_number": "+254712345678", "reason": "manual"}
+    Opt-outs only apply to this tenant, other reasons to every tenant
+    """
+    try:
+        data = request.get_json() or {}
+        reason = data.get('reason', MANUAL)
+        if reason not in REASONS:
+            return jsonify({'error': f'reason must be one of {", ".join(REASONS)}'}), 400
+
+        try:
+            phone = phone_numbers.normalize(data.get('phone_number', ''))
+        except phone_numbers.InvalidPhoneNumber as e:
+            return jsonify({'error': str(e)}), 400
+
+        suppression_list.suppress(phone, reason, tenant_id=g.tenant.id if reason == OPT_OUT else None)
+        db.session.commit()
+
+        return jsonify({'status': 'success', 'phone_number': phone, 'reason': reason}), 201
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error adding suppression: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@conductor_bp.route('/conductor/suppressions/<phone>', methods=['DELETE'])
+@requires_auth
+def remove_suppression(phone):
+    """Remove a number from the do-not-contact list (entries for every tenant and this one)"""
+    try:
+        try:
+            phone = phone_numbers.normalize(phone)
+        except phone_numbers.InvalidPhoneNumber as e:
+            return jsonify({'error': str(e)}), 400
+
+        if not suppression_list.release(phone, tenant_id=g.tenant.id):
+            return jsonify({'error': 'Number is not suppressed'}), 404
+        db.session.commit()
+
+        return jsonify({'status': 'success', 'phone_number': phone})
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error removing suppression: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @conductor_bp.route('/conductor/responses', methods=['GET'])
 @requires_auth
+@read_replica
+@http_cache.conditional(responses_version)
 def get_responses():
     """Get passenger responses to conductor messages"""
     try:
@@ -164,10 +654,10 @@ def get_responses():
         message_id = request.args.get('message_id', type=int)
         
         if message_id:
-            responses = PassengerResponse.query.filter_by(message_id=message_id).all()
+            responses = PassengerResponse.query.filter_by(tenant_id=g.tenant.id, message_id=message_id).all()
         else:
             # Get recent responses (last 100)
-            responses = PassengerResponse.query.order_by(
+            responses = PassengerResponse.query.filter_by(tenant_id=g.tenant.id).order_by(
                 PassengerResponse.responded_at.desc()
             ).limit(100).all()
         
@@ -198,10 +688,11 @@ def get_responses():
 
 @conductor_bp.route('/conductor/messages', methods=['GET'])
 @requires_auth
+@read_replica
 def get_messages():
     """Get history of conductor messages"""
     try:
-        messages = ConductorMessage.query.order_by(
+        messages = ConductorMessage.query.filter_by(tenant_id=g.tenant.id).order_by(
             ConductorMessage.sent_at.desc()
         ).limit(50).all()
         
@@ -210,6 +701,7 @@ def get_messages():
             'message_text': m.message_text,
             'recipients_count': m.recipients_count,
             'sent_at': m.sent_at.isoformat(),
+            'status': m.status,
             'responses_count': len(m.responses)
         } for m in messages]
         
@@ -222,6 +714,54 @@ def get_messages():
         current_app.logger.error(f"Error getting messages: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@conductor_bp.route('/conductor/messages/<int:message_id>/progress', methods=['GET'])
+@requires_auth
+def get_message_progress(message_id):
+    """Get delivery progress, throughput and ETA of a broadcast"""
+    try:
+        conductor_msg = get_tenant_message(message_id)
+        if not conductor_msg:
+            return jsonify({'error': 'Message not found'}), 404
+
+        return jsonify(broadcast_service.progress(conductor_msg))
+
+    except Exception as e:
+        current_app.logger.error(f"Error getting message progress: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@conductor_bp.route('/conductor/messages/<int:message_id>/resume', methods=['POST'])
+@requires_auth
+def resume_message(message_id):
+    """
+    Resume an interrupted broadcast from where it stopped
+    Optional JSON: {"retry_failed": true, "retry_in_flight": false}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+
+        conductor_msg = get_tenant_message(message_id)
+        if not conductor_msg:
+            return jsonify({'error': 'Message not found'}), 404
+
+        if not broadcast_service.claim(message_id):
+            return jsonify({'error': 'Broadcast is still sending'}), 409
+
+        conductor_msg, response = broadcast_service.resume(
+            message_id,
+            retry_failed=bool(data.get('retry_failed')),
+            retry_in_flight=bool(data.get('retry_in_flight'))
+        )
+
+        return jsonify({
+            'status': 'success',
+            'progress': broadcast_service.progress(conductor_msg),
+            'at_response': response
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"Error resuming message: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @conductor_bp.route('/conductor/dashboard', methods=['GET'])
 @requires_auth
 def dashboard():
@@ -237,16 +777,18 @@ def dashboard():
 
 @conductor_bp.route('/conductor/api/stats', methods=['GET'])
 @requires_auth
+@read_replica
 def dashboard_stats():
     """Get dashboard statistics as JSON"""
     try:
-        total_passengers = Passenger.query.count()
-        opted_in = Passenger.query.filter_by(opted_in=True).count()
-        total_messages = ConductorMessage.query.count()
-        total_responses = PassengerResponse.query.count()
+        tenant_id = g.tenant.id
+        total_passengers = Passenger.query.filter_by(tenant_id=tenant_id).count()
+        opted_in = Passenger.query.filter_by(tenant_id=tenant_id, opted_in=True).count()
+        total_messages = ConductorMessage.query.filter_by(tenant_id=tenant_id).count()
+        total_responses = PassengerResponse.query.filter_by(tenant_id=tenant_id).count()
         
         # Recent message
-        latest_message = ConductorMessage.query.order_by(
+        latest_message = ConductorMessage.query.filter_by(tenant_id=tenant_id).order_by(
             ConductorMessage.sent_at.desc()
         ).first()
         
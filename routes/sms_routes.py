@@ -1,32 +1,33 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, g
 from models import db, Passenger, ConductorMessage, PassengerResponse
 from sms_service import sms_service
-import re
+from metrics import instrument_handler, INBOUND_DROPPED, ERROR_REPLIES_SKIPPED
+import passenger_state
+import phone_numbers
+import rate_limit
+import suppression
+from suppression import suppression_list
+import tenancy
+import unit_of_work
+from unit_of_work import UnitOfWork
+import logging
+
+logger = logging.getLogger(__name__)
 
 sms_bp = Blueprint('sms', __name__)
 
-def normalize_phone_number(phone):
-    """Normalize phone number format"""
-    # Remove spaces and special characters
-    phone = re.sub(r'[^\d+]', '', phone)
-    
-    # Ensure it starts with country code
-    if phone.startswith('0'):
-        phone = '+254' + phone[1:]
-    elif not phone.startswith('+'):
-        phone = '+' + phone
-        
-    return phone
+# Texts that opt a passenger out; these are never rate limited or dropped
+OPT_OUT_KEYWORDS = ('no', 'n', 'opt out', 'optout', 'stop')
+
+def is_opt_out(text):
+    return text.strip().lower() in OPT_OUT_KEYWORDS
 
 def format_stops_message():
-    """Format bus stops into numbered message"""
-    stops = current_app.config['BUS_STOPS']
-    message = "Please reply with the number of your preferred stop:\n\n"
-    for idx, stop in enumerate(stops, 1):
-        message += f"{idx}. {stop}\n"
-    return message
+    """Format the current tenant's bus stops into numbered message"""
+    return tenancy.render('stop_menu')
 
 @sms_bp.route('/sms/callback', methods=['GET', 'POST'])
+@instrument_handler
 def sms_callback():
     """
     Handle incoming SMS from AfricasTalking
@@ -47,209 +48,256 @@ def sms_callback():
         from_number = request.values.get('from', '')
         text = request.values.get('text', '').strip()
         
-        current_app.logger.info(f"📥 ========== INCOMING SMS ==========")
-        current_app.logger.info(f"📱 From: {from_number}")
-        current_app.logger.info(f"💬 Text: {text}")
-        current_app.logger.info(f"📋 All request data: {dict(request.values)}")
+        logger.info("📥 Incoming SMS from %s: %s", from_number, text)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📋 All request data: %s", dict(request.values))
         
         # Normalize phone number
-        from_number = normalize_phone_number(from_number)
-        current_app.logger.info(f"📞 Normalized number: {from_number}")
-        
-        # Log incoming SMS
-        sms_service.log_incoming_sms(from_number, text)
-        
-        # Check if passenger exists
-        passenger = Passenger.query.filter_by(phone_number=from_number).first()
-        
-        if passenger:
-            current_app.logger.info(f"👤 Passenger found: opted_in={passenger.opted_in}")
-        else:
-            current_app.logger.info(f"👤 New passenger, not in database yet")
-        
-        # Handle opt-in request (TEST2 keyword - case insensitive)
-        # AfricasTalking might send just the keyword or the full message
-        text_lower = text.lower().strip()
-        if text_lower == 'test2' or text_lower.startswith('test2'):
-            current_app.logger.info(f"🎯 Detected keyword: TEST2 - routing to opt-in handler")
-            return handle_opt_in_request(from_number, passenger)
-        
-        # If passenger is NOT opted in yet, treat "1" and "2" as opt-in/opt-out responses
-        if passenger and passenger.opted_in == False:
-            # Handle opt-in confirmation for pending passengers
-            if text.strip() == '1' or text.lower() in ['yes', 'y', 'opt in', 'optin']:
-                current_app.logger.info(f"✅ Pending passenger confirming opt-in - routing to confirmation handler")
-                return handle_opt_in_confirmation(from_number, passenger)
+        try:
+            from_number = phone_numbers.normalize(from_number)
+        except phone_numbers.InvalidPhoneNumber:
+            logger.warning("⚠️ Ignoring SMS from invalid number: %r", from_number)
+            return jsonify({'error': 'Invalid sender number'}), 400
+        logger.debug("📞 Normalized number: %s", from_number)
+        
+        # Floods and duplicates are dropped before they cost a query or a reply,
+        # except opt-outs: the provider won't retry a dropped STOP
+        limiter = rate_limit.get_limiter()
+        if limiter is not None and not is_opt_out(text):
+            reason = limiter.check_inbound(from_number, text, request.values.get('id'), request.values.get('to'))
+            if reason:
+                INBOUND_DROPPED.labels(reason=reason).inc()
+                logger.debug("🚦 Dropped SMS from %s: %s", from_number, reason)
+                return jsonify({'status': 'ignored', 'reason': reason}), 200
+        
+        try:
+            # Shortcode and keyword decide which tenant (sacco/route) this is for
+            g.tenant = tenancy.tenant_directory.route_inbound(request.values.get('to'), from_number, text)
+            logger.debug("🏢 Routed to tenant %s", g.tenant.slug)
             
-            # Handle opt-out for pending passengers
-            elif text.strip() == '2' or text.lower() in ['no', 'n', 'opt out', 'optout', 'stop']:
-                current_app.logger.info(f"🚫 Pending passenger declining - routing to opt-out handler")
-                return handle_opt_out(from_number, passenger)
-        
-        # If passenger IS opted in, handle stop selection and other commands
-        # Handle opt-in confirmation for already registered users
-        if text.lower() in ['yes', 'y', 'opt in', 'optin']:
-            current_app.logger.info(f"✅ Detected opt-in confirmation - routing to confirmation handler")
-            return handle_opt_in_confirmation(from_number, passenger)
-        
-        # Handle opt-out
-        elif text.lower() in ['no', 'n', 'opt out', 'optout', 'stop']:
-            current_app.logger.info(f"🚫 Detected opt-out - routing to opt-out handler")
-            return handle_opt_out(from_number, passenger)
-        
-        # Handle stop selection (number 1-10)
-        elif text.isdigit():
-            current_app.logger.info(f"🔢 Detected numeric input - routing to stop selection handler")
-            return handle_stop_selection(from_number, passenger, int(text))
-        
-        # Handle stop selection by name
-        else:
-            current_app.logger.info(f"📝 Detected text input - routing to stop name handler")
-            return handle_stop_name_selection(from_number, passenger, text)
+            # Everything this message changes is committed once, and replies
+            # are sent only after that commit
+            uow = UnitOfWork()
+            with uow:
+                sms_service.log_incoming_sms(from_number, text)
+                result = route_message(from_number, text)
+                if response_status(result) >= 500:
+                    uow.rollback()
+        except Exception:
+            forget_inbound(limiter, from_number, text)
+            raise
+        
+        if uow.rolled_back:
+            # Handling failed: let the provider's retry through, and keep
+            # a record of what arrived
+            forget_inbound(limiter, from_number, text)
+            sms_service.log_incoming_sms(from_number, text)
+        
+        return result
         
     except Exception as e:
-        current_app.logger.error(f"❌ CRITICAL ERROR in SMS callback: {str(e)}", exc_info=True)
+        logger.error("❌ CRITICAL ERROR in SMS callback: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 500
 
-def handle_opt_in_request(phone_number, passenger):
+def forget_inbound(limiter, from_number, text):
+    """Clear the rate limiter's duplicate markers for a message that failed"""
+    if limiter is not None:
+        limiter.forget_inbound(from_number, text, request.values.get('id'), request.values.get('to'))
+
+def response_status(result):
+    """HTTP status of a view/handler return value"""
+    if isinstance(result, tuple):
+        return result[1]
+    return result.status_code
+
+def send_error_reply(phone_number, template, check_suppression=True):
+    """Send an error reply, unless this number already got the same one within the rate limit window"""
+    limiter = rate_limit.get_limiter()
+    if limiter is not None and not limiter.allow_error_reply(phone_number, template):
+        ERROR_REPLIES_SKIPPED.inc()
+        logger.debug("🚦 Skipping repeated %s reply to %s", template, phone_number)
+        return None
+    return sms_service.send_sms(phone_number, tenancy.render(template), check_suppression=check_suppression)
+
+def route_message(from_number, text):
+    """Dispatch an inbound message to the handler for its keyword and the sender's state"""
+    tenant = tenancy.current()
+    
+    # Check if passenger exists
+    passenger = Passenger.query.filter_by(tenant_id=tenant.id, phone_number=from_number).first()
+    
+    if passenger:
+        logger.debug("👤 Passenger found: opted_in=%s", passenger.opted_in)
+    else:
+        logger.debug("👤 New passenger, not in database yet")
+    
+    # Handle opt-in request (the tenant's keyword, e.g. TEST2 - case insensitive)
+    # AfricasTalking might send just the keyword or the full message
+    if tenant.matches_keyword(text):
+        logger.debug("🎯 Detected keyword: %s - routing to opt-in handler", tenant.keyword.upper())
+        return handle_opt_in_request(from_number)
+    
+    # If passenger is NOT opted in yet, treat "1" and "2" as opt-in/opt-out responses
+    if passenger and passenger.opted_in == False:
+        # Handle opt-in confirmation for pending passengers
+        if text.strip() == '1' or text.lower() in ['yes', 'y', 'opt in', 'optin']:
+            logger.debug("✅ Pending passenger confirming opt-in - routing to confirmation handler")
+            return handle_opt_in_confirmation(from_number)
+        
+        # Handle opt-out for pending passengers
+        elif text.strip() == '2' or is_opt_out(text):
+            logger.debug("🚫 Pending passenger declining - routing to opt-out handler")
+            return handle_opt_out(from_number)
+    
+    # If passenger IS opted in, handle stop selection and other commands
+    # Handle opt-in confirmation for already registered users
+    if text.lower() in ['yes', 'y', 'opt in', 'optin']:
+        logger.debug("✅ Detected opt-in confirmation - routing to confirmation handler")
+        return handle_opt_in_confirmation(from_number)
+    
+    # Handle opt-out
+    elif is_opt_out(text):
+        logger.debug("🚫 Detected opt-out - routing to opt-out handler")
+        return handle_opt_out(from_number)
+    
+    # Handle stop selection (number 1-10)
+    elif text.isdigit():
+        logger.debug("🔢 Detected numeric input - routing to stop selection handler")
+        return handle_stop_selection(from_number, passenger, int(text))
+    
+    # Handle stop selection by name
+    else:
+        logger.debug("📝 Detected text input - routing to stop name handler")
+        return handle_stop_name_selection(from_number, passenger, text)
+
+@instrument_handler
+def handle_opt_in_request(phone_number):
     """Handle initial opt-in request when user sends 'stamford'"""
     try:
-        current_app.logger.info(f"🎯 Processing opt-in request for {phone_number}")
-        
-        if not passenger:
-            # Create new passenger
-            current_app.logger.info(f"👤 Creating new passenger: {phone_number}")
-            passenger = Passenger(phone_number=phone_number, opted_in=False)
-            db.session.add(passenger)
-            db.session.commit()
-        else:
-            current_app.logger.info(f"👤 Existing passenger found: {phone_number}")
+        logger.debug("🎯 Processing opt-in request for %s", phone_number)
+        
+        # Registers new numbers; existing passengers keep their state
+        transition = passenger_state.apply(tenancy.current().id, phone_number, passenger_state.JOIN)
+        if transition.created:
+            logger.info("👤 Created new passenger: %s", phone_number)
+        
+        # Texting the keyword again lifts an earlier opt-out from this tenant
+        suppression_list.release(phone_number, [suppression.OPT_OUT], tenant_id=tenancy.current().id, include_global=False)
         
         # Send opt-in/opt-out question
-        message = ("Welcome to Nazigi Stamford! \n\n"
-                  "Would you like to opt?\n\n"
-                  "Reply:\n"
-                  "1 to Opt In\n"
-                  "2 to Opt Out")
+        message = tenancy.render('opt_in_prompt')
         
-        current_app.logger.info(f"📲 Sending opt-in message to {phone_number}")
+        logger.debug("📲 Sending opt-in message to %s", phone_number)
         response = sms_service.send_sms(phone_number, message)
-        current_app.logger.info(f"📬 Response from send_sms: {response}")
+        logger.debug("📬 Response from send_sms: %s", response)
         
         return jsonify({'status': 'success', 'message': 'Opt-in request sent'}), 200
         
     except Exception as e:
-        current_app.logger.error(f"❌ Error handling opt-in request: {str(e)}", exc_info=True)
+        logger.error("❌ Error handling opt-in request: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 500
 
-def handle_opt_in_confirmation(phone_number, passenger):
+@instrument_handler
+def handle_opt_in_confirmation(phone_number):
     """Handle opt-in confirmation"""
     try:
-        current_app.logger.info(f"✅ Processing opt-in confirmation for {phone_number}")
-        
-        if not passenger:
-            current_app.logger.info(f"👤 Creating new passenger with opt-in: {phone_number}")
-            passenger = Passenger(phone_number=phone_number, opted_in=True)
-            db.session.add(passenger)
-        else:
-            current_app.logger.info(f"👤 Updating existing passenger to opted-in: {phone_number}")
-            passenger.opted_in = True
+        logger.debug("✅ Processing opt-in confirmation for %s", phone_number)
         
-        db.session.commit()
+        transition = passenger_state.apply(tenancy.current().id, phone_number, passenger_state.CONFIRM)
+        if transition.created:
+            logger.info("👤 Created new passenger with opt-in: %s", phone_number)
+        suppression_list.release(phone_number, [suppression.OPT_OUT], tenant_id=tenancy.current().id, include_global=False)
         
-        message = ("Thank you for opting in! \n\n"
-                  "You will now receive updates from Nazigi Stamford Bus conductors.\n\n"
-                  "To opt out anytime, send STOP to 20384.")
+        message = tenancy.render('opt_in_confirmed')
         
-        current_app.logger.info(f"📲 Sending confirmation message to {phone_number}")
+        logger.debug("📲 Sending confirmation message to %s", phone_number)
         response = sms_service.send_sms(phone_number, message)
-        current_app.logger.info(f"📬 Response from send_sms: {response}")
+        logger.debug("📬 Response from send_sms: %s", response)
         
         return jsonify({'status': 'success', 'message': 'User opted in'}), 200
         
     except Exception as e:
-        current_app.logger.error(f"❌ Error handling opt-in confirmation: {str(e)}", exc_info=True)
+        logger.error("❌ Error handling opt-in confirmation: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 500
 
-def handle_opt_out(phone_number, passenger):
+@instrument_handler
+def handle_opt_out(phone_number):
     """Handle opt-out request"""
     try:
-        current_app.logger.info(f"🚫 Processing opt-out request for {phone_number}")
+        logger.debug("🚫 Processing opt-out request for %s", phone_number)
         
-        if passenger:
-            passenger.opted_in = False
-            db.session.commit()
-            current_app.logger.info(f"👤 Passenger {phone_number} opted out")
-            
-            message = ("You have been opted out from Nazigi Stamford Bus Service.\n\n"
-                      "To opt in again, send TEST2 to 20384.")
+        transition = passenger_state.apply(tenancy.current().id, phone_number, passenger_state.OPT_OUT)
+        if transition:
+            logger.info("👤 Passenger %s opted out", phone_number)
+            template = 'opted_out'
         else:
-            current_app.logger.info(f"👤 Passenger {phone_number} not registered")
-            message = "You are not registered in our service."
+            logger.debug("👤 Passenger %s not registered", phone_number)
+            template = 'not_registered'
         
-        current_app.logger.info(f"📲 Sending opt-out confirmation to {phone_number}")
-        response = sms_service.send_sms(phone_number, message)
-        current_app.logger.info(f"📬 Response from send_sms: {response}")
+        # Registered or not, this tenant doesn't contact the number again until they opt in
+        suppression_list.suppress(phone_number, suppression.OPT_OUT, tenant_id=tenancy.current().id)
         
-        return jsonify({'status': 'success', 'message': 'User opted out'}), 200
+        # Opt-outs skip the rate limiter; a repeated STOP is only confirmed once per window
+        logger.debug("📲 Sending opt-out confirmation to %s", phone_number)
+        response = send_error_reply(phone_number, template, check_suppression=False)
+        logger.debug("📬 Response from send_sms: %s", response)
         
-        return jsonify({'status': 'success', 'message': 'User opted out'})
+        return jsonify({'status': 'success', 'message': 'User opted out'}), 200
         
     except Exception as e:
-        current_app.logger.error(f"❌ Error handling opt-out: {str(e)}", exc_info=True)
+        logger.error("❌ Error handling opt-out: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@instrument_handler
 def handle_stop_selection(phone_number, passenger, stop_number):
     """Handle when passenger selects a stop by number"""
     try:
-        current_app.logger.info(f"🚏 Processing stop selection for {phone_number}: #{stop_number}")
+        logger.debug("🚏 Processing stop selection for %s: #%s", phone_number, stop_number)
         
         if not passenger or not passenger.opted_in:
-            current_app.logger.warning(f"⚠️ Passenger {phone_number} not opted in, rejecting stop selection")
-            message = "Please opt in first by sending TEST2 to 20384."
-            sms_service.send_sms(phone_number, message)
+            logger.warning("⚠️ Passenger %s not opted in, rejecting stop selection", phone_number)
+            send_error_reply(phone_number, 'opt_in_first')
             return jsonify({'status': 'error', 'message': 'User not opted in'})
         
-        stops = current_app.config['BUS_STOPS']
+        stops = tenancy.current().stops
         
         if 1 <= stop_number <= len(stops):
             selected_stop = stops[stop_number - 1]
-            current_app.logger.info(f"✅ Valid stop selected: {selected_stop}")
+            logger.info("✅ Valid stop selected by %s: %s", phone_number, selected_stop)
             
             # Save response
-            response = PassengerResponse(
+            unit_of_work.current().add(
+                PassengerResponse,
+                tenant_id=passenger.tenant_id,
                 passenger_id=passenger.id,
                 response_text=str(stop_number),
                 selected_stop=selected_stop
             )
-            db.session.add(response)
-            db.session.commit()
             
-            message = f"Confirmed! You will be picked up at {selected_stop}.\n\nThank you for using Nazigi Stamford Bus Service!"
-            current_app.logger.info(f"📲 Sending confirmation to {phone_number}")
+            message = tenancy.render('stop_confirmed', stop=selected_stop)
+            logger.debug("📲 Sending confirmation to %s", phone_number)
             response_sms = sms_service.send_sms(phone_number, message)
-            current_app.logger.info(f"📬 Response from send_sms: {response_sms}")
+            logger.debug("📬 Response from send_sms: %s", response_sms)
             
             return jsonify({'status': 'success', 'message': f'Stop selected: {selected_stop}'})
         else:
-            current_app.logger.warning(f"⚠️ Invalid stop number: {stop_number} (valid: 1-{len(stops)})")
-            message = f"Invalid stop number. Please select a number between 1 and {len(stops)}."
-            sms_service.send_sms(phone_number, message)
+            logger.warning("⚠️ Invalid stop number: %s (valid: 1-%s)", stop_number, len(stops))
+            send_error_reply(phone_number, 'invalid_stop')
             return jsonify({'status': 'error', 'message': 'Invalid stop number'})
         
     except Exception as e:
-        current_app.logger.error(f"❌ Error handling stop selection: {str(e)}", exc_info=True)
+        logger.error("❌ Error handling stop selection: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@instrument_handler
 def handle_stop_name_selection(phone_number, passenger, text):
     """Handle when passenger types stop name"""
     try:
         if not passenger or not passenger.opted_in:
-            message = "Please opt in first by sending TEST2 to 20384."
-            sms_service.send_sms(phone_number, message)
+            send_error_reply(phone_number, 'opt_in_first')
             return jsonify({'status': 'error', 'message': 'User not opted in'})
         
-        stops = current_app.config['BUS_STOPS']
+        stops = tenancy.current().stops
         text_lower = text.lower()
         
         # Try to match stop name
@@ -261,24 +309,23 @@ def handle_stop_name_selection(phone_number, passenger, text):
         
         if matched_stop:
             # Save response
-            response = PassengerResponse(
+            unit_of_work.current().add(
+                PassengerResponse,
+                tenant_id=passenger.tenant_id,
                 passenger_id=passenger.id,
                 response_text=text,
                 selected_stop=matched_stop
             )
-            db.session.add(response)
-            db.session.commit()
             
-            message = f"✅ Confirmed! You will be picked up at {matched_stop}.\n\nThank you for using Nazigi Stamford Bus Service!"
+            message = tenancy.render('stop_name_confirmed', stop=matched_stop)
             sms_service.send_sms(phone_number, message)
             
             return jsonify({'status': 'success', 'message': f'Stop selected: {matched_stop}'})
         else:
             # Send available stops
-            message = "Sorry, I didn't understand that stop.\n\n" + format_stops_message()
-            sms_service.send_sms(phone_number, message)
+            send_error_reply(phone_number, 'stop_not_understood')
             return jsonify({'status': 'error', 'message': 'Stop not recognized'})
         
     except Exception as e:
-        current_app.logger.error(f"Error handling stop name selection: {str(e)}")
+        logger.error("Error handling stop name selection: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 500
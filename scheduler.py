@@ -0,0 +1,288 @@
+"""Scheduled and recurring broadcasts
+
+Run one or more workers with:
+
+    python scheduler.py
+
+Workers claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED and mark them
+'running' in the same transaction, so any number of workers can poll the
+same table without two of them sending the same job. A claim is a lease:
+the worker renews locked_at as the broadcast makes progress, and a
+'running' job not renewed for SCHEDULER_LEASE_SECONDS (its worker died) is
+claimed again. A job records the conductor message of its run in the
+same transaction that creates it, so if the dead worker's broadcast had
+already started it is left to the stale-broadcast resume below instead
+of being sent again. A tenant (see
+tenancy.py) has at most TENANT_MAX_RUNNING_BROADCASTS jobs running at once
+(roughly, as workers claim concurrently), so one tenant's burst of jobs
+can't occupy every worker while other tenants' jobs wait. Workers also pick
+up broadcasts that stopped making progress (e.g. a killed web worker) and
+resume them from the first unsent chunk.
+"""
+
+import os
+import socket
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_, update
+from models import db, ConductorMessage, ScheduledBroadcast
+from broadcast_service import broadcast_service
+from segments import resolve_definition, segment_recipients
+import tenancy
+
+RECURRENCE_STEPS = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+}
+
+
+def parse_recurrence(rule):
+    """
+    Validate a recurrence rule
+
+    Supported rules: None, 'hourly', 'daily', 'weekly', 'weekdays'
+    and 'every:<minutes>'.
+
+    Returns:
+        The normalised rule
+
+    Raises:
+        ValueError: If the rule is not supported
+    """
+    if not rule:
+        return None
+
+    rule = rule.strip().lower()
+    if rule in RECURRENCE_STEPS or rule == 'weekdays':
+        return rule
+
+    if rule.startswith('every:'):
+        minutes = rule.split(':', 1)[1]
+        if minutes.isdigit() and int(minutes) > 0:
+            return f'every:{int(minutes)}'
+
+    raise ValueError(f"Unsupported recurrence rule: {rule}")
+
+
+def next_run_at(run_at, rule, now=None):
+    """
+    Get the next run time after now for a recurring job
+
+    Missed occurrences (e.g. while no worker was running) are skipped
+    rather than replayed back to back.
+    """
+    now = now or datetime.utcnow()
+
+    if rule == 'weekdays':
+        step = timedelta(days=1)
+    elif rule.startswith('every:'):
+        step = timedelta(minutes=int(rule.split(':', 1)[1]))
+    else:
+        step = RECURRENCE_STEPS[rule]
+
+    next_run = run_at + step
+    if next_run <= now:
+        missed = (now - next_run) // step + 1
+        next_run += step * missed
+
+    if rule == 'weekdays':
+        while next_run.weekday() >= 5:
+            next_run += step
+
+    return next_run
+
+
+class BroadcastScheduler:
+    """Worker that claims and sends due scheduled broadcasts"""
+
+    @property
+    def worker_id(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def claim_due_jobs(self, limit=None):
+        """
+        Claim due jobs for this worker
+
+        Rows locked by another worker are skipped, and claimed rows are
+        marked 'running' before the lock is released. Running jobs whose
+        lease expired are claimed again. Jobs of disabled tenants, and of
+        tenants already running their maximum, are left pending.
+        """
+        limit = limit or current_app.config.get('SCHEDULER_BATCH_SIZE', 5)
+        max_running = current_app.config.get('TENANT_MAX_RUNNING_BROADCASTS', 2)
+        now = datetime.utcnow()
+        lease_expired = now - timedelta(seconds=current_app.config.get('SCHEDULER_LEASE_SECONDS', 600))
+
+        query = ScheduledBroadcast.query.filter(
+            or_(
+                and_(ScheduledBroadcast.status == 'pending', ScheduledBroadcast.run_at <= now),
+                and_(ScheduledBroadcast.status == 'running', ScheduledBroadcast.locked_at < lease_expired)
+            ),
+            ScheduledBroadcast.tenant_id.in_(tenancy.tenant_directory.active_ids())
+        )
+
+        running = Counter()
+        if max_running:
+            # Expired leases belong to dead workers and don't count
+            running.update(dict(db.session.query(
+                ScheduledBroadcast.tenant_id, db.func.count(ScheduledBroadcast.id)
+            ).filter(
+                ScheduledBroadcast.status == 'running',
+                ScheduledBroadcast.locked_at >= lease_expired
+            ).group_by(ScheduledBroadcast.tenant_id).all()))
+            busy = [tenant_id for tenant_id, count in running.items() if count >= max_running]
+            if busy:
+                query = query.filter(ScheduledBroadcast.tenant_id.notin_(busy))
+
+        jobs = query.order_by(
+            ScheduledBroadcast.run_at
+        ).limit(limit).with_for_update(skip_locked=True).all()
+
+        claimed = []
+        for job in jobs:
+            if max_running and running[job.tenant_id] >= max_running:
+                continue
+            if job.status == 'running':
+                # Keeps conductor_message_id: run_job checks the dead worker's broadcast
+                current_app.logger.warning(f"⏰ Reclaiming scheduled broadcast {job.id} from {job.locked_by} (lease expired)")
+            else:
+                job.conductor_message_id = None
+            running[job.tenant_id] += 1
+            job.status = 'running'
+            job.locked_by = self.worker_id
+            job.locked_at = now
+            claimed.append(job)
+
+        db.session.commit()
+        return claimed
+
+    def _renew_lease(self, job_id):
+        """Heartbeat for broadcast_service.send: push the job's lease forward"""
+        db.session.execute(
+            update(ScheduledBroadcast)
+            .where(ScheduledBroadcast.id == job_id, ScheduledBroadcast.locked_by == self.worker_id)
+            .values(locked_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    def _link(self, job_id, conductor_msg):
+        """on_record for broadcast_service.send: point the job at this run's broadcast"""
+        db.session.execute(
+            update(ScheduledBroadcast)
+            .where(ScheduledBroadcast.id == job_id, ScheduledBroadcast.locked_by == self.worker_id)
+            .values(conductor_message_id=conductor_msg.id)
+            .execution_options(synchronize_session=False)
+        )
+
+    def _send(self, job):
+        """Send a job's broadcast as its tenant, renewing the lease as chunks go out"""
+        job_id = job.id
+        with tenancy.use(job.tenant_id):
+            recipients = None
+            if job.segment_id:
+                recipients = segment_recipients(
+                    job.tenant_id, resolve_definition(job.tenant_id, segment_id=job.segment_id)
+                )
+
+            conductor_msg, _ = broadcast_service.send(
+                job.message_text,
+                include_stops=job.include_stops,
+                recipients=recipients,
+                spread_seconds=job.spread_seconds,
+                heartbeat=lambda: self._renew_lease(job_id),
+                on_record=lambda conductor_msg: self._link(job_id, conductor_msg)
+            )
+        return conductor_msg
+
+    def run_job(self, job):
+        """Send one claimed job and reschedule or finish it"""
+        current_app.logger.info(f"⏰ Running scheduled broadcast {job.id} on {self.worker_id}")
+
+        try:
+            # Only set here if a dead worker's run already recorded its broadcast
+            started = db.session.get(ConductorMessage, job.conductor_message_id) if job.conductor_message_id else None
+            if started:
+                # Its unsent chunks are resumed by resume_interrupted
+                current_app.logger.info(f"⏰ Broadcast {started.id} of job {job.id} was already started, not resending")
+                conductor_msg = started
+            else:
+                conductor_msg = self._send(job)
+            job.last_error = None if conductor_msg else 'No opted-in passengers found'
+            succeeded = True
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"❌ Scheduled broadcast {job.id} failed: {str(e)}")
+            job.last_error = str(e)
+            succeeded = False
+
+        if job.locked_by != self.worker_id:
+            # Our lease expired and another worker has the job now
+            current_app.logger.warning(f"⏰ Lost the lease on scheduled broadcast {job.id} to {job.locked_by}")
+            db.session.rollback()
+            return
+
+        now = datetime.utcnow()
+        job.run_count += 1
+        job.last_run_at = now
+        job.locked_by = None
+        job.locked_at = None
+
+        if job.recurrence:
+            job.run_at = next_run_at(job.run_at, job.recurrence, now)
+            job.status = 'pending'
+        else:
+            job.status = 'done' if succeeded else 'failed'
+
+        db.session.commit()
+
+    def resume_interrupted(self):
+        """Resume broadcasts whose sender died part-way through"""
+        count = 0
+        for conductor_msg in broadcast_service.claim_stale():
+            current_app.logger.info(f"⏰ Resuming interrupted broadcast {conductor_msg.id} on {self.worker_id}")
+            try:
+                broadcast_service.resume(conductor_msg.id)
+                count += 1
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"❌ Resuming broadcast {conductor_msg.id} failed: {str(e)}")
+        return count
+
+    def run_pending(self):
+        """Resume interrupted broadcasts, then claim and run all due jobs"""
+        count = self.resume_interrupted()
+        while True:
+            jobs = self.claim_due_jobs()
+            if not jobs:
+                return count
+            for job in jobs:
+                self.run_job(job)
+                count += 1
+
+    def run_forever(self, poll_interval=None):
+        """Poll for due jobs until interrupted"""
+        poll_interval = poll_interval or current_app.config.get('SCHEDULER_POLL_SECONDS', 5)
+        current_app.logger.info(f"⏰ Scheduler worker {self.worker_id} started (poll every {poll_interval}s)")
+
+        while True:
+            try:
+                self.run_pending()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"❌ Scheduler error: {str(e)}", exc_info=True)
+            finally:
+                db.session.remove()
+            time.sleep(poll_interval)
+
+# Global scheduler instance
+scheduler = BroadcastScheduler()
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        scheduler.run_forever()
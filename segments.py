@@ -0,0 +1,129 @@
+"""Audience segments for targeted broadcasts
+
+A segment definition is a small JSON document that compiles to a single
+SQL filter on passengers, for example:
+
+    {"stop": "Ngara", "days": 7}
+    {"stops": ["Ngara", "TRM"], "days": 30}
+    {"responded_to": 12}
+    {"joined_within_days": 14}
+    {"all": [{"stop": "Ngara"}, {"not": {"responded_to": 12}}]}
+    {"any": [{"stop": "Ngara"}, {"stop": "Allsops"}]}
+
+Every rule becomes an EXISTS over passenger_responses or a comparison on
+passengers, so counts and recipient lists are answered by the database
+using the response indexes instead of loading rows into Python. Segments
+belong to a tenant, and every condition names the tenant, so the
+tenant-leading indexes (and partitions, see tenant_tables.py) are used.
+"""
+
+from datetime import datetime, timedelta
+from models import db, Passenger, PassengerResponse, ConductorMessage, Segment
+
+
+class SegmentError(ValueError):
+    """Raised when a segment definition is invalid"""
+
+
+def _responses_exist(tenant_id, *conditions):
+    return db.exists().where(
+        PassengerResponse.tenant_id == tenant_id,
+        PassengerResponse.passenger_id == Passenger.id,
+        *conditions
+    )
+
+
+def _since(days, field='days'):
+    """Start of the last `days` days; days must be a positive whole number"""
+    if isinstance(days, bool) or not isinstance(days, int) or days <= 0:
+        raise SegmentError(f"'{field}' must be a positive whole number, got {days!r}")
+    return datetime.utcnow() - timedelta(days=days)
+
+
+def compile_segment(tenant_id, definition):
+    """
+    Compile a segment definition to a SQL filter on the tenant's passengers
+
+    Raises:
+        SegmentError: If the definition is invalid
+    """
+    if not isinstance(definition, dict) or not definition:
+        raise SegmentError("Segment definition must be a non-empty object")
+
+    if 'all' in definition or 'any' in definition:
+        key = 'all' if 'all' in definition else 'any'
+        parts = definition[key]
+        if not isinstance(parts, list) or not parts:
+            raise SegmentError(f"'{key}' must be a non-empty list")
+        clauses = [compile_segment(tenant_id, part) for part in parts]
+        return db.and_(*clauses) if key == 'all' else db.or_(*clauses)
+
+    if 'not' in definition:
+        return db.not_(compile_segment(tenant_id, definition['not']))
+
+    if 'stop' in definition or 'stops' in definition:
+        stops = definition['stops'] if 'stops' in definition else [definition['stop']]
+        if not isinstance(stops, list) or not stops or not all(isinstance(stop, str) and stop for stop in stops):
+            raise SegmentError("'stop' must be a stop name and 'stops' a non-empty list of them")
+        conditions = [PassengerResponse.selected_stop.in_(stops)]
+        if definition.get('days') is not None:
+            conditions.append(PassengerResponse.responded_at >= _since(definition['days']))
+        return _responses_exist(tenant_id, *conditions)
+
+    if 'responded_to' in definition:
+        message_id = definition['responded_to']
+        message = db.session.get(ConductorMessage, message_id) if isinstance(message_id, int) else None
+        if not message or message.tenant_id != tenant_id:
+            raise SegmentError(f"Unknown broadcast: {message_id!r}")
+
+        # Replies are not always tagged with a message id, so also count
+        # untagged replies received before the next broadcast went out
+        next_sent_at = db.session.query(db.func.min(ConductorMessage.sent_at)).filter(
+            ConductorMessage.tenant_id == tenant_id,
+            ConductorMessage.sent_at > message.sent_at
+        ).scalar()
+        window = [
+            PassengerResponse.message_id.is_(None),
+            PassengerResponse.responded_at >= message.sent_at
+        ]
+        if next_sent_at is not None:
+            window.append(PassengerResponse.responded_at < next_sent_at)
+
+        return _responses_exist(tenant_id, db.or_(
+            PassengerResponse.message_id == message.id,
+            db.and_(*window)
+        ))
+
+    if 'joined_within_days' in definition:
+        return Passenger.created_at >= _since(definition['joined_within_days'], 'joined_within_days')
+
+    raise SegmentError(f"Unknown segment rule: {', '.join(definition)}")
+
+
+def resolve_definition(tenant_id, segment_id=None, definition=None):
+    """Get a segment definition from one of the tenant's saved segments or an inline definition"""
+    if segment_id is not None:
+        segment = db.session.get(Segment, segment_id)
+        if not segment or segment.tenant_id != tenant_id:
+            raise SegmentError(f"Unknown segment: {segment_id!r}")
+        return segment.definition
+    return definition
+
+
+def segment_recipients(tenant_id, definition):
+    """Phone numbers of the tenant's opted-in passengers in the segment"""
+    rows = db.session.query(Passenger.phone_number).filter(
+        Passenger.tenant_id == tenant_id,
+        Passenger.opted_in == True,
+        compile_segment(tenant_id, definition)
+    ).all()
+    return [phone for (phone,) in rows]
+
+
+def segment_count(tenant_id, definition):
+    """Count the tenant's opted-in passengers in the segment without loading them"""
+    return db.session.query(db.func.count(Passenger.id)).filter(
+        Passenger.tenant_id == tenant_id,
+        Passenger.opted_in == True,
+        compile_segment(tenant_id, definition)
+    ).scalar()
@@ -1,6 +1,18 @@
-import africastalking
-from flask import current_app
+import logging
+import threading
+import time
+from sqlalchemy import insert, inspect as sa_inspect
 from models import db, SMSLog
+from message_templates import MessageTemplate
+from metrics import PROVIDER_LATENCY, record_send_statuses
+import phone_numbers
+from suppression import suppression_list
+import unit_of_work
+import write_buffer
+import reply_coalescer
+import tenancy
+
+logger = logging.getLogger(__name__)
 
 class SMSService:
     """Service for handling AfricasTalking SMS operations"""
@@ -10,93 +22,183 @@ class SMSService:
         self.api_key = None
         self.sender_id = None
         self.sms = None
+        self._client_lock = threading.Lock()
         
     def initialize(self, username, api_key, sender_id=None):
-        """Initialize AfricasTalking SDK"""
+        """
+        Store AfricasTalking credentials
+        
+        The SDK itself is imported and initialized on the first send (see
+        get_client), so workers and scripts that never send don't pay for it.
+        """
         self.username = username
         self.api_key = api_key
         self.sender_id = sender_id
-        africastalking.initialize(username, api_key)
-        self.sms = africastalking.SMS
+        self.sms = None
+    
+    @property
+    def is_sandbox(self):
+        """Whether sends go to the AfricasTalking sandbox rather than real phones"""
+        return self.username == 'sandbox'
+
+    def get_client(self):
+        """Return the AfricasTalking SMS client, initializing the SDK on first use"""
+        if self.sms is None:
+            with self._client_lock:
+                if self.sms is None:
+                    if not self.username or not self.api_key:
+                        raise RuntimeError("SMS service not initialized: AT_USERNAME / AT_API_KEY missing")
+                    import africastalking
+                    africastalking.initialize(self.username, self.api_key)
+                    self.sms = africastalking.SMS
+                    logger.info("📱 AfricasTalking SDK initialized")
+        return self.sms
         
-    def send_sms(self, recipients, message):
+    def send_sms(self, recipients, message, check_suppression=True):
         """
         Send SMS to one or more recipients
         
+        Inside a unit of work (inbound message processing) the outgoing log
+        is written as part of that transaction and the send itself happens
+        only after it commits; None is returned in that case.
+        
+        Recipients are normalised to E.164; invalid, duplicate and
+        suppressed numbers are dropped before the provider is called.
+        Logs and the sender ID are the current tenant's (see tenancy.py).
+        
         Args:
             recipients: List of phone numbers or single phone number string
             message: Message text to send
+            check_suppression: Skip suppressed numbers (False only for the
+                opt-out confirmation itself)
             
         Returns:
             Response from AfricasTalking API
         """
+        # Ensure recipients is a list
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        
+        recipients = self._valid_recipients(recipients)
+        if check_suppression:
+            recipients, _ = suppression_list.filter(recipients)
+        if not recipients:
+            return {'SMSMessageData': {'Message': 'No deliverable recipients', 'Recipients': []}}
+        
+        tenant = tenancy.current()
+        sender_id = tenant.sender_id
+        uow = unit_of_work.current()
+        if uow is not None:
+            logs = [
+                uow.add(SMSLog, tenant_id=tenant.id, phone_number=recipient, message=message,
+                        direction='outgoing', status='sent')
+                for recipient in recipients
+            ]
+            uow.after_commit(lambda: self._send_after_commit(recipients, message, logs, sender_id))
+            return None
+        
         try:
-            # Ensure recipients is a list
-            if isinstance(recipients, str):
-                recipients = [recipients]
-            
-            current_app.logger.info(f"📤 Attempting to send SMS to: {recipients}")
-            current_app.logger.info(f"📝 Message: {message[:50]}...")
-            current_app.logger.info(f"🆔 Sender ID: {self.sender_id}")
+            response = self._deliver(recipients, message, sender_id)
+        except Exception as e:
+            # Log failed SMS
+            self._log_outgoing(recipients, message, f'failed: {str(e)}')
+            db.session.commit()
+            raise
+        
+        # Log outgoing SMS
+        self._log_outgoing(recipients, message, 'sent')
+        db.session.commit()
+        logger.debug("💾 SMS logged to database")
+        
+        return response
+    
+    def _valid_recipients(self, recipients):
+        """Recipients normalised to E.164, without invalid numbers or duplicates"""
+        batch = phone_numbers.normalize_many(recipients)
+        if batch.invalid:
+            logger.warning("⚠️ Dropped %d invalid recipient(s): %s", len(batch.invalid), batch.invalid[:5])
+        return batch.valid
+    
+    def _deliver(self, recipients, message, sender_id):
+        """Hand a message to AfricasTalking and record the outcome in metrics"""
+        try:
+            logger.info("📤 Sending SMS to %d recipient(s), sender ID: %s", len(recipients), sender_id)
+            logger.debug("📤 Recipients: %s, message: %.50s...", recipients, message)
             
             # Send SMS with sender ID if available
-            if self.sender_id:
-                current_app.logger.info(f"✉️ Sending with sender ID: {self.sender_id}")
-                response = self.sms.send(message, recipients, self.sender_id)
-            else:
-                current_app.logger.info("✉️ Sending without sender ID")
-                response = self.sms.send(message, recipients)
+            client = self.get_client()
+            start = time.perf_counter()
+            try:
+                if sender_id:
+                    response = client.send(message, recipients, sender_id)
+                else:
+                    response = client.send(message, recipients)
+            except Exception:
+                PROVIDER_LATENCY.labels(outcome='error').observe(time.perf_counter() - start)
+                raise
+            PROVIDER_LATENCY.labels(outcome='ok').observe(time.perf_counter() - start)
             
-            current_app.logger.info(f"📨 AfricasTalking Response: {response}")
+            logger.debug("📨 AfricasTalking Response: %s", response)
             
             # Check response status
             sms_data = response.get('SMSMessageData', {})
             recipients_data = sms_data.get('Recipients', [])
+            record_send_statuses(recipients_data)
+            try:
+                suppression_list.record_send_failures(recipients_data)
+            except Exception as e:
+                logger.error("❌ Could not record permanent send failures: %s", e)
             
             for recipient_info in recipients_data:
                 status = recipient_info.get('status', 'Unknown')
-                status_code = recipient_info.get('statusCode', 'N/A')
-                number = recipient_info.get('number', 'Unknown')
-                
-                current_app.logger.info(f"📞 {number}: Status={status}, Code={status_code}")
-                
-                if status == 'Success':
-                    current_app.logger.info(f"✅ SMS successfully sent to {number}")
-                else:
-                    current_app.logger.warning(f"⚠️ SMS failed for {number}: {status} (Code: {status_code})")
-            
-            # Log outgoing SMS
-            for recipient in recipients:
-                log = SMSLog(
-                    phone_number=recipient,
-                    message=message,
-                    direction='outgoing',
-                    status='sent'
-                )
-                db.session.add(log)
-            
-            db.session.commit()
-            current_app.logger.info("💾 SMS logged to database")
+                if status != 'Success':
+                    logger.warning("⚠️ SMS failed for %s: %s (Code: %s)",
+                                   recipient_info.get('number', 'Unknown'), status,
+                                   recipient_info.get('statusCode', 'N/A'))
             
             return response
             
         except Exception as e:
-            current_app.logger.error(f"❌ Error sending SMS: {str(e)}")
-            current_app.logger.error(f"❌ Exception type: {type(e).__name__}")
-            current_app.logger.error(f"❌ Recipients: {recipients}")
-            
-            # Log failed SMS
-            for recipient in recipients:
-                log = SMSLog(
-                    phone_number=recipient,
-                    message=message,
-                    direction='outgoing',
-                    status=f'failed: {str(e)}'
-                )
-                db.session.add(log)
-            
-            db.session.commit()
+            logger.error("❌ Error sending SMS to %d recipient(s): %s: %s",
+                         len(recipients), type(e).__name__, e)
             raise
+    
+    def _log_outgoing(self, recipients, message, status):
+        """Insert outgoing SMSLog rows in one executemany (not committed)"""
+        tenant_id = tenancy.current().id
+        db.session.execute(insert(SMSLog), [
+            {'tenant_id': tenant_id, 'phone_number': recipient, 'message': message,
+             'direction': 'outgoing', 'status': status}
+            for recipient in recipients
+        ])
+    
+    def _send_after_commit(self, recipients, message, logs, sender_id):
+        """Send a reply whose outgoing log was committed as 'sent'"""
+        # The identity key, not .id: reading .id would reload the expired row
+        log_ids = [
+            log.id if isinstance(log, write_buffer.BufferedRow) else sa_inspect(log).identity[0]
+            for log in logs
+        ]
+        coalescer = reply_coalescer.get_coalescer()
+        if coalescer is not None:
+            coalescer.submit(recipients, message, log_ids, sender_id)
+        else:
+            self.send_logged(recipients, message, log_ids, sender_id)
+    
+    def send_logged(self, recipients, message, log_ids, sender_id):
+        """
+        Send a message whose outgoing logs are already committed as 'sent'
+        
+        If the send fails the logs are marked failed (by id, since they may
+        have been written by the write buffer) and the error is swallowed.
+        """
+        try:
+            self._deliver(recipients, message, sender_id)
+        except Exception as e:
+            SMSLog.query.filter(SMSLog.id.in_(log_ids)).update(
+                {'status': f'failed: {str(e)}'}, synchronize_session=False
+            )
+            db.session.commit()
             
     def send_bulk_sms(self, recipients, message):
         """
@@ -110,20 +212,71 @@ class SMSService:
             Response from AfricasTalking API
         """
         return self.send_sms(recipients, message)
-        
+
+    def render_personalised(self, template, recipient_fields, lang=None):
+        """
+        Render a personalised message for many recipients, grouped by text
+
+        Recipients whose final text is identical end up in one group, so
+        a personalised broadcast (see BroadcastService.send_personalised)
+        costs about as many provider calls as there are distinct texts.
+        Nothing is sent here, so a bad template fails before any send.
+
+        Args:
+            template: Template name, MessageTemplate or str.format text
+            recipient_fields: Dict of {phone_number: {field: value}}
+            lang: Optional language variant for named templates
+
+        Returns:
+            Dict of {text: [phone_number, ...]}
+
+        Raises:
+            KeyError: a template field is missing for a recipient
+            ValueError, IndexError, AttributeError: the template is malformed
+        """
+        if isinstance(template, str):
+            templates = tenancy.current().templates
+            if template in templates.names():
+                template = templates.get(template, lang)
+            else:
+                template = MessageTemplate('adhoc', template, templates.static_fields)
+
+        # Merge fields of numbers written differently (0712..., +254712...)
+        fields_by_phone = {}
+        for phone, fields in recipient_fields.items():
+            try:
+                fields_by_phone.setdefault(phone_numbers.normalize(phone), fields)
+            except phone_numbers.InvalidPhoneNumber:
+                logger.warning("⚠️ Dropped invalid recipient: %r", phone)
+        recipient_fields = fields_by_phone
+
+        groups = {}
+        phones = list(recipient_fields)
+        texts = template.render_many(recipient_fields[phone] for phone in phones)
+        for phone, text in zip(phones, texts):
+            groups.setdefault(text, []).append(phone)
+
+        logger.info("📦 Personalised message: %d recipients in %d groups", len(phones), len(groups))
+        return groups
+
     def log_incoming_sms(self, phone_number, message):
         """Log incoming SMS to database"""
         try:
-            log = SMSLog(
+            values = dict(
+                tenant_id=tenancy.current().id,
                 phone_number=phone_number,
                 message=message,
                 direction='incoming',
                 status='received'
             )
-            db.session.add(log)
-            db.session.commit()
+            uow = unit_of_work.current()
+            if uow is not None:
+                uow.add(SMSLog, **values)
+            else:
+                db.session.add(SMSLog(**values))
+                db.session.commit()
         except Exception as e:
-            current_app.logger.error(f"Error logging incoming SMS: {str(e)}")
+            logger.error("Error logging incoming SMS: %s", e)
 
 # Global SMS service instance
 sms_service = SMSService()
@@ -0,0 +1,95 @@
+"""Per-request SQL query profiler
+
+Opt-in with SQL_PROFILER_ENABLED=true. When enabled, every response gets
+X-DB-Query-Count and X-DB-Time-Ms headers. Requests slower than
+SQL_PROFILER_SLOW_MS are kept in a per-worker ring buffer along with their
+slowest statements, and can be read at /debug/sql-profile.
+
+When disabled nothing is registered, so there is no per-query overhead.
+"""
+
+import time
+from collections import deque
+from datetime import datetime
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event
+
+# Slow requests seen by this worker, newest last
+slow_requests = deque(maxlen=100)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        context._profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_profile_start', None)
+    if start is not None and has_request_context():
+        queries = g.get('profile_queries')
+        if queries is None:
+            queries = g.profile_queries = []
+        queries.append((time.perf_counter() - start, statement))
+
+
+def init_app(app, db):
+    """Register the profiler if SQL_PROFILER_ENABLED is set"""
+    if not app.config.get('SQL_PROFILER_ENABLED'):
+        return
+
+    global slow_requests
+    slow_requests = deque(maxlen=app.config.get('SQL_PROFILER_BUFFER_SIZE', 100))
+    slow_ms = app.config.get('SQL_PROFILER_SLOW_MS', 500)
+    top_n = app.config.get('SQL_PROFILER_TOP_N', 5)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        g.profile_start = time.perf_counter()
+
+    @app.after_request
+    def finish_profile(response):
+        start = g.pop('profile_start', None)
+        if start is None:
+            return response
+
+        queries = g.pop('profile_queries', [])
+        request_ms = (time.perf_counter() - start) * 1000
+        db_ms = sum(duration for duration, _ in queries) * 1000
+
+        response.headers['X-DB-Query-Count'] = str(len(queries))
+        response.headers['X-DB-Time-Ms'] = f'{db_ms:.1f}'
+
+        if request_ms >= slow_ms:
+            slowest = sorted(queries, key=lambda q: q[0], reverse=True)[:top_n]
+            slow_requests.append({
+                'at': datetime.utcnow().isoformat(),
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'request_ms': round(request_ms, 1),
+                'db_ms': round(db_ms, 1),
+                'query_count': len(queries),
+                'slowest_queries': [
+                    {'ms': round(duration * 1000, 2), 'statement': statement}
+                    for duration, statement in slowest
+                ]
+            })
+
+        return response
+
+    from routes.conductor_routes import requires_auth
+
+    @app.route('/debug/sql-profile')
+    @requires_auth
+    def sql_profile():
+        """Slow requests captured by this worker"""
+        return jsonify({
+            'slow_ms': slow_ms,
+            'captured': len(slow_requests),
+            'requests': list(reversed(slow_requests))
+        })
@@ -9,12 +9,11 @@ echo "=========================================="
 echo "⏳ Waiting for database..."
 sleep 5
 
-# Run database migrations
+# Create missing tables and upgrade ones from an earlier release
 echo "📊 Running database migrations..."
-export FLASK_APP=app.py
-flask db upgrade 2>&1 || {
-    echo "⚠️  Migration failed, trying direct table creation..."
-    python -c "from app import create_app; from models import db; app = create_app(); app.app_context().push(); db.create_all(); print('✅ Tables created')" 2>&1 || echo "❌ Table creation failed - will retry on first request"
+python init_db.py || {
+    echo "❌ Database setup failed, not starting"
+    exit 1
 }
 
 echo "✅ Database ready!"
@@ -22,16 +21,10 @@ echo "=========================================="
 echo "🚀 Starting Gunicorn server on port ${PORT:-5000}"
 echo "=========================================="
 
-# Start Gunicorn
-exec gunicorn \
-    --bind 0.0.0.0:${PORT:-5000} \
-    --workers ${GUNICORN_WORKERS:-4} \
-    --threads ${GUNICORN_THREADS:-2} \
-    --timeout ${GUNICORN_TIMEOUT:-120} \
-    --worker-class sync \
-    --access-logfile - \
-    --error-logfile - \
-    --log-level info \
-    --capture-output \
-    --enable-stdio-inheritance \
-    wsgi:app
+# Prometheus multiprocess metrics (shared by all Gunicorn workers)
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Start Gunicorn (workers, threads, preload etc. from gunicorn.conf.py)
+exec gunicorn --config gunicorn.conf.py --enable-stdio-inheritance wsgi:app
@@ -0,0 +1,174 @@
+const API_BASE = window.location.origin;
+let authHeader = '';
+
+// Login
+document.getElementById('loginForm').addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const username = document.getElementById('username').value;
+    const password = document.getElementById('password').value;
+
+    try {
+        // Exchange the password for a session token once, instead of
+        // sending it (and paying for its hash check) on every poll
+        const response = await fetch(`${API_BASE}/conductor/login`, {
+            method: 'POST',
+            headers: { 'Authorization': 'Basic ' + btoa(username + ':' + password) }
+        });
+
+        if (response.ok) {
+            const session = await response.json();
+            authHeader = 'Bearer ' + session.token;
+            document.getElementById('loginContainer').classList.add('hidden');
+            document.getElementById('dashboard').classList.remove('hidden');
+            loadDashboard();
+            loadResponses();
+        } else {
+            showLoginError('Invalid credentials');
+        }
+    } catch (error) {
+        showLoginError('Connection error: ' + error.message);
+    }
+});
+
+function showLoginError(message) {
+    const errorDiv = document.getElementById('loginError');
+    errorDiv.textContent = message;
+    errorDiv.classList.remove('hidden');
+}
+
+function logout() {
+    if (authHeader) {
+        fetch(`${API_BASE}/conductor/logout`, {
+            method: 'POST',
+            headers: { 'Authorization': authHeader }
+        }).catch(() => {});
+    }
+    authHeader = '';
+    document.getElementById('loginContainer').classList.remove('hidden');
+    document.getElementById('dashboard').classList.add('hidden');
+    document.getElementById('loginForm').reset();
+}
+
+// Load Dashboard Stats
+async function loadDashboard() {
+    try {
+        const response = await fetch(`${API_BASE}/conductor/api/stats`, {
+            headers: { 'Authorization': authHeader }
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+
+        const data = await response.json();
+
+        document.getElementById('totalPassengers').textContent = data.statistics.total_passengers;
+        document.getElementById('optedIn').textContent = data.statistics.opted_in;
+        document.getElementById('messagesSent').textContent = data.statistics.total_messages_sent;
+        document.getElementById('totalResponses').textContent = data.statistics.total_responses;
+    } catch (error) {
+        console.error('Error loading dashboard:', error);
+        // Show error in console but don't break the page
+    }
+}
+
+// Send Message
+document.getElementById('messageForm').addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const messageText = document.getElementById('messageText').value;
+    const sendBtn = document.getElementById('sendBtn');
+
+    sendBtn.disabled = true;
+    sendBtn.textContent = 'Sending...';
+
+    try {
+        const response = await fetch(`${API_BASE}/conductor/send-message`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': authHeader
+            },
+            body: JSON.stringify({ message: messageText })
+        });
+
+        const data = await response.json();
+
+        if (response.ok) {
+            showAlert('sendMessageAlert', 'success', 
+                `✅ Message sent successfully to ${data.recipients_count} passengers!`);
+            document.getElementById('messageText').value = '';
+            loadDashboard();
+        } else {
+            showAlert('sendMessageAlert', 'error', 
+                `❌ Error: ${data.error || 'Failed to send message'}`);
+        }
+    } catch (error) {
+        showAlert('sendMessageAlert', 'error', 
+            `❌ Connection error: ${error.message}`);
+    } finally {
+        sendBtn.disabled = false;
+        sendBtn.textContent = 'Send to All Opted-In Passengers';
+    }
+});
+
+// Load Responses
+async function loadResponses() {
+    try {
+        const response = await fetch(`${API_BASE}/conductor/responses`, {
+            headers: { 'Authorization': authHeader }
+        });
+        const data = await response.json();
+
+        // Display stop summary
+        const summaryDiv = document.getElementById('stopSummary');
+        summaryDiv.innerHTML = '';
+
+        for (const [stop, count] of Object.entries(data.stop_summary)) {
+            summaryDiv.innerHTML += `
+                <div class="stop-badge">
+                    <div class="stop-name">${stop}</div>
+                    <div class="stop-count">${count}</div>
+                </div>
+            `;
+        }
+
+        // Display responses list
+        const listDiv = document.getElementById('responsesList');
+        listDiv.innerHTML = '<h3 style="margin-bottom: 10px;">Latest Responses</h3>';
+
+        if (data.responses.length === 0) {
+            listDiv.innerHTML += '<p style="color: #999;">No responses yet</p>';
+        } else {
+            data.responses.forEach(r => {
+                const date = new Date(r.responded_at).toLocaleString();
+                listDiv.innerHTML += `
+                    <div class="response-item">
+                        <strong>${r.passenger_phone}</strong> selected 
+                        <strong style="color: #667eea;">${r.selected_stop || 'N/A'}</strong>
+                        <div class="time">${date}</div>
+                    </div>
+                `;
+            });
+        }
+    } catch (error) {
+        console.error('Error loading responses:', error);
+    }
+}
+
+function showAlert(elementId, type, message) {
+    const alertDiv = document.getElementById(elementId);
+    alertDiv.className = `alert alert-${type}`;
+    alertDiv.textContent = message;
+    alertDiv.classList.remove('hidden');
+
+    setTimeout(() => {
+        alertDiv.classList.add('hidden');
+    }, 5000);
+}
+
+// Auto-refresh dashboard every 30 seconds
+setInterval(() => {
+    if (!document.getElementById('dashboard').classList.contains('hidden')) {
+        loadDashboard();
+    }
+}, 30000);
@@ -0,0 +1,286 @@
+"""Suppression (do-not-contact) list
+
+Numbers in suppressed_numbers are never sent to, whether by a broadcast or
+a single reply from send_sms:
+
+    opt_out          passenger sent STOP/NO to a tenant (lifted when they
+                     opt in to that tenant again)
+    invalid_number   AfricasTalking rejected the number as invalid
+    carrier_blocked  the subscriber blocked messages with their carrier
+    manual           added by a conductor
+
+Every outbound recipient is first checked against an in-memory Bloom
+filter, so the common case (not suppressed) costs no query. Only filter
+hits are confirmed against the table, which also weeds out the filter's
+false positives and numbers removed since it was built.
+
+Opt-outs only apply to the tenant they were sent to (tenant_id is set), so
+a STOP to one sacco doesn't silence the others. The other reasons apply to
+every tenant (tenant_id is NULL). The filter holds "phone" for entries of
+every tenant and "tenant_id:phone" for a single tenant's.
+
+Each worker builds the filter on first use and then refreshes it
+incrementally every SUPPRESSION_REFRESH_SECONDS, loading only rows with an
+id above the last one seen. The filter is rebuilt at twice the size when it
+fills up past SUPPRESSION_BLOOM_CAPACITY, keeping the false positive rate
+near SUPPRESSION_BLOOM_ERROR_RATE with millions of entries.
+"""
+
+import hashlib
+import logging
+import math
+import struct
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy import or_
+from models import db, SuppressedNumber
+from metrics import SMS_SUPPRESSED, SUPPRESSION_FALSE_POSITIVES
+import tenancy
+
+logger = logging.getLogger(__name__)
+
+OPT_OUT = 'opt_out'
+INVALID_NUMBER = 'invalid_number'
+CARRIER_BLOCKED = 'carrier_blocked'
+MANUAL = 'manual'
+
+REASONS = (OPT_OUT, INVALID_NUMBER, CARRIER_BLOCKED, MANUAL)
+
+# AfricasTalking per-recipient statusCodes that will fail again on every retry
+PERMANENT_FAILURES = {
+    403: INVALID_NUMBER,    # InvalidPhoneNumber
+    406: CARRIER_BLOCKED,   # UserInBlacklist
+}
+
+# Rows re-read below the high-water mark on refresh, to catch inserts
+# that committed after a later id was already seen
+_REFRESH_OVERLAP = 1000
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+_LOOKUP_CHUNK = 10000
+
+_dialect_insert = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 64)
+        # One 32-bit word of a single blake2b digest (max 64 bytes) per hash
+        self.hashes = min(max(round(self.size / self.capacity * math.log(2)), 1), 16)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self._unpack = struct.Struct(f'<{self.hashes}I').unpack
+
+    def _hashes(self, item):
+        return self._unpack(hashlib.blake2b(item.encode(), digest_size=4 * self.hashes).digest())
+
+    def add(self, item):
+        """Add item; returns False if it was (probably) already present"""
+        bits = self.bits
+        size = self.size
+        new = False
+        for h in self._hashes(item):
+            pos = h % size
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, item):
+        bits = self.bits
+        size = self.size
+        for h in self._hashes(item):
+            pos = h % size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+def _key(phone_number, tenant_id=None):
+    """Bloom filter key of an entry"""
+    return phone_number if tenant_id is None else f'{tenant_id}:{phone_number}'
+
+
+def _scope(tenant_id, include_global=True):
+    """Where clause for entries that apply to tenant_id (and to every tenant)"""
+    if tenant_id is None:
+        return SuppressedNumber.tenant_id.is_(None)
+    if not include_global:
+        return SuppressedNumber.tenant_id == tenant_id
+    return or_(SuppressedNumber.tenant_id.is_(None), SuppressedNumber.tenant_id == tenant_id)
+
+
+class SuppressionList:
+    """Do-not-contact list with a per-worker Bloom filter in front of the table"""
+
+    def __init__(self):
+        self._bloom = None
+        self._last_id = 0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Load rows added since the last refresh, building the filter if needed"""
+        interval = current_app.config.get('SUPPRESSION_REFRESH_SECONDS', 10)
+        if not force and self._bloom is not None and time.monotonic() - self._refreshed_at < interval:
+            return
+
+        with self._lock:
+            if not force and self._bloom is not None and time.monotonic() - self._refreshed_at < interval:
+                return
+
+            bloom = self._bloom
+            if bloom is not None:
+                self._last_id = self._load(bloom, max(self._last_id - _REFRESH_OVERLAP, 0))
+
+            if bloom is None or bloom.count > bloom.capacity:
+                self._rebuild(bloom.count if bloom else 0)
+
+            self._refreshed_at = time.monotonic()
+
+    def _rebuild(self, count):
+        capacity = max(current_app.config.get('SUPPRESSION_BLOOM_CAPACITY', 1000000), count * 2)
+        error_rate = current_app.config.get('SUPPRESSION_BLOOM_ERROR_RATE', 0.001)
+        while True:
+            bloom = BloomFilter(capacity, error_rate)
+            last_id = self._load(bloom, 0)
+            if bloom.count <= bloom.capacity:
+                break
+            capacity = bloom.count * 2
+
+        logger.info("🚫 Suppression filter built: %d numbers, %d KiB", bloom.count, len(bloom.bits) // 1024)
+        self._bloom = bloom
+        self._last_id = last_id
+
+    def _load(self, bloom, after_id):
+        """Add rows with id > after_id to bloom; returns the highest id seen"""
+        last_id = after_id
+        rows = db.session.execute(
+            select(SuppressedNumber.id, SuppressedNumber.phone_number, SuppressedNumber.tenant_id)
+            .where(SuppressedNumber.id > after_id)
+            .order_by(SuppressedNumber.id)
+            .execution_options(yield_per=10000)
+        )
+        for row_id, phone, tenant_id in rows:
+            bloom.add(_key(phone, tenant_id))
+            last_id = row_id
+        return last_id
+
+    def filter(self, recipients):
+        """
+        Split E.164 recipients into those the current tenant may message and
+        those that are suppressed
+
+        Returns:
+            Tuple of (allowed, suppressed) lists, in the order given
+        """
+        if not recipients:
+            return [], []
+
+        self.refresh()
+        bloom = self._bloom
+        tenant_id = tenancy.current().id
+        candidates = [phone for phone in recipients if phone in bloom or _key(phone, tenant_id) in bloom]
+        if not candidates:
+            return list(recipients), []
+
+        reasons = {}
+        for i in range(0, len(candidates), _LOOKUP_CHUNK):
+            reasons.update(db.session.execute(
+                select(SuppressedNumber.phone_number, SuppressedNumber.reason)
+                .where(SuppressedNumber.phone_number.in_(candidates[i:i + _LOOKUP_CHUNK]), _scope(tenant_id))
+            ).all())
+
+        if len(reasons) < len(candidates):
+            SUPPRESSION_FALSE_POSITIVES.inc(len(candidates) - len(reasons))
+        if not reasons:
+            return list(recipients), []
+
+        for reason in reasons.values():
+            SMS_SUPPRESSED.labels(reason=reason).inc()
+
+        allowed = [phone for phone in recipients if phone not in reasons]
+        suppressed = [phone for phone in recipients if phone in reasons]
+        logger.info("🚫 Skipping %d suppressed recipient(s)", len(suppressed))
+        return allowed, suppressed
+
+    def is_suppressed(self, phone_number):
+        """Whether an E.164 number is on the list for the current tenant"""
+        return not self.filter([phone_number])[0]
+
+    def _insert_statement(self, bind):
+        # Either unique index may conflict (per tenant, or every tenant)
+        return _dialect_insert[bind.dialect.name](SuppressedNumber).on_conflict_do_nothing()
+
+    def _remember(self, keys):
+        bloom = self._bloom
+        if bloom is not None:
+            for key in keys:
+                bloom.add(key)
+
+    def suppress(self, phone_number, reason, tenant_id=None):
+        """
+        Add a number in the current transaction (not committed); existing entries are kept
+
+        With tenant_id the entry only applies to that tenant (used for opt-outs).
+        """
+        if reason not in REASONS:
+            raise ValueError(f"Unknown suppression reason: {reason}")
+        stmt = self._insert_statement(db.session.get_bind(mapper=SuppressedNumber))
+        db.session.execute(stmt.values(
+            tenant_id=tenant_id, phone_number=phone_number, reason=reason, created_at=datetime.utcnow()
+        ))
+        self._remember([_key(phone_number, tenant_id)])
+
+    def release(self, phone_number, reasons=None, tenant_id=None, include_global=True):
+        """
+        Remove a number (only entries with one of reasons, if given); not committed
+
+        Removes entries of every tenant, plus those of tenant_id if given.
+        With include_global=False only tenant_id's entries are removed.
+        """
+        stmt = delete(SuppressedNumber).where(
+            SuppressedNumber.phone_number == phone_number, _scope(tenant_id, include_global)
+        )
+        if reasons is not None:
+            stmt = stmt.where(SuppressedNumber.reason.in_(reasons))
+        return db.session.execute(stmt).rowcount > 0
+
+    def record_send_failures(self, recipients_data):
+        """
+        Suppress recipients AfricasTalking rejected for good
+
+        Written in a transaction of its own, so it never commits or rolls
+        back the caller's session.
+        """
+        now = datetime.utcnow()
+        rows = []
+        for recipient_info in recipients_data:
+            reason = PERMANENT_FAILURES.get(recipient_info.get('statusCode'))
+            if reason and recipient_info.get('number'):
+                rows.append({'phone_number': recipient_info['number'], 'reason': reason, 'created_at': now})
+        if not rows:
+            return
+
+        with db.engine.begin() as connection:
+            connection.execute(self._insert_statement(connection), rows)
+        self._remember(row['phone_number'] for row in rows)
+        logger.warning("🚫 Suppressed %d number(s) after permanent send failures", len(rows))
+
+
+# Global suppression list instance
+suppression_list = SuppressionList()
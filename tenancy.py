@@ -0,0 +1,245 @@
+"""Tenants: several saccos/routes on one deployment
+
+Each tenant (Tenant in models.py, managed with manage_tenants.py) has its
+own shortcode, opt-in keyword, stop list and sender ID. Tenants may share
+a shortcode if their keywords differ. Passengers, broadcasts, responses,
+SMS logs, segments and scheduled broadcasts all carry a tenant_id, and
+their indexes lead with it. So a tenant's queries only touch its own rows,
+however big another tenant grows.
+
+Inbound SMS are routed in /sms/callback by the shortcode they were sent to
+("to") and the keyword they start with, through lookup tables built from
+the tenants table:
+
+    one tenant on the shortcode         that tenant
+    keyword of a tenant on it           that tenant
+    otherwise (shared shortcode)        the tenant the sender last used there
+    unknown or missing shortcode        the default tenant
+
+Each worker builds the tables, and each tenant's message templates, on
+first use and reloads them every TENANT_REFRESH_SECONDS.
+
+The tenant a request, scheduler job or script works for is kept in flask.g
+(see current() and use()). On an empty tenants table the default tenant
+(TENANT_DEFAULT_SLUG) is created from AT_SHORTCODE, BUS_STOPS and
+AT_SENDER_ID, so single-operator deployments work unchanged.
+
+Opt-out suppressions are per tenant: a STOP to one tenant doesn't silence
+the others, and opting in to one tenant doesn't lift another's opt-out.
+Numbers that are invalid or blocked at the carrier are suppressed for every
+tenant (see suppression.py).
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app, g, has_app_context
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Passenger, Tenant
+from message_templates import TemplateRegistry
+
+logger = logging.getLogger(__name__)
+
+_dialect_insert = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+class TenantInfo(namedtuple('TenantInfo', ['id', 'slug', 'name', 'shortcode', 'keyword', 'stops',
+                                           'sender_id', 'active', 'templates'])):
+    """Snapshot of a tenant row with its settings resolved and templates compiled"""
+    __slots__ = ()
+
+    def matches_keyword(self, text):
+        """Whether text starts with this tenant's opt-in keyword"""
+        return text.lower().strip().startswith(self.keyword)
+
+
+class _Routes:
+    """Lookup tables for one load of the tenants table"""
+
+    def __init__(self, tenants, default):
+        self.default = default
+        self.by_id = {tenant.id: tenant for tenant in tenants}
+        self.by_slug = {tenant.slug: tenant for tenant in tenants}
+
+        self.by_shortcode = {}
+        for tenant in tenants:
+            if tenant.active:
+                self.by_shortcode.setdefault(tenant.shortcode, []).append(tenant)
+
+        # shortcode -> (match function, {keyword: tenant}) for shared shortcodes
+        self.keywords = {}
+        for shortcode, group in self.by_shortcode.items():
+            if len(group) > 1:
+                by_keyword = {tenant.keyword: tenant for tenant in group}
+                # Longest first, so "test23" is not taken for "test2"
+                alternatives = '|'.join(re.escape(keyword) for keyword in sorted(by_keyword, key=len, reverse=True))
+                pattern = re.compile(rf'\s*({alternatives})', re.IGNORECASE)
+                self.keywords[shortcode] = (pattern.match, by_keyword)
+
+
+class TenantDirectory:
+    """Per-worker view of the tenants table"""
+
+    def __init__(self):
+        self._routes = None
+        self._refreshed_at = 0.0
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Reload the tenants table if it is older than TENANT_REFRESH_SECONDS"""
+        interval = current_app.config.get('TENANT_REFRESH_SECONDS', 60)
+        if not force and self._routes is not None and time.monotonic() - self._refreshed_at < interval:
+            return self._routes
+
+        with self._lock:
+            if not force and self._routes is not None and time.monotonic() - self._refreshed_at < interval:
+                return self._routes
+            self._routes = self._load()
+            self._refreshed_at = time.monotonic()
+            return self._routes
+
+    def _load(self):
+        config = current_app.config
+        default_slug = config.get('TENANT_DEFAULT_SLUG', 'default')
+
+        # On a connection of its own (and always the primary), so it never
+        # touches the caller's transaction
+        with db.engine.begin() as connection:
+            rows = connection.execute(select(Tenant).order_by(Tenant.id)).all()
+            if not any(row.slug == default_slug for row in rows):
+                self._create_default(connection, config)
+                rows = connection.execute(select(Tenant).order_by(Tenant.id)).all()
+
+        templates = {}
+        tenants = []
+        for row in rows:
+            stops = row.stops or config['BUS_STOPS']
+            key = (tuple(stops), row.shortcode, row.keyword, row.name)
+            registry = self._templates.get(key)
+            if registry is None:
+                registry = TemplateRegistry()
+                registry.initialize(stops, row.shortcode, config.get('DEFAULT_LANGUAGE', 'en'),
+                                    keyword=row.keyword.upper(), service_name=row.name)
+            templates[key] = registry
+            tenants.append(TenantInfo(
+                row.id, row.slug, row.name, row.shortcode, row.keyword, stops,
+                row.sender_id or config.get('AT_SENDER_ID'), row.active, registry
+            ))
+        self._templates = templates
+
+        default = next(tenant for tenant in tenants if tenant.slug == default_slug)
+        logger.debug("🏢 Loaded %d tenant(s)", len(tenants))
+        return _Routes(tenants, default)
+
+    def _create_default(self, connection, config):
+        now = datetime.utcnow()
+        stmt = _dialect_insert[connection.dialect.name](Tenant).values(
+            slug=config.get('TENANT_DEFAULT_SLUG', 'default'),
+            name=config.get('TENANT_DEFAULT_NAME', 'Nazigi Stamford'),
+            shortcode=config['AT_SHORTCODE'],
+            keyword=config.get('TENANT_DEFAULT_KEYWORD', 'test2').lower(),
+            active=True,
+            created_at=now,
+            updated_at=now
+        ).on_conflict_do_nothing()
+        connection.execute(stmt)
+        logger.info("🏢 Created default tenant for shortcode %s", config['AT_SHORTCODE'])
+
+    def default(self):
+        """The default tenant"""
+        return self.refresh().default
+
+    def get(self, tenant_id):
+        """Tenant by id (reloading once for tenants added since), or None"""
+        tenant = self.refresh().by_id.get(tenant_id)
+        if tenant is None:
+            tenant = self.refresh(force=True).by_id.get(tenant_id)
+        return tenant
+
+    def by_slug(self, slug):
+        """Tenant by slug (reloading once for tenants added since), or None"""
+        tenant = self.refresh().by_slug.get(slug)
+        if tenant is None:
+            tenant = self.refresh(force=True).by_slug.get(slug)
+        return tenant
+
+    def active_ids(self):
+        """Ids of tenants that are not disabled"""
+        return [tenant.id for tenant in self.refresh().by_id.values() if tenant.active]
+
+    def route_inbound(self, shortcode, phone_number, text):
+        """Tenant an inbound message belongs to (see the module docstring)"""
+        routes = self.refresh()
+        shortcode = (shortcode or '').strip()
+        tenants = routes.by_shortcode.get(shortcode)
+        if not tenants:
+            return routes.default
+        if len(tenants) == 1:
+            return tenants[0]
+
+        match, by_keyword = routes.keywords[shortcode]
+        found = match(text)
+        if found:
+            return by_keyword[found.group(1).lower()]
+
+        # Shared shortcode and no keyword: a reply to the tenant the sender
+        # was last active with (one lookup on the tenant/phone unique index)
+        tenant_id = db.session.execute(
+            select(Passenger.tenant_id)
+            .where(Passenger.tenant_id.in_([tenant.id for tenant in tenants]),
+                   Passenger.phone_number == phone_number)
+            .order_by(Passenger.updated_at.desc())
+            .limit(1)
+        ).scalar()
+        return routes.by_id.get(tenant_id) or tenants[0]
+
+
+# Global tenant directory instance
+tenant_directory = TenantDirectory()
+
+
+def current():
+    """The tenant of the current request, job or script (the default tenant if none is set)"""
+    tenant = g.get('tenant') if has_app_context() else None
+    if tenant is None:
+        tenant = tenant_directory.default()
+    return tenant
+
+
+def render(name, lang=None, **fields):
+    """Render one of the current tenant's message templates"""
+    return current().templates.render(name, lang, **fields)
+
+
+@contextmanager
+def use(tenant):
+    """
+    Make a tenant (TenantInfo or id) current for the block
+
+    Raises:
+        LookupError: If there is no tenant with that id
+    """
+    if not isinstance(tenant, TenantInfo):
+        tenant_id = tenant
+        tenant = tenant_directory.get(tenant_id)
+        if tenant is None:
+            raise LookupError(f"Unknown tenant: {tenant_id!r}")
+
+    previous = g.get('tenant')
+    g.tenant = tenant
+    try:
+        yield tenant
+    finally:
+        if previous is None:
+            g.pop('tenant', None)
+        else:
+            g.tenant = previous
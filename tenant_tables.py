@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Schema upgrades and per-tenant partitioning (PostgreSQL)
+
+    python tenant_tables.py upgrade        Bring a database created by an earlier release up to date
+    python tenant_tables.py partition      Partition sms_logs and passenger_responses by tenant
+    python tenant_tables.py split <slug>   Give one tenant partitions of its own
+    python tenant_tables.py status
+
+upgrade creates the tables added since (tenants, broadcast_chunks,
+segments, ...) and the default tenant. It adds the broadcast progress
+columns to conductor_messages (existing broadcasts count as finished),
+assigns every existing row (and every opt-out suppression) to the default
+tenant and swaps the old indexes for the tenant-leading ones. It can be
+run again safely, and init_db.py runs it at startup whenever a table is
+missing columns.
+
+partition turns the two fastest-growing tables into LIST partitioned
+tables on tenant_id. At first every tenant's rows sit in a shared DEFAULT
+partition. split moves a (large) tenant's rows out into partitions of its
+own. Its queries, VACUUMs and index maintenance then stop touching other
+tenants' rows, and its data can be detached or dropped in one step.
+passengers is not partitioned: other tables reference its id, and its
+(tenant_id, phone_number) unique index already keeps lookups per tenant.
+
+Each command runs in one transaction and locks the tables it changes.
+partition and split copy rows, so run them while traffic is low.
+"""
+
+import argparse
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+from sqlalchemy.schema import AddConstraint
+from app import create_app
+from models import db, PassengerResponse, SMSLog
+from tenancy import tenant_directory
+
+# Delivery progress columns of conductor_messages (see broadcast_service.py)
+BROADCAST_COLUMNS = [
+    "status varchar(20) NOT NULL DEFAULT 'sent'",
+    "body text",
+    "chunks_total integer NOT NULL DEFAULT 0",
+    "chunks_done integer NOT NULL DEFAULT 0",
+    "last_progress_at timestamp",
+    "completed_at timestamp",
+]
+
+TENANT_TABLES = ['passengers', 'conductor_messages', 'passenger_responses', 'sms_logs',
+                 'segments', 'scheduled_broadcasts']
+
+PARTITIONED_MODELS = [SMSLog, PassengerResponse]
+
+# Pre-tenant uniqueness and indexes replaced by tenant-leading ones
+OLD_INDEXES = ['ix_passengers_phone_number', 'ix_passenger_responses_stop_time', 'ix_passenger_responses_time',
+               'ix_suppressed_numbers_phone_number']
+OLD_CONSTRAINTS = {'segments': 'segments_name_key'}
+
+
+def _constraint_exists(connection, name):
+    return connection.execute(
+        text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {'name': name}
+    ).scalar() is not None
+
+
+def _is_partitioned(connection, table):
+    return connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {'table': table}
+    ).scalar() == 'p'
+
+
+def upgrade_broadcasts(connection):
+    for column in BROADCAST_COLUMNS:
+        connection.exec_driver_sql(f"ALTER TABLE conductor_messages ADD COLUMN IF NOT EXISTS {column}")
+    connection.exec_driver_sql("ALTER TABLE broadcast_chunks ADD COLUMN IF NOT EXISTS body text")
+    # Broadcasts from before were sent in one go; new ones always set last_progress_at
+    count = connection.exec_driver_sql("""
+        UPDATE conductor_messages
+        SET body = message_text, last_progress_at = sent_at, completed_at = sent_at
+        WHERE last_progress_at IS NULL
+    """).rowcount
+    print(f"  {'conductor_messages':<24} {count:>10,} broadcast(s) marked sent")
+
+
+def upgrade(connection, default_id):
+    upgrade_broadcasts(connection)
+    for table in TENANT_TABLES:
+        connection.exec_driver_sql(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS tenant_id integer REFERENCES tenants (id)"
+        )
+        count = connection.execute(
+            text(f"UPDATE {table} SET tenant_id = :tenant_id WHERE tenant_id IS NULL"), {'tenant_id': default_id}
+        ).rowcount
+        connection.exec_driver_sql(f"ALTER TABLE {table} ALTER COLUMN tenant_id SET NOT NULL")
+        print(f"  {table:<24} {count:>10,} row(s) assigned to the default tenant")
+    connection.exec_driver_sql("ALTER TABLE conductors ADD COLUMN IF NOT EXISTS tenant_id integer REFERENCES tenants (id)")
+    connection.exec_driver_sql(
+        "ALTER TABLE scheduled_broadcasts ADD COLUMN IF NOT EXISTS conductor_message_id integer "
+        "REFERENCES conductor_messages (id)"
+    )
+
+    # Opt-outs apply to one tenant, other suppressions to every tenant (NULL)
+    connection.exec_driver_sql(
+        "ALTER TABLE suppressed_numbers ADD COLUMN IF NOT EXISTS tenant_id integer REFERENCES tenants (id)"
+    )
+    count = connection.execute(
+        text("UPDATE suppressed_numbers SET tenant_id = :tenant_id WHERE reason = 'opt_out' AND tenant_id IS NULL"),
+        {'tenant_id': default_id}
+    ).rowcount
+    print(f"  {'suppressed_numbers':<24} {count:>10,} opt-out(s) assigned to the default tenant")
+
+    for index in OLD_INDEXES:
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {index}")
+    for table, constraint in OLD_CONSTRAINTS.items():
+        connection.exec_driver_sql(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint}")
+
+    for name in TENANT_TABLES + ['suppressed_numbers']:
+        table = db.metadata.tables[name]
+        for constraint in table.constraints:
+            if constraint.name and constraint.name.startswith('uq_') and not _constraint_exists(connection, constraint.name):
+                connection.execute(AddConstraint(constraint))
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def run_upgrade():
+    """create_all() plus upgrade(), in the current app context"""
+    # Only creates missing tables; existing ones are altered by upgrade()
+    db.create_all()
+    default = tenant_directory.default()
+    print(f"🏢 Upgrading to tenants (default: {default.slug})")
+    with db.engine.begin() as connection:
+        upgrade(connection, default.id)
+
+
+def partition(connection):
+    for model in PARTITIONED_MODELS:
+        table = model.__table__
+        name = table.name
+        if _is_partitioned(connection, name):
+            print(f"  {name} is already partitioned")
+            continue
+
+        sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {'table': name}).scalar()
+        # Keep the id sequence (and so the ids) when the old table is dropped
+        connection.exec_driver_sql(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+        connection.exec_driver_sql(f"ALTER TABLE {name} RENAME TO {name}_unpartitioned")
+        connection.exec_driver_sql(
+            f"CREATE TABLE {name} (LIKE {name}_unpartitioned INCLUDING DEFAULTS) PARTITION BY LIST (tenant_id)"
+        )
+        connection.exec_driver_sql(f"CREATE TABLE {name}_default PARTITION OF {name} DEFAULT")
+        count = connection.exec_driver_sql(f"INSERT INTO {name} SELECT * FROM {name}_unpartitioned").rowcount
+        connection.exec_driver_sql(f"DROP TABLE {name}_unpartitioned")
+        connection.exec_driver_sql(f"ALTER SEQUENCE {sequence} OWNED BY {name}.id")
+
+        # Unique keys of a partitioned table must include the partition key
+        connection.exec_driver_sql(f"ALTER TABLE {name} ADD PRIMARY KEY (id, tenant_id)")
+        for constraint in table.foreign_key_constraints:
+            connection.execute(AddConstraint(constraint))
+        for index in table.indexes:
+            index.create(connection)
+        print(f"  {name:<24} {count:>10,} row(s) moved into {name}_default")
+
+
+def split(connection, tenant):
+    for model in PARTITIONED_MODELS:
+        name = model.__table__.name
+        if not _is_partitioned(connection, name):
+            sys.exit(f"❌ {name} is not partitioned yet, run: python tenant_tables.py partition")
+
+        part = f"{name}_t{tenant.id}"
+        if connection.execute(text("SELECT to_regclass(:part)"), {'part': part}).scalar() is not None:
+            print(f"  {part} already exists")
+            continue
+
+        connection.exec_driver_sql(f"CREATE TABLE {part} (LIKE {name} INCLUDING DEFAULTS)")
+        count = connection.execute(text(f"""
+            WITH moved AS (DELETE FROM {name}_default WHERE tenant_id = :tenant_id RETURNING *)
+            INSERT INTO {part} SELECT * FROM moved
+        """), {'tenant_id': tenant.id}).rowcount
+        connection.exec_driver_sql(f"ALTER TABLE {name} ATTACH PARTITION {part} FOR VALUES IN ({int(tenant.id)})")
+        print(f"  {part:<24} {count:>10,} row(s) of {tenant.slug}")
+
+
+def status(connection):
+    for model in PARTITIONED_MODELS:
+        name = model.__table__.name
+        if not _is_partitioned(connection, name):
+            print(f"{name}: not partitioned")
+            continue
+        print(f"{name}:")
+        rows = connection.execute(text("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(:table)
+            ORDER BY c.relname
+        """), {'table': name})
+        for part, bound, rows_estimate in rows:
+            print(f"  {part:<32} {bound:<24} ~{max(rows_estimate, 0):,} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('action', choices=['upgrade', 'partition', 'split', 'status'])
+    parser.add_argument('slug', nargs='?')
+    args = parser.parse_args()
+    if args.action == 'split' and not args.slug:
+        parser.error('slug is required')
+
+    app = create_app()
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            sys.exit("❌ tenant_tables.py needs PostgreSQL (on SQLite, recreate the database with init_db.py)")
+
+        if args.action == 'upgrade':
+            run_upgrade()
+
+        elif args.action == 'partition':
+            print("🏢 Partitioning by tenant")
+            with db.engine.begin() as connection:
+                partition(connection)
+
+        elif args.action == 'split':
+            tenant = tenant_directory.by_slug(args.slug)
+            if tenant is None:
+                sys.exit(f"❌ No tenant named {args.slug}")
+            print(f"🏢 Moving {tenant.slug} into its own partitions")
+            with db.engine.begin() as connection:
+                split(connection, tenant)
+
+        else:
+            with db.engine.connect() as connection:
+                status(connection)
+            return
+
+    print("✅ Done")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Capture inbound /sms/callback traffic for replay
+
+Opt-in with TRAFFIC_CAPTURE_ENABLED=true. Each inbound callback is
+appended to a rotating JSONL file as
+
+    {"ts": 1732089600.123, "path": "/sms/callback", "data": {"from": ..., "text": ...}}
+
+Only the AfricasTalking callback fields are kept, and phone numbers are
+replaced by stable pseudonyms (same real number -> same fake number), so
+captures keep per-rider behaviour without holding real numbers. The
+pseudonyms use +999, a country code ITU keeps unassigned, so a reply to
+a replayed message can never reach a real phone.
+Writes happen on a background listener thread, like the rest of logging.
+Every process writes (and rotates) its own file, named after
+TRAFFIC_CAPTURE_PATH with the pid added (sms_callbacks.1234.jsonl), since
+gunicorn workers rotating one shared file would overwrite each other.
+
+Replay captures with replay_traffic.py.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import request
+
+CAPTURED_FIELDS = ('from', 'to', 'text', 'date', 'id', 'linkId')
+
+# Unassigned country code, still accepted by phone_numbers.normalize()
+PSEUDONYM_PREFIX = '+999'
+
+_listener = None
+_file_settings = None  # (path, max_bytes, backups) to reopen after a fork
+
+
+def pseudonymize_phone(phone, key):
+    """Replace a phone number with a stable fake number in the unassigned +999 range"""
+    digest = hmac.new(key, phone.encode(), hashlib.sha256).digest()
+    return PSEUDONYM_PREFIX + str(int.from_bytes(digest[:8], 'big') % 10 ** 9).zfill(9)
+
+
+def sanitize(values, key):
+    """Keep only callback fields and pseudonymize the sender"""
+    data = {field: values[field] for field in CAPTURED_FIELDS if field in values}
+    if data.get('from'):
+        data['from'] = pseudonymize_phone(data['from'], key)
+    return data
+
+
+def _file_handler(path, max_bytes, backups):
+    """Rotating handler for this process's own capture file"""
+    root, ext = os.path.splitext(path)
+    handler = RotatingFileHandler(f'{root}.{os.getpid()}{ext}', maxBytes=max_bytes,
+                                  backupCount=backups, delay=True)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    return handler
+
+
+def _restart_after_fork():
+    """Give each forked worker its own queue, capture file and writer thread (see logging_config)"""
+    global _listener
+    if _listener is None:
+        return
+
+    capture_queue = queue.SimpleQueue()
+    for handler in logging.getLogger('traffic_capture').handlers:
+        handler.queue = capture_queue
+
+    _listener = QueueListener(capture_queue, _file_handler(*_file_settings))
+    _listener.start()
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def init_app(app):
+    """Start capturing inbound callbacks if TRAFFIC_CAPTURE_ENABLED is set"""
+    global _listener, _file_settings
+
+    if not app.config.get('TRAFFIC_CAPTURE_ENABLED'):
+        return
+
+    path = app.config.get('TRAFFIC_CAPTURE_PATH', 'captures/sms_callbacks.jsonl')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    _file_settings = (
+        path,
+        app.config.get('TRAFFIC_CAPTURE_MAX_BYTES', 50 * 1024 * 1024),
+        app.config.get('TRAFFIC_CAPTURE_BACKUPS', 10)
+    )
+
+    capture_queue = queue.SimpleQueue()
+    capture_logger = logging.getLogger('traffic_capture')
+    capture_logger.handlers = [QueueHandler(capture_queue)]
+    capture_logger.setLevel(logging.INFO)
+    capture_logger.propagate = False
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = QueueListener(capture_queue, _file_handler(*_file_settings))
+    _listener.start()
+
+    key = app.config['SECRET_KEY'].encode()
+
+    @app.before_request
+    def capture_callback():
+        if request.method == 'POST' and request.endpoint == 'sms.sms_callback':
+            capture_logger.info(json.dumps({
+                'ts': time.time(),
+                'path': request.path,
+                'data': sanitize(request.values, key)
+            }, ensure_ascii=False))
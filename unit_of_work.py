@@ -0,0 +1,97 @@
+"""Unit of work for inbound SMS processing
+
+Everything one inbound message changes (the incoming log, passenger state,
+responses, outgoing logs) is committed once, when the unit of work ends.
+Side effects that must only happen if that commit succeeds, such as
+sending the reply, are registered with after_commit() and run afterwards.
+
+    with UnitOfWork() as uow:
+        ...                # no commits in here
+        uow.after_commit(send_reply)
+
+Code that commits on its own (SMSService.send_sms, log_incoming_sms) checks
+current() and defers to the active unit of work instead.
+
+Log and response rows are added with uow.add(). With the write buffer
+enabled (see write_buffer.py) they are group-committed with other
+requests' rows right after the transaction commits, and after_commit
+actions wait until they are durable. If that write fails or times out the
+error is logged and the after_commit actions still run: the message's
+state change is already committed, so failing the request would only make
+the provider retry it.
+"""
+
+import logging
+from flask import g, has_app_context
+from models import db
+import write_buffer
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork:
+    """Single transaction for one inbound message"""
+
+    def __init__(self):
+        self._after_commit = []
+        self._buffered = []
+        self.rolled_back = False
+
+    def add(self, model, **values):
+        """
+        Add an insert-only row (a log or response) to this unit of work
+
+        Returns the model instance, or a write_buffer.BufferedRow when the
+        write buffer is enabled; either way .id is set once committed.
+        """
+        if write_buffer.get_buffer() is not None:
+            row = write_buffer.BufferedRow(model, values)
+            self._buffered.append(row)
+            return row
+        instance = model(**values)
+        db.session.add(instance)
+        return instance
+
+    def after_commit(self, callback):
+        """Run callback once the transaction has committed"""
+        self._after_commit.append(callback)
+
+    def rollback(self):
+        """Discard everything done in this unit of work when it ends"""
+        self.rolled_back = True
+
+    def __enter__(self):
+        if current() is not None:
+            raise RuntimeError("A unit of work is already active")
+        g.unit_of_work = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        g.pop('unit_of_work', None)
+
+        if exc_type is not None or self.rolled_back:
+            db.session.rollback()
+            self._after_commit.clear()
+            self._buffered.clear()
+            self.rolled_back = True
+            return False
+
+        db.session.commit()
+        if self._buffered:
+            try:
+                write_buffer.get_buffer().submit(self._buffered)
+            except Exception as e:
+                logger.error("❌ %d buffered log/response row(s) not confirmed: %s",
+                             len(self._buffered), e, exc_info=True)
+
+        for callback in self._after_commit:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("❌ After-commit action failed: %s", e, exc_info=True)
+        return False
+
+
+def current():
+    """The active unit of work, or None"""
+    return g.get('unit_of_work') if has_app_context() else None
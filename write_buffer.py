@@ -0,0 +1,185 @@
+"""Group-commit write buffer for inbound log and response rows
+
+Opt-in with WRITE_BUFFER_ENABLED=true. Requests hand their sms_logs and
+passenger_responses rows to a per-worker flusher thread. The flusher
+collects rows from concurrent requests for up to WRITE_BUFFER_MAX_DELAY_MS
+or WRITE_BUFFER_MAX_ROWS, whichever comes first, and writes them with one
+multi-row INSERT per table and a single COMMIT.
+
+Each request waits until the batch holding its rows has committed, so a
+callback is only acknowledged once its rows are durable. If a batch fails,
+its submissions are retried one by one, so a bad row only affects its own
+request. A request whose rows fail or time out logs the error but is still
+acknowledged and still replies, because its passenger state was committed
+before the rows were handed over (see unit_of_work.py).
+
+Rows go through the active UnitOfWork (see unit_of_work.py), which uses
+the buffer when it is enabled and the request session otherwise.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from flask import current_app
+from sqlalchemy import insert
+from models import db
+from metrics import WRITE_BUFFER_BATCH_ROWS, WRITE_BUFFER_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BufferedRow:
+    """A row waiting to be written; id is set once it is flushed"""
+    __slots__ = ('model', 'values', 'id')
+
+    def __init__(self, model, values):
+        self.model = model
+        self.values = values
+        self.id = None
+
+
+class Submission:
+    """Rows from one request, acknowledged when their batch commits"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, error=None):
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout):
+        """Block until the rows are committed; raise if the write failed"""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Write buffer did not flush within {timeout}s")
+        if self.error is not None:
+            raise self.error
+
+
+class GroupCommitBuffer:
+    """Per-worker buffer flushed by a background thread"""
+
+    def __init__(self, app, max_rows=500, max_delay=0.005, timeout=5.0):
+        self.app = app
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, rows):
+        """Queue rows for the next flush and wait until they are committed"""
+        self._ensure_started()
+        submission = Submission(rows)
+        self._queue.put(submission)
+        submission.wait(self.timeout)
+
+    def _ensure_started(self):
+        # Started on first use, so it runs in the worker and not the preloading master
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='write-buffer', daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        """Flush what is queued and stop the flusher thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(self.timeout)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+
+            batch = [first]
+            rows = len(first.rows)
+            deadline = time.monotonic() + self.max_delay
+            stopping = False
+
+            while rows < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    submission = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if submission is _STOP:
+                    stopping = True
+                    break
+                batch.append(submission)
+                rows += len(submission.rows)
+
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            start = time.perf_counter()
+            try:
+                self._write([row for submission in batch for row in submission.rows])
+            except Exception as e:
+                db.session.rollback()
+                if len(batch) == 1:
+                    batch[0].finish(e)
+                    return
+                logger.warning("Write buffer batch of %d failed, retrying individually: %s", len(batch), e)
+                for submission in batch:
+                    try:
+                        self._write(submission.rows)
+                        submission.finish()
+                    except Exception as e:
+                        db.session.rollback()
+                        submission.finish(e)
+                return
+
+            WRITE_BUFFER_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            WRITE_BUFFER_BATCH_ROWS.observe(sum(len(submission.rows) for submission in batch))
+            for submission in batch:
+                submission.finish()
+
+    def _write(self, rows):
+        by_model = {}
+        for row in rows:
+            by_model.setdefault(row.model, []).append(row)
+
+        for model, group in by_model.items():
+            result = db.session.execute(
+                insert(model).returning(model.id, sort_by_parameter_order=True),
+                [row.values for row in group]
+            )
+            for row, row_id in zip(group, result.scalars()):
+                row.id = row_id
+
+        db.session.commit()
+
+
+def get_buffer():
+    """The current app's write buffer, or None if it is disabled"""
+    return current_app.extensions.get('write_buffer')
+
+
+def init_app(app):
+    """Create the write buffer if WRITE_BUFFER_ENABLED is set"""
+    if not app.config.get('WRITE_BUFFER_ENABLED'):
+        return
+
+    buffer = GroupCommitBuffer(
+        app,
+        max_rows=app.config.get('WRITE_BUFFER_MAX_ROWS', 500),
+        max_delay=app.config.get('WRITE_BUFFER_MAX_DELAY_MS', 5) / 1000,
+        timeout=app.config.get('WRITE_BUFFER_TIMEOUT', 5)
+    )
+    app.extensions['write_buffer'] = buffer
+    atexit.register(buffer.stop)